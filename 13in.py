@@ -1,210 +1,283 @@
+import time
+PROCESS_START = time.perf_counter()
+
 from flask import Flask, render_template, request, jsonify, send_file
 import os
-from PIL import Image, ImageEnhance, ImageDraw, ImageFont
 from werkzeug.utils import secure_filename
 from datetime import datetime
+from memory_governor import MemoryGovernor, JobRejected, QueueFull, ImageTooLarge
+from playlist_scheduler import PlaylistScheduler, PlaylistError, PlaylistNotFound
+from batch_ingest import (BatchIngest, thumbnail_cache_path, preview_cache_path, frame_cache_path, is_fresh,
+                          write_atomic)
+import frame_pipeline
+from frame_store import FrameStore, valid_device_name, frame_etag
+from change_notifier import ChangeNotifier
+from device_registry import DeviceRegistry, DeviceError, DeviceNotFound, DeviceUnreachable
+from video_wall import (WallRegistry, WallError, WallNotFound, validate_wall, wall_devices, plan_wall,
+                        render_tiles, push_tiles)
+from frame_buffer import FrameBuffer, FrameFormatError
+from panel_power import PanelPowerManager
+from panel_link import PanelLinks, LinkError, FrameRejected
+from request_profiler import RequestProfiler
+from url_sources import UrlSources, UrlSourceError, UrlSourceNotFound, IMAGE_FORMATS as SOURCE_IMAGE_FORMATS
+from sign_templates import SignTemplates, SignError, SignNotFound
+import uuid
+import zipfile
 import sys
 import io
 import json
-import requests
+import contextlib
+import signal
+import threading
 
-# Add the library path for Waveshare e-paper (dynamic path)
-sys.path.append(os.path.expanduser('~/e-Paper/RaspberryPi_JetsonNano/python/lib'))
+# Library path for Waveshare e-paper, added only when the real driver is loaded
+WAVESHARE_LIB_DIR = os.path.expanduser('~/e-Paper/RaspberryPi_JetsonNano/python/lib')
 
 # Display Configuration - 13.3" Spectra 6
 DISPLAY_WIDTH = 1600
 DISPLAY_HEIGHT = 1200
 BINARY_SIZE = DISPLAY_WIDTH * DISPLAY_HEIGHT // 2  # 960,000 bytes
+PANEL_MODEL = 'epd13in3f'
+# Large JPEG sources are decoded at reduced scale, but never below this size
+PRESCALE_LIMIT = (3200, 2400)
+# This app's own panel, in the same shape as a registered device profile
+PANEL_PROFILE = {'width': DISPLAY_WIDTH, 'height': DISPLAY_HEIGHT, 'orientation': 0}
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = os.path.expanduser('~/eink_display/uploads')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'bmp', 'gif'}
+# Display driver: 'waveshare' for the real panel, 'emulator' to run without hardware
+app.config['EPD_DRIVER'] = os.environ.get('EINK_EPD_DRIVER', 'waveshare')
+# Seconds the panel stays initialized after a refresh before it is put to sleep (0 = sleep every time)
+app.config['PANEL_IDLE_TIMEOUT'] = float(os.environ.get('EINK_PANEL_IDLE_TIMEOUT', 60))
+# Preload fonts, palette tables and the safety background before serving
+app.config['WARMUP'] = os.environ.get('EINK_WARMUP', '1') != '0'
+# Memory budget for concurrent image jobs, measured in decoded pixels rather than upload size
+app.config['MEMORY_BUDGET_MB'] = int(os.environ.get('EINK_MEMORY_BUDGET_MB', 384))
+app.config['JOB_QUEUE_LIMIT'] = int(os.environ.get('EINK_JOB_QUEUE_LIMIT', 4))
+app.config['MAX_IMAGE_PIXELS'] = int(os.environ.get('EINK_MAX_IMAGE_PIXELS', 50000000))
+app.config['JOB_RETRY_AFTER'] = int(os.environ.get('EINK_JOB_RETRY_AFTER', 10))
+# Shortest playlist dwell time; anything faster than a panel refresh is pointless
+app.config['PLAYLIST_MIN_DWELL'] = int(os.environ.get('EINK_PLAYLIST_MIN_DWELL', 30))
+# Decoded, geometry-normalized base frames kept so setting changes skip decode and resize
+app.config['BASE_CACHE_MB'] = int(os.environ.get('EINK_BASE_CACHE_MB', 128))
+# Bulk ingest: worker processes, request size and file count limits
+app.config['BATCH_WORKERS'] = int(os.environ.get('EINK_BATCH_WORKERS', os.cpu_count() or 1))
+app.config['BATCH_MAX_CONTENT_LENGTH'] = int(os.environ.get('EINK_BATCH_MAX_MB', 512)) * 1024 * 1024
+app.config['BATCH_MAX_FILES'] = int(os.environ.get('EINK_BATCH_MAX_FILES', 500))
+# Share of the memory budget bulk ingest may hold, leaving the rest to interactive jobs
+app.config['BATCH_MEMORY_SHARE'] = float(os.environ.get('EINK_BATCH_MEMORY_SHARE', 0.5))
+# How long pull-mode devices should sleep between checks when nothing is scheduled
+app.config['PULL_CHECK_INTERVAL'] = int(os.environ.get('EINK_PULL_CHECK_INTERVAL', 900))
+# Port for frame change subscriptions (SSE / long-poll), 0 to disable
+app.config['NOTIFY_PORT'] = int(os.environ.get('EINK_NOTIFY_PORT', 5001))
+# Remote device health probes, and how long a send waits to connect before giving up
+app.config['DEVICE_PROBE_INTERVAL'] = int(os.environ.get('EINK_DEVICE_PROBE_INTERVAL', 60))
+app.config['DEVICE_PROBE_TIMEOUT'] = float(os.environ.get('EINK_DEVICE_PROBE_TIMEOUT', 2))
+app.config['REMOTE_CONNECT_TIMEOUT'] = float(os.environ.get('EINK_REMOTE_CONNECT_TIMEOUT', 5))
+# How long a remote display may take to refresh, and to acknowledge chunks sent over a frame link
+app.config['REMOTE_REFRESH_TIMEOUT'] = float(os.environ.get('EINK_REMOTE_REFRESH_TIMEOUT', 120))
+app.config['LINK_ACK_TIMEOUT'] = float(os.environ.get('EINK_LINK_ACK_TIMEOUT', 10))
+# Per-request CPU profiling (X-Profile header and /profiles), and the fraction of requests sampled
+app.config['PROFILING'] = os.environ.get('EINK_PROFILING', '0') != '0'
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('EINK_PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_INTERVAL_MS'] = float(os.environ.get('EINK_PROFILE_INTERVAL_MS', 5))
+# URL sources: shortest poll interval, and how long a fetch may take to send its response
+app.config['URL_MIN_INTERVAL'] = int(os.environ.get('EINK_URL_MIN_INTERVAL', 30))
+app.config['URL_FETCH_TIMEOUT'] = float(os.environ.get('EINK_URL_FETCH_TIMEOUT', 30))
+
+# Startup phase durations, reported by /health
+STARTUP_TIMINGS = {}
+
+governor = MemoryGovernor(app.config['MEMORY_BUDGET_MB'] * 1024 * 1024,
+                          max_queue=app.config['JOB_QUEUE_LIMIT'],
+                          max_pixels=app.config['MAX_IMAGE_PIXELS'],
+                          retry_after=app.config['JOB_RETRY_AFTER'],
+                          background_share=app.config['BATCH_MEMORY_SHARE'])
+
+base_cache = frame_pipeline.BaseFrameCache(app.config['BASE_CACHE_MB'] * 1024 * 1024)
+
+profiler = RequestProfiler(enabled=app.config['PROFILING'], sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+                           interval=app.config['PROFILE_INTERVAL_MS'] / 1000)
+app.wsgi_app = profiler.wrap(app.wsgi_app)
 
 # Create upload folder if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Safety Tracker Configuration
 SAFETY_DATA_FILE = os.path.expanduser('~/eink_display/safety_data.json')
-SAFETY_BACKGROUND = os.path.expanduser('~/eink_display/static/safety_background.png')
 SAFETY_OUTPUT = os.path.expanduser('~/eink_display/static/current_safety_sign.png')
 
+# Sign backgrounds, such as safety_background.png
+STATIC_DIR = os.path.expanduser('~/eink_display/static')
+
+# Playlist definitions and positions, kept across restarts
+PLAYLIST_FILE = os.path.expanduser('~/eink_display/playlists.json')
+
+# Registered remote displays and their panel profiles
+DEVICES_FILE = os.path.expanduser('~/eink_display/devices.json')
+
+# Video walls: grids of registered devices showing one picture
+WALLS_FILE = os.path.expanduser('~/eink_display/walls.json')
+
+# Images polled from URLs, and the last fetched copy of each
+SOURCES_FILE = os.path.expanduser('~/eink_display/url_sources.json')
+SOURCES_DIR = os.path.expanduser('~/eink_display/sources')
+
+# Cached thumbnails, previews and packed frames
+CACHE_DIR = os.path.expanduser('~/eink_display/cache')
+
+# Responses at versioned URLs (?v=) never change, so browsers may keep them for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Thumbnails per contact sheet served to the gallery
+THUMBNAIL_SHEET_SIZE = 50
+
 # Create static folder
 os.makedirs(os.path.expanduser('~/eink_display/static'), exist_ok=True)
 
-# Safety tracker font sizes and positions
-FONT_SIZE_DAYS = 400
-FONT_SIZE_PRIOR_COUNT = 150
-FONT_SIZE_INCIDENT = 100
-FONT_SIZE_CHECKMARK = 80
-DAYS_Y_POSITION = 160
-DAYS_X_OFFSET = 0
-PRIOR_COUNT_X = 220
-PRIOR_COUNT_Y = 630
-INCIDENT_X_OFFSET = 70
-INCIDENT_Y = 650
-CHECKMARK_X = 940
-CHECKMARK_CHANGE_Y = 575
-CHECKMARK_DEPLOY_Y = 645
-CHECKMARK_MISSED_Y = 705
+# Sign templates (the safety sign is one); user templates override the bundled ones
+SIGNS_DIR = os.path.expanduser('~/eink_display/signs')
+DEFAULT_SIGNS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'signs')
+# Font for sign fields that do not name one
+FONT_PATH = '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'
+
+def get_epd():
+    """Create a display driver instance for the configured EPD_DRIVER"""
+    if app.config['EPD_DRIVER'] == 'emulator':
+        import epd_emulator
+        return epd_emulator.EPD(PANEL_MODEL)
+
+    # Import only when needed to avoid GPIO conflicts
+    if WAVESHARE_LIB_DIR not in sys.path:
+        sys.path.append(WAVESHARE_LIB_DIR)
+    from waveshare_epd import epd13in3f
+    return epd13in3f.EPD()
+
+# Owns the one driver instance and keeps the panel initialized across bursts of refreshes
+panel_power = PanelPowerManager(get_epd, idle_timeout=app.config['PANEL_IDLE_TIMEOUT'])
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def rgb_to_palette_code(r, g, b):
-    """Find closest color in 6-color palette"""
-    min_distance = float('inf')
-    closest_code = 0x1
-    
-    PALETTE = {
-        'black': (0, 0, 0, 0x0),
-        'white': (255, 255, 255, 0x1),
-        'yellow': (255, 255, 0, 0x2),
-        'red': (200, 80, 50, 0x3),
-        'blue': (100, 120, 180, 0x5),
-        'green': (200, 200, 80, 0x6)
-    }
-    
-    for color_name, (pr, pg, pb, code) in PALETTE.items():
-        distance = (r - pr)**2 + (g - pg)**2 + (b - pb)**2
-        if distance < min_distance:
-            min_distance = distance
-            closest_code = code
-    
-    return closest_code
+def image_version(filepath):
+    """Token that changes whenever an uploaded image is replaced, for versioned URLs (?v=)"""
+    stat = os.stat(filepath)
+    return f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
 
-def convert_to_binary(img):
-    """Convert PIL Image to binary format for remote E-Paper display"""
-    if img.mode != 'RGB':
-        img = img.convert('RGB')
-    
-    img_ratio = img.width / img.height
-    display_ratio = DISPLAY_WIDTH / DISPLAY_HEIGHT
-    
-    if img_ratio > display_ratio:
-        new_height = DISPLAY_HEIGHT
-        new_width = int(DISPLAY_HEIGHT * img_ratio)
+def cache_for_request(response, version=None):
+    """Let browsers keep a response for good if its URL names the current version, else revalidate"""
+    if version is not None and request.args.get('v') == version:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
     else:
-        new_width = DISPLAY_WIDTH
-        new_height = int(DISPLAY_WIDTH / img_ratio)
-    
-    img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-    left = (new_width - DISPLAY_WIDTH) // 2
-    top = (new_height - DISPLAY_HEIGHT) // 2
-    img = img.crop((left, top, left + DISPLAY_WIDTH, top + DISPLAY_HEIGHT))
-    
-    # Use dithering with the 6-color palette
-    palette_data = [
-        0, 0, 0, 255, 255, 255, 255, 255, 0,
-        200, 80, 50, 100, 120, 180, 200, 200, 80
-    ]
-    palette_img = Image.new('P', (1, 1))
-    palette_img.putpalette(palette_data + [0] * (256 * 3 - len(palette_data)))
-    img = img.quantize(palette=palette_img, dither=Image.Dither.FLOYDSTEINBERG)
-    img = img.convert('RGB')
-    
-    binary_data = bytearray(BINARY_SIZE)
-    
-    for row in range(DISPLAY_HEIGHT):
-        for col in range(0, DISPLAY_WIDTH, 2):
-            r1, g1, b1 = img.getpixel((col, row))
-            r2, g2, b2 = img.getpixel((col + 1, row))
-            
-            code1 = rgb_to_palette_code(r1, g1, b1)
-            code2 = rgb_to_palette_code(r2, g2, b2)
-            
-            byte_index = row * (DISPLAY_WIDTH // 2) + col // 2
-            binary_data[byte_index] = (code1 << 4) | code2
-    
-    return bytes(binary_data)
+        response.cache_control.no_cache = True
+    return response
 
-def process_image(image_path, brightness=1.0, contrast=1.4, saturation=1.5, rotate_180=False):
-    """Process image to fit 1600x1200 display - crop to fill with enhancement"""
-    img = Image.open(image_path)
-    
-    if img.mode != 'RGB':
-        img = img.convert('RGB')
-    
-    # Auto-rotate portrait to landscape
-    if img.height > img.width:
-        img = img.rotate(90, expand=True)
-        print(f"Rotated portrait image to landscape")
-    
-    # Downscale very large images first
-    if img.width > 3200 or img.height > 2400:
-        img.thumbnail((3200, 2400), Image.Resampling.LANCZOS)
-        print(f"Pre-scaled large image to {img.width}x{img.height}")
-    
-    # Calculate crop-to-fill dimensions
-    img_ratio = img.width / img.height
-    display_ratio = DISPLAY_WIDTH / DISPLAY_HEIGHT
-    
-    if img_ratio > display_ratio:
-        new_height = DISPLAY_HEIGHT
-        new_width = int(DISPLAY_HEIGHT * img_ratio)
-    else:
-        new_width = DISPLAY_WIDTH
-        new_height = int(DISPLAY_WIDTH / img_ratio)
-    
-    img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-    left = (new_width - DISPLAY_WIDTH) // 2
-    top = (new_height - DISPLAY_HEIGHT) // 2
-    img = img.crop((left, top, left + DISPLAY_WIDTH, top + DISPLAY_HEIGHT))
-    
-    # Rotate 180 degrees if requested
-    if rotate_180:
-        img = img.rotate(180)
-        print(f"Rotated image 180 degrees")
-    
-    # Enhance image for E Ink display
-    print(f"Enhancing: brightness={brightness}, contrast={contrast}, saturation={saturation}")
-    
-    # Increase brightness
-    enhancer = ImageEnhance.Brightness(img)
-    img = enhancer.enhance(brightness)
-    
-    # Increase contrast
-    enhancer = ImageEnhance.Contrast(img)
-    img = enhancer.enhance(contrast)
+def send_image(path, mimetype, version=None):
+    """Serve an image file with a strong ETag, Last-Modified, Range support and cache headers"""
+    return cache_for_request(send_file(path, mimetype=mimetype, conditional=True, etag=True), version)
+
+def send_image_bytes(data, mimetype, version=None):
+    """Serve a rendered image with a content-hash ETag, Range support and cache headers"""
+    response = app.response_class(data, mimetype=mimetype)
+    response.set_etag(frame_etag(data))
+    cache_for_request(response, version)
+    return response.make_conditional(request, accept_ranges=True, complete_length=len(data))
+
+def image_job(image_path, size, max_source=None):
+    """Governor admission for processing an image, skipped when its base frame is already cached"""
+    if (image_path, size[0], size[1], max_source) in base_cache:
+        return contextlib.nullcontext()
+    return governor.image_job(image_path, size)
+
+def local_panel_profile():
+    """Profile of the local panel in the driver's native frame layout"""
+    size = (panel_power.width, panel_power.height)
+    if size == (DISPLAY_WIDTH, DISPLAY_HEIGHT):
+        return PANEL_PROFILE
+    if size == (DISPLAY_HEIGHT, DISPLAY_WIDTH):
+        # Panel scans out in portrait: turn the landscape picture like getbuffer() did
+        return {'width': size[0], 'height': size[1], 'orientation': 90}
+    raise RuntimeError(f'Unexpected panel size {size[0]}x{size[1]}')
+
+def render_frame(image_path, brightness=1.0, contrast=1.4, saturation=1.5, rotate_180=False, panel='local'):
+    """Process an image and pack it for the local panel or a remote display.
     
-    # Increase color saturation
-    enhancer = ImageEnhance.Color(img)
-    img = enhancer.enhance(saturation)
+    Both go through the same cached packed-frame pipeline and palette, so the local
+    panel no longer needs the driver's getbuffer() conversion.
+    """
+    params = {'brightness': brightness, 'contrast': contrast, 'saturation': saturation, 'rotate_180': rotate_180}
+    profile = local_panel_profile() if panel == 'local' else PANEL_PROFILE
+    return render_packed_frame(profile, image_path, params)
+
+def display_frame(frame):
+    """Show a packed frame; the panel is only initialized if it had gone to sleep"""
+    print("Sending to display...")
+    panel_power.display(frame)
     
-    return img
+    print("Display complete!")
+    record_first_frame()
 
 def display_image(image_path, brightness=1.0, contrast=1.4, saturation=1.5, rotate_180=False):
-    """Send image to 13.3" e-paper display using Waveshare's built-in conversion"""
+    """Send image to 13.3" e-paper display as a cached packed frame"""
     try:
-        # Import only when needed to avoid GPIO conflicts
-        from waveshare_epd import epd13in3f
-        
-        print("Initializing display...")
-        epd = epd13in3f.EPD()
-        epd.init()
-        
         print("Processing image...")
-        img = process_image(image_path, brightness, contrast, saturation, rotate_180)
-        
-        print("Converting and sending to display...")
-        # Use Waveshare's getbuffer method for color conversion
-        epd.display(epd.getbuffer(img))
-        
-        print("Putting display to sleep...")
-        epd.sleep()
-        
-        print("Display complete!")
+        frame = render_frame(image_path, brightness, contrast, saturation, rotate_180)
+        display_frame(frame)
         return True
+    except JobRejected:
+        raise
     except Exception as e:
         print(f"Error displaying image: {e}")
         import traceback
         traceback.print_exc()
         return False
 
+def record_first_frame():
+    """Record the cold start to first frame time once per process"""
+    if 'first_frame' not in STARTUP_TIMINGS:
+        STARTUP_TIMINGS['first_frame'] = time.perf_counter() - PROCESS_START
+        print(f"Cold start to first frame: {STARTUP_TIMINGS['first_frame']:.2f}s")
+
+def warm_up():
+    """Preload palette tables and compile sign templates with their fonts and backgrounds"""
+    start = time.perf_counter()
+    frame_pipeline.get_palette_image()
+    frame_pipeline.get_palette_lookup()
+    frame_pipeline.get_index_codes()
+    warm_up_signs()
+    STARTUP_TIMINGS['warmup'] = time.perf_counter() - start
+    print(f"Warm-up complete in {STARTUP_TIMINGS['warmup']:.2f}s")
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/health')
+def health():
+    """Readiness probe with startup phase timings"""
+    ready = 'ready' in STARTUP_TIMINGS
+    return jsonify({'ready': ready, 'startup': STARTUP_TIMINGS, 'memory': governor.stats(),
+                    'base_cache': base_cache.stats(),
+                    'panel': panel_power.stats(),
+                    'notifications': notifier.stats(),
+                    'profiling': profiler.stats()}), 200 if ready else 503
+
+@app.errorhandler(QueueFull)
+def handle_queue_full(e):
+    """Ask clients to back off while the image job queue is full"""
+    response = jsonify({'error': str(e)})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+@app.errorhandler(ImageTooLarge)
+def handle_image_too_large(e):
+    """Reject decompression-bomb sized images before decoding them"""
+    return jsonify({'error': str(e)}), 413
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'file' not in request.files:
@@ -224,15 +297,31 @@ def upload_file():
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        # Kept out of the gallery (and off any existing upload of that name) until it is admitted and rendered
+        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f'.{filename}.{uuid.uuid4().hex[:12]}.part')
+        file.save(temp_path)
         
-        # Display on e-paper with custom enhancements
-        success = display_image(filepath, brightness, contrast, saturation, rotate_180)
+        params = {'brightness': brightness, 'contrast': contrast, 'saturation': saturation, 'rotate_180': rotate_180}
+        try:
+            print("Processing image...")
+            frame = render_packed_frame(local_panel_profile(), temp_path, params, cache_name=filename)
+        except JobRejected:
+            os.remove(temp_path)
+            raise
+        except Exception as e:
+            os.remove(temp_path)
+            print(f"Error processing upload: {e}")
+            import traceback
+            traceback.print_exc()
+            return jsonify({'error': 'Failed to display image'}), 500
+        os.replace(temp_path, filepath)
         
-        if success:
-            return jsonify({'message': 'Image displayed successfully', 'filename': filename}), 200
-        else:
+        try:
+            display_frame(frame)
+        except Exception as e:
+            print(f"Error displaying image: {e}")
             return jsonify({'error': 'Failed to display image'}), 500
+        return jsonify({'message': 'Image displayed successfully', 'filename': filename}), 200
     
     return jsonify({'error': 'Invalid file type'}), 400
 
@@ -240,33 +329,51 @@ def upload_file():
 def clear_display():
     """Clear the e-paper display"""
     try:
-        # Import only when needed to avoid GPIO conflicts
-        from waveshare_epd import epd13in3f
-        
-        epd = epd13in3f.EPD()
-        epd.init()
-        epd.Clear()
-        epd.sleep()
+        panel_power.clear()
         return jsonify({'message': 'Display cleared'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def saved_images():
+    """Uploaded images, most recent first"""
+    files = []
+    for filename in os.listdir(app.config['UPLOAD_FOLDER']):
+        if allowed_file(filename):
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            files.append({
+                'filename': filename,
+                'size': os.path.getsize(filepath),
+                'modified': os.path.getmtime(filepath),
+                'version': image_version(filepath)
+            })
+    files.sort(key=lambda x: x['modified'], reverse=True)
+    return files
+
+def sheet_pages(files):
+    """Split the image list into contact sheet pages of (version, files)"""
+    pages = []
+    for start in range(0, len(files), THUMBNAIL_SHEET_SIZE):
+        page = files[start:start + THUMBNAIL_SHEET_SIZE]
+        members = '\n'.join(f"{f['filename']}:{f['version']}" for f in page)
+        pages.append((frame_etag(members.encode()), page))
+    return pages
+
 @app.route('/images', methods=['GET'])
 def list_images():
-    """Get list of uploaded images"""
+    """Get list of uploaded images, with where each thumbnail sits on a contact sheet"""
     try:
-        files = []
-        for filename in os.listdir(app.config['UPLOAD_FOLDER']):
-            if allowed_file(filename):
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                files.append({
-                    'filename': filename,
-                    'size': os.path.getsize(filepath),
-                    'modified': os.path.getmtime(filepath)
-                })
-        # Sort by most recent first
-        files.sort(key=lambda x: x['modified'], reverse=True)
-        return jsonify({'images': files}), 200
+        files = saved_images()
+        cell_width, cell_height = frame_pipeline.THUMBNAIL_SIZE
+        columns = frame_pipeline.SHEET_COLUMNS
+        urls = []
+        for page, (version, members) in enumerate(sheet_pages(files)):
+            urls.append(f'/thumbnails/sheet/{page}?v={version}')
+            for i, entry in enumerate(members):
+                entry['sheet'] = [page, i % columns * cell_width, i // columns * cell_height]
+        return jsonify({
+            'images': files,
+            'thumbnail_sheets': {'cell': [cell_width, cell_height], 'urls': urls}
+        }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -294,6 +401,8 @@ def display_saved_image(filename):
         else:
             return jsonify({'error': 'Failed to display image'}), 500
             
+    except JobRejected:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -312,6 +421,18 @@ def delete_image(filename):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Last rendered contact sheet per page, as (version, JPEG bytes)
+thumbnail_sheets = {}
+
+def cached_thumbnail(filepath):
+    """Path of the cached thumbnail of an image, creating it if missing or stale"""
+    thumbnail_path = thumbnail_cache_path(CACHE_DIR, os.path.basename(filepath))
+    if not is_fresh(thumbnail_path, filepath):
+        with governor.image_job(filepath, frame_pipeline.THUMBNAIL_SIZE):
+            thumbnail = frame_pipeline.make_thumbnail(filepath)
+        write_atomic(thumbnail_path, thumbnail)
+    return thumbnail_path
+
 @app.route('/thumbnail/<filename>')
 def get_thumbnail(filename):
     """Generate and serve a thumbnail of the image"""
@@ -321,31 +442,125 @@ def get_thumbnail(filename):
         if not os.path.exists(filepath):
             return jsonify({'error': 'Image not found'}), 404
         
-        # Create thumbnail
-        img = Image.open(filepath)
-        img.thumbnail((150, 90), Image.Resampling.LANCZOS)
+        return send_image(cached_thumbnail(filepath), 'image/jpeg', image_version(filepath))
+        
+    except JobRejected:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/thumbnails/sheet/<int:page>')
+def get_thumbnail_sheet(page):
+    """Serve the thumbnails of one page of /images as a single contact sheet JPEG"""
+    try:
+        pages = sheet_pages(saved_images())
+        if page >= len(pages):
+            return jsonify({'error': 'Sheet not found'}), 404
+        version, members = pages[page]
+        if request.args.get('v', version) != version:
+            # Cell positions from an older /images would point at the wrong thumbnails
+            return jsonify({'error': 'Image list changed, reload /images'}), 409
         
-        # Save to bytes
-        img_io = io.BytesIO()
-        img.save(img_io, 'JPEG', quality=85)
-        img_io.seek(0)
+        cached = thumbnail_sheets.get(page)
+        if cached is None or cached[0] != version:
+            paths = []
+            for entry in members:
+                filepath = os.path.join(app.config['UPLOAD_FOLDER'], entry['filename'])
+                try:
+                    paths.append(cached_thumbnail(filepath))
+                except JobRejected:
+                    raise
+                except Exception as e:
+                    print(f"No thumbnail for {entry['filename']}: {e}")
+                    paths.append(None)
+            cached = (version, frame_pipeline.make_contact_sheet(paths))
+            thumbnail_sheets[page] = cached
         
-        return send_file(img_io, mimetype='image/jpeg')
+        return send_image_bytes(cached[1], 'image/jpeg', version)
         
+    except JobRejected:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/preview/<filename>')
 def get_preview(filename):
-    """Serve the full image for preview"""
+    """Serve the image for preview at panel resolution, from a cached derivative of the original"""
+    try:
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
+        
+        if not os.path.exists(filepath):
+            return jsonify({'error': 'Image not found'}), 404
+        
+        preview_path = preview_cache_path(CACHE_DIR, os.path.basename(filepath), DISPLAY_WIDTH, DISPLAY_HEIGHT)
+        if not is_fresh(preview_path, filepath):
+            with governor.image_job(filepath, (DISPLAY_WIDTH, DISPLAY_HEIGHT)):
+                write_atomic(preview_path, frame_pipeline.make_preview(filepath, DISPLAY_WIDTH, DISPLAY_HEIGHT))
+        
+        return send_image(preview_path, 'image/jpeg', image_version(filepath))
+        
+    except JobRejected:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def image_params(values):
+    """Enhancement settings from request args or form values, with the display defaults"""
+    return {
+        'brightness': float(values.get('brightness', 1.0)),
+        'contrast': float(values.get('contrast', 1.4)),
+        'saturation': float(values.get('saturation', 1.5)),
+        'rotate_180': str(values.get('rotate_180', 'false')).lower() == 'true',
+    }
+
+def dithered_preview(image_path, params, profile=PANEL_PROFILE):
+    """Path of a PNG of the packed frame a panel will show, rendered from the shared frame cache"""
+    frame_path = frame_cache_path(CACHE_DIR, os.path.basename(image_path), profile['width'], profile['height'],
+                                  params, profile['orientation'])
+    preview_path = frame_path[:-len('.bin')] + '.png'
+    if not is_fresh(preview_path, image_path):
+        frame = render_packed_frame(profile, image_path, params)
+        write_atomic(preview_path, frame_pipeline.frame_to_png(frame, profile['width'], profile['height'],
+                                                               profile['orientation'], params['rotate_180']))
+    return preview_path
+
+@app.route('/preview/<filename>/dithered')
+def get_dithered_preview(filename):
+    """Serve the dithered six-color result for the given settings, as the panel will show it.
+    
+    With scale=N (e.g. 4) a 1/N resolution approximation is rendered instead, fast enough
+    to follow the sliders while they move.
+    """
     try:
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
         
         if not os.path.exists(filepath):
             return jsonify({'error': 'Image not found'}), 404
         
-        return send_file(filepath)
+        profile = devices.get(request.args['device']) if request.args.get('device') else PANEL_PROFILE
+        params = image_params(request.args)
+        scale = int(request.args.get('scale', 1))
+        if scale > 1:
+            # Upright canvas the viewer sees, so rotations are never applied to it
+            width, height = profile['width'], profile['height']
+            if profile['orientation'] in (90, 270):
+                width, height = height, width
+            with image_job(filepath, (max(width // scale, 2), max(height // scale, 2))):
+                png = frame_pipeline.low_res_preview(filepath, width, height, params['brightness'],
+                                                     params['contrast'], params['saturation'], scale,
+                                                     base_cache=base_cache)
+            response = app.response_class(png, mimetype='image/png')
+            response.cache_control.no_store = True
+            return response
         
+        # A device's profile can change under the same URL, so only panel previews are versioned
+        version = image_version(filepath) if not request.args.get('device') else None
+        return send_image(dithered_preview(filepath, params, profile), 'image/png', version)
+        
+    except (JobRejected, DeviceError):
+        raise
+    except ValueError as e:
+        return jsonify({'error': f'Invalid setting: {e}'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -371,8 +586,18 @@ def save_safety_data(data):
     with open(SAFETY_DATA_FILE, 'w') as f:
         json.dump(data, f, indent=2)
 
-def generate_safety_sign(auto_display=False):
-    """Generate the safety sign with current data"""
+sign_templates = SignTemplates([SIGNS_DIR, DEFAULT_SIGNS_DIR], [STATIC_DIR], FONT_PATH)
+
+def warm_up_signs():
+    """Compile every sign template, loading its fonts and decoding its background"""
+    for name in sign_templates.names():
+        try:
+            sign_templates.prepare(name)
+        except (OSError, SignError) as e:
+            print(f"Sign template '{name}' is not usable: {e}")
+
+def current_safety_data():
+    """Load safety data with the day counts worked out for today"""
     data = load_safety_data()
     
     # Calculate days since current incident date
@@ -393,75 +618,38 @@ def generate_safety_sign(auto_display=False):
     
     data['days_since'] = days_since
     data['prior_count'] = prior_count
-    
-    # Check if background exists
-    if not os.path.exists(SAFETY_BACKGROUND):
-        print(f"WARNING: Safety sign background not found at {SAFETY_BACKGROUND}")
+    return data
+
+def generate_safety_sign():
+    """Draw the safety sign preview image with current data"""
+    try:
+        img = sign_templates.draw('safety', current_safety_data())
+    except FileNotFoundError as e:
+        print(f"WARNING: {e}")
         print("Please upload a background image named 'safety_background.png' to the static folder")
         return False
     
-    # Open background image
-    img = Image.open(SAFETY_BACKGROUND)
-    draw = ImageDraw.Draw(img)
-    
-    img_width, img_height = img.size
-    
-    # Load fonts
-    try:
-        days_font = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', FONT_SIZE_DAYS)
-        count_font = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', FONT_SIZE_PRIOR_COUNT)
-        inc_font = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', FONT_SIZE_INCIDENT)
-        check_font = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', FONT_SIZE_CHECKMARK)
-    except:
-        days_font = ImageFont.load_default()
-        count_font = ImageFont.load_default()
-        inc_font = ImageFont.load_default()
-        check_font = ImageFont.load_default()
-    
-    # Draw main days count
-    days_text = str(data['days_since'])
-    days_bbox = draw.textbbox((0, 0), days_text, font=days_font)
-    days_width = days_bbox[2] - days_bbox[0]
-    days_x = (img_width - days_width) // 2 + DAYS_X_OFFSET
-    days_y = DAYS_Y_POSITION
-    draw.text((days_x, days_y), days_text, font=days_font, fill='black')
-    
-    # Draw prior count
-    prior_text = str(data['prior_count'])
-    prior_bbox = draw.textbbox((0, 0), prior_text, font=count_font)
-    prior_width = prior_bbox[2] - prior_bbox[0]
-    prior_x = PRIOR_COUNT_X - (prior_width // 2)
-    prior_y = PRIOR_COUNT_Y
-    draw.text((prior_x, prior_y), prior_text, font=count_font, fill='white')
-    
-    # Draw incident number
-    inc_text = data['incident_number']
-    inc_bbox = draw.textbbox((0, 0), inc_text, font=inc_font)
-    inc_width = inc_bbox[2] - inc_bbox[0]
-    inc_x = (img_width // 2) - (inc_width // 2) + INCIDENT_X_OFFSET
-    inc_y = INCIDENT_Y
-    draw.text((inc_x, inc_y), inc_text, font=inc_font, fill='white')
-    
-    # Draw checkmark
-    reason_positions = {
-        'Change': (CHECKMARK_X, CHECKMARK_CHANGE_Y),
-        'Deploy': (CHECKMARK_X, CHECKMARK_DEPLOY_Y),
-        'Missed': (CHECKMARK_X, CHECKMARK_MISSED_Y)
-    }
-    
-    if data['reason'] in reason_positions:
-        check_x, check_y = reason_positions[data['reason']]
-        draw.text((check_x, check_y), '✓', font=check_font, fill='blue')
-    
     # Save the generated image
     img.save(SAFETY_OUTPUT)
-    
-    # Auto display to e-paper if requested
-    if auto_display:
-        display_image(SAFETY_OUTPUT, brightness=1.0, contrast=1.4, saturation=1.5, rotate_180=True)
-    
     return True
 
+def safety_preview_is_current():
+    """True if the preview image was drawn today, after the last data change"""
+    if not os.path.exists(SAFETY_OUTPUT):
+        return False
+    drawn = os.path.getmtime(SAFETY_OUTPUT)
+    if datetime.fromtimestamp(drawn).date() != datetime.now().date():
+        return False
+    return not os.path.exists(SAFETY_DATA_FILE) or os.path.getmtime(SAFETY_DATA_FILE) <= drawn
+
+def safety_sign_frame(profile):
+    """Packed frame of the safety sign for a panel profile.
+    
+    The background is dithered once per profile; a daily update only re-renders
+    the fields that changed, so it costs milliseconds instead of a full frame.
+    """
+    return sign_templates.frame('safety', current_safety_data(), profile)
+
 # ============ SAFETY TRACKER ROUTES ============
 
 @app.route('/safety')
@@ -513,93 +701,304 @@ def update_safety():
 @app.route('/safety/display', methods=['POST'])
 def display_safety_sign():
     """Display the safety sign on e-paper"""
-    if not os.path.exists(SAFETY_OUTPUT):
-        generate_safety_sign()
-    
-    if display_image(SAFETY_OUTPUT, brightness=1.0, contrast=1.4, saturation=1.5, rotate_180=True):
-        return jsonify({'success': True, 'message': 'Safety sign displayed'}), 200
-    else:
+    try:
+        display_frame(safety_sign_frame(local_panel_profile()))
+    except Exception as e:
+        print(f"Error displaying safety sign: {e}")
         return jsonify({'success': False, 'error': 'Failed to display sign'}), 500
+    return jsonify({'success': True, 'message': 'Safety sign displayed'}), 200
 
 @app.route('/safety/preview')
 def preview_safety_sign():
     """Serve the safety sign preview image"""
-    if not os.path.exists(SAFETY_OUTPUT):
+    if not safety_preview_is_current():
         generate_safety_sign()
     
-    return send_file(SAFETY_OUTPUT, mimetype='image/png')
+    return send_image(SAFETY_OUTPUT, 'image/png')
+
+@app.route('/safety/preview/dithered')
+def preview_safety_sign_dithered():
+    """Serve the safety sign as the panel will show it after dithering"""
+    try:
+        frame = safety_sign_frame(PANEL_PROFILE)
+    except OSError as e:
+        return jsonify({'error': str(e)}), 500
+    
+    return send_image_bytes(sign_preview_png('safety', frame, PANEL_PROFILE), 'image/png')
 
 @app.route('/safety/auto_update', methods=['POST'])
 def auto_update_safety():
-    """Auto-update safety sign (for cronjob) - generates and displays"""
-    if generate_safety_sign(auto_display=True):
-        return jsonify({'success': True, 'message': 'Safety sign auto-updated and displayed'}), 200
-    else:
+    """Auto-update safety sign (for cronjob) - redraws the changed fields and displays"""
+    try:
+        display_frame(safety_sign_frame(local_panel_profile()))
+    except Exception as e:
+        print(f"Error auto-updating safety sign: {e}")
         return jsonify({'success': False, 'error': 'Failed to auto-update'}), 500
+    return jsonify({'success': True, 'message': 'Safety sign auto-updated and displayed'}), 200
+
+# ============ SIGN TEMPLATE ROUTES ============
+
+def sign_preview_png(name, frame, profile):
+    """PNG of a sign's packed frame, upright as a viewer sees it"""
+    rotate_180 = sign_templates.get(name).params['rotate_180']
+    return frame_pipeline.frame_to_png(frame, profile['width'], profile['height'], profile['orientation'], rotate_180)
+
+def sign_request_data(body):
+    data = body.get('data', {})
+    if not isinstance(data, dict):
+        raise SignError('Sign data must be an object')
+    return data
+
+@app.errorhandler(SignError)
+def handle_sign_error(e):
+    return jsonify({'error': str(e)}), 400
+
+@app.errorhandler(SignNotFound)
+def handle_sign_not_found(e):
+    return jsonify({'error': str(e)}), 404
+
+@app.route('/signs', methods=['GET'])
+def list_signs():
+    """List sign templates with the data each one draws"""
+    signs = []
+    for name in sign_templates.names():
+        try:
+            signs.append(sign_templates.get(name).describe())
+        except SignError as e:
+            signs.append({'name': name, 'error': str(e)})
+    return jsonify({'signs': signs}), 200
+
+@app.route('/signs/<name>/preview', methods=['POST'])
+def preview_sign(name):
+    """Render a sign for the posted {"data": {...}} as the panel, or ?device=, will show it"""
+    data = sign_request_data(request.get_json(silent=True) or {})
+    profile = devices.get(request.args['device']) if request.args.get('device') else PANEL_PROFILE
+    frame = sign_templates.frame(name, data, profile)
+    return send_file(io.BytesIO(sign_preview_png(name, frame, profile)), mimetype='image/png')
+
+@app.route('/signs/<name>/display', methods=['POST'])
+def display_sign(name):
+    """Show a sign on the local panel, or on the registered device named in the body"""
+    body = request.get_json(silent=True) or {}
+    data = sign_request_data(body)
+    
+    if body.get('device'):
+        device = devices.get(body['device'])
+        transfer = send_frame_to_device(device, sign_templates.frame(name, data, device))
+        if transfer is not None and transfer['state'] == 'superseded':
+            return jsonify({'error': f"Sign superseded on {device['name']} by a newer frame",
+                            'transfer': transfer}), 409
+        return jsonify({'success': True, 'message': f"Sign sent to {device['name']}"}), 200
+    
+    display_frame(sign_templates.frame(name, data, local_panel_profile()))
+    return jsonify({'success': True, 'message': 'Sign displayed'}), 200
+
+@app.route('/signs/<name>/publish', methods=['POST'])
+def publish_signs(name):
+    """Render one sign per pull-mode device in a batch and publish each as its current frame.
+    
+    Body: {"signs": [{"device": "team-a", "data": {...}}, ...]}. Signs for the same
+    panel profile share one pre-dithered background, so each only redraws the fields
+    whose text differs from the previous sign.
+    """
+    signs = (request.get_json(silent=True) or {}).get('signs')
+    if not isinstance(signs, list) or not signs:
+        raise SignError('Give a list of signs, each with a device and its data')
+    for sign in signs:
+        if not isinstance(sign, dict) or not valid_device_name(sign.get('device', '')):
+            raise SignError('Every sign needs a valid device name')
+        sign_request_data(sign)
+    
+    start = time.perf_counter()
+    published = {}
+    for sign in signs:
+        frame = sign_templates.frame(name, sign_request_data(sign), device_for_panel(sign['device']) or PANEL_PROFILE)
+        published[sign['device']] = {'etag': frame_store.publish(sign['device'], frame), 'size': len(frame)}
+    return jsonify({'published': published, 'seconds': round(time.perf_counter() - start, 3)}), 200
 
 # ============ REMOTE DISPLAY FUNCTIONS ============
 
+devices = DeviceRegistry(DEVICES_FILE, PANEL_MODEL,
+                         probe_interval=app.config['DEVICE_PROBE_INTERVAL'],
+                         probe_timeout=app.config['DEVICE_PROBE_TIMEOUT'])
+
+# Persistent frame links to devices registered with a link port
+links = PanelLinks(connect_timeout=app.config['REMOTE_CONNECT_TIMEOUT'],
+                   ack_timeout=app.config['LINK_ACK_TIMEOUT'])
+
+def device_for_panel(panel):
+    """Registered device a playlist panel or pull-mode name refers to, by name or address"""
+    name = panel[len('pull:'):] if panel.startswith('pull:') else panel
+    try:
+        return devices.get(name)
+    except DeviceNotFound:
+        return devices.find_by_address(name)
+
+def render_packed_frame(profile, image_path, params, cache=True, cache_name=None):
+    """Pack an image for a panel profile, through the frame cache shared by every display path.
+    
+    cache_name is the gallery name the frame is cached under, if image_path is not yet in the gallery.
+    """
+    width, height, orientation = profile['width'], profile['height'], profile['orientation']
+    cached_frame = frame_cache_path(CACHE_DIR, cache_name or os.path.basename(image_path), width, height, params,
+                                    orientation)
+    if cache and is_fresh(cached_frame, image_path):
+        with open(cached_frame, 'rb') as f:
+            return f.read()
+    
+    max_source = (max(PRESCALE_LIMIT[0], 2 * width), max(PRESCALE_LIMIT[1], 2 * height))
+    canvas = (height, width) if orientation in (90, 270) else (width, height)
+    # One-off uploads are not worth a base cache slot
+    with image_job(image_path, canvas, max_source):
+        frame = frame_pipeline.pack_for_panel(image_path, width, height, max_source, orientation,
+                                              base_cache=base_cache if cache else None, **params)
+    if cache:
+        write_atomic(cached_frame, frame)
+    return frame
+
+def send_frame_to_device(device, frame, wait='transferred'):
+    """Send a frame to a registered device, failing fast if it is known to be down.
+    
+    A device with a link port gets the frame over its persistent link, and the transfer's
+    info is returned once it is 'transferred' or 'refreshed' (or right away if wait is None).
+    Any other device gets an HTTP POST, which only returns after the refresh, and None is
+    returned. Raises FrameRejected if the device refuses the frame.
+    """
+    import requests
+    
+    devices.require_reachable(device['name'])
+    if device.get('link_port'):
+        transfer = links.send(device, frame)
+        if wait is None:
+            return transfer.info()
+        try:
+            info = transfer.wait(wait, timeout=app.config['REMOTE_REFRESH_TIMEOUT'])
+        except LinkError as e:
+            devices.record(device['name'], str(e))
+            raise DeviceUnreachable(f"Device '{device['name']}' is unreachable: {e}")
+        devices.record(device['name'])
+        return info
+    
+    try:
+        response = send_frame_to_remote(device['address'], frame)
+    except requests.ConnectionError as e:
+        devices.record(device['name'], str(e))
+        raise DeviceUnreachable(f"Device '{device['name']}' is unreachable: {e}")
+    devices.record(device['name'])
+    if response.status_code != 200:
+        raise FrameRejected(f'Remote display error: {response.status_code}')
+    return None
+
+def send_frame_to_remote(remote_ip, binary_data):
+    """POST a packed frame to a remote display and return the response"""
+    print(f"Sending to remote display at {remote_ip}...")
+    
+    # Imported lazily to keep process startup fast
+    import requests
+    
+    # ESP32 and other displays use /display endpoint
+    return requests.post(
+        f'http://{remote_ip}/display',
+        files={'file': ('image.bin', binary_data)},
+        headers={'Connection': 'keep-alive'},
+        # Connecting should be quick; the response only comes after the panel refresh
+        timeout=(app.config['REMOTE_CONNECT_TIMEOUT'], app.config['REMOTE_REFRESH_TIMEOUT'])
+    )
+
+def packed_frame_from_request(device=None):
+    """Render the saved image or upload named in the request form into a packed frame.
+    
+    Frames are packed for the given registered device, or at this app's panel size.
+    Returns (binary_data, None) or (None, error_response).
+    """
+    # Get the image source (filename or new upload)
+    if 'filename' in request.form:
+        # Sending saved image
+        filename = request.form.get('filename')
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
+        
+        if not os.path.exists(filepath):
+            return None, (jsonify({'error': 'Image not found'}), 404)
+        
+        # Process image with enhancement settings
+        brightness = float(request.form.get('brightness', 1.0))
+        contrast = float(request.form.get('contrast', 1.4))
+        saturation = float(request.form.get('saturation', 1.5))
+        rotate_180 = request.form.get('rotate_180', 'false').lower() == 'true'
+        
+        # Reuse a frame converted ahead of time by a batch ingest or a dithered preview
+        params = {'brightness': brightness, 'contrast': contrast, 'saturation': saturation, 'rotate_180': rotate_180}
+        binary_data = render_packed_frame(device or PANEL_PROFILE, filepath, params)
+    elif 'file' in request.files:
+        # New upload
+        file = request.files['file']
+        if file.filename == '':
+            return None, (jsonify({'error': 'No file selected'}), 400)
+        
+        if not allowed_file(file.filename):
+            return None, (jsonify({'error': 'Invalid file type'}), 400)
+        
+        # Save temporarily
+        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], 'temp_remote.png')
+        file.save(temp_path)
+        
+        brightness = float(request.form.get('brightness', 1.0))
+        contrast = float(request.form.get('contrast', 1.4))
+        saturation = float(request.form.get('saturation', 1.5))
+        rotate_180 = request.form.get('rotate_180', 'false').lower() == 'true'
+        
+        params = {'brightness': brightness, 'contrast': contrast, 'saturation': saturation, 'rotate_180': rotate_180}
+        binary_data = render_packed_frame(device or PANEL_PROFILE, temp_path, params, cache=False)
+        os.remove(temp_path)
+    else:
+        return None, (jsonify({'error': 'No image source provided'}), 400)
+    
+    return binary_data, None
+
 @app.route('/send_to_remote', methods=['POST'])
 def send_to_remote():
-    """Send image to remote E-Paper display"""
+    """Send image to a registered remote display (device) or a remote IP address.
+    
+    For a device with a frame link, the form field wait picks when to answer: 'transferred'
+    (default), 'refreshed', or 'none' for 202 at once; the transfer can then be followed at
+    /transfers/<id>. A frame replaced by a newer one before the panel showed it answers 409.
+    """
     try:
+        wait = request.form.get('wait', 'transferred')
+        if wait not in ('transferred', 'refreshed', 'none'):
+            return jsonify({'error': "wait must be 'transferred', 'refreshed' or 'none'"}), 400
         remote_ip = request.form.get('remote_ip')
-        if not remote_ip:
-            return jsonify({'error': 'No remote IP provided'}), 400
-        
-        # Get the image source (filename or new upload)
-        if 'filename' in request.form:
-            # Sending saved image
-            filename = request.form.get('filename')
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
-            
-            if not os.path.exists(filepath):
-                return jsonify({'error': 'Image not found'}), 404
-            
-            # Process image with enhancement settings
-            brightness = float(request.form.get('brightness', 1.0))
-            contrast = float(request.form.get('contrast', 1.4))
-            saturation = float(request.form.get('saturation', 1.5))
-            rotate_180 = request.form.get('rotate_180', 'false').lower() == 'true'
-            
-            img = process_image(filepath, brightness, contrast, saturation, rotate_180)
-        elif 'file' in request.files:
-            # New upload
-            file = request.files['file']
-            if file.filename == '':
-                return jsonify({'error': 'No file selected'}), 400
-            
-            if not allowed_file(file.filename):
-                return jsonify({'error': 'Invalid file type'}), 400
-            
-            # Save temporarily
-            temp_path = os.path.join(app.config['UPLOAD_FOLDER'], 'temp_remote.png')
-            file.save(temp_path)
-            
-            brightness = float(request.form.get('brightness', 1.0))
-            contrast = float(request.form.get('contrast', 1.4))
-            saturation = float(request.form.get('saturation', 1.5))
-            rotate_180 = request.form.get('rotate_180', 'false').lower() == 'true'
-            
-            img = process_image(temp_path, brightness, contrast, saturation, rotate_180)
-            os.remove(temp_path)
+        if request.form.get('device'):
+            device = devices.get(request.form.get('device'))
+        elif remote_ip:
+            device = devices.find_by_address(remote_ip)
         else:
-            return jsonify({'error': 'No image source provided'}), 400
+            return jsonify({'error': 'No remote device or IP provided'}), 400
         
-        # Convert to binary
-        binary_data = convert_to_binary(img)
+        if device is not None:
+            # Refuse before rendering if the device is known to be down
+            devices.require_reachable(device['name'])
+            remote_ip = device['address']
         
-        # Send to remote display
-        print(f"Sending to remote display at {remote_ip}...")
+        binary_data, error = packed_frame_from_request(device)
+        if error:
+            return error
         
-        # ESP32 and other displays use /display endpoint
-        response = requests.post(
-            f'http://{remote_ip}/display',
-            files={'file': ('image.bin', binary_data)},
-            headers={'Connection': 'keep-alive'},
-            timeout=120
-        )
+        # Send to remote display
+        if device is not None:
+            transfer = send_frame_to_device(device, binary_data, wait=None if wait == 'none' else wait)
+            if transfer is None:
+                print(f"Successfully sent to {remote_ip}")
+                return jsonify({'success': True, 'message': f'Image sent to {remote_ip}'}), 200
+            if transfer['state'] == 'superseded':
+                # A newer frame for the device replaced this one before the panel showed it
+                return jsonify({'success': False, 'error': f'Image superseded on {remote_ip} by a newer frame',
+                                'transfer': transfer}), 409
+            body = {'success': True, 'message': f"Image {transfer['state']} on {remote_ip}", 'transfer': transfer,
+                    'status_url': f"/transfers/{transfer['id']}"}
+            return jsonify(body), 202 if wait == 'none' else 200
         
+        response = send_frame_to_remote(remote_ip, binary_data)
         if response.status_code == 200:
             print(f"Successfully sent to {remote_ip}")
             return jsonify({'success': True, 'message': f'Image sent to {remote_ip}'}), 200
@@ -607,48 +1006,606 @@ def send_to_remote():
             print(f"Remote display returned status: {response.status_code}")
             return jsonify({'error': f'Remote display error: {response.status_code}'}), 500
             
+    except (JobRejected, DeviceError, DeviceUnreachable, FrameRejected):
+        raise
     except Exception as e:
         print(f"Error sending to remote: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+# Pushed frames are received into this one buffer instead of a new bytes object per request
+binary_frame_buffer = FrameBuffer(BINARY_SIZE)
+
 @app.route('/display/binary', methods=['POST'])
 def display_binary():
     """Accept binary image data from external sources (like ESP32)"""
     try:
-        # Import only when needed to avoid GPIO conflicts
-        from waveshare_epd import epd13in3f
-        
-        # Check if binary data was sent as file upload
-        if 'file' in request.files:
-            binary_file = request.files['file']
-            binary_data = binary_file.read()
-        # Or as raw POST body
-        elif request.data:
-            binary_data = request.data
-        else:
-            return jsonify({'error': 'No binary data received'}), 400
-        
-        # Validate data size (should be 960000 bytes for 1600x1200 display)
-        if len(binary_data) != BINARY_SIZE:
-            return jsonify({'error': f'Invalid data size: {len(binary_data)} bytes (expected {BINARY_SIZE})'}), 400
-        
-        print(f"Received {len(binary_data)} bytes of binary image data")
-        
-        epd = epd13in3f.EPD()
-        epd.init()
-        epd.display(binary_data)
-        epd.sleep()
+        with binary_frame_buffer.lock:
+            # Check if binary data was sent as file upload
+            if request.mimetype == 'multipart/form-data':
+                if 'file' not in request.files:
+                    return jsonify({'error': 'No binary data received'}), 400
+                binary_file = request.files['file']
+                frame = binary_frame_buffer.receive(binary_file.stream)
+            # Or as raw POST body, streamed straight into the buffer
+            elif request.content_length == 0:
+                return jsonify({'error': 'No binary data received'}), 400
+            else:
+                frame = binary_frame_buffer.receive(request.stream, request.content_length)
+            
+            print(f"Received {len(frame)} bytes of binary image data")
+            
+            display_frame(frame)
         
         return jsonify({'message': 'Binary image displayed successfully'}), 200
         
+    except FrameFormatError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error displaying binary image: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+# ============ DEVICE REGISTRY ROUTES ============
+
+@app.errorhandler(DeviceError)
+def handle_device_error(e):
+    return jsonify({'error': str(e)}), 400
+
+@app.errorhandler(DeviceNotFound)
+def handle_device_not_found(e):
+    return jsonify({'error': str(e)}), 404
+
+@app.errorhandler(DeviceUnreachable)
+def handle_device_unreachable(e):
+    """Tell the caller straight away instead of waiting out the transfer timeout"""
+    return jsonify({'error': str(e)}), 503
+
+@app.errorhandler(FrameRejected)
+def handle_frame_rejected(e):
+    return jsonify({'error': str(e)}), 502
+
+@app.route('/devices', methods=['GET'])
+def list_devices():
+    """List registered remote displays with their panel profile, health and link state"""
+    listed = devices.list_devices()
+    for device in listed:
+        if device.get('link_port'):
+            device['link'] = {'connected': links.connected(device['name'])}
+    return jsonify({'devices': listed}), 200
+
+@app.route('/devices/<name>', methods=['PUT'])
+def save_device(name):
+    """Register or update a device from a JSON body: {address, model, width, height, orientation, codecs,
+    link_port}"""
+    device = devices.save_device(name, request.get_json(silent=True))
+    if not device.get('link_port'):
+        links.close(name)
+    return jsonify({'message': f'Device {name} saved', 'device': device}), 200
+
+@app.route('/devices/<name>', methods=['DELETE'])
+def delete_device(name):
+    """Remove a device from the registry"""
+    devices.delete(name)
+    links.close(name)
+    return jsonify({'message': f'Device {name} deleted'}), 200
+
+@app.route('/devices/<name>/probe', methods=['POST'])
+def probe_device(name):
+    """Check a device's reachability now"""
+    return jsonify({'health': devices.probe(name)}), 200
+
+@app.route('/transfers', methods=['GET'])
+def list_transfers():
+    """Recent frame link transfers, newest first, optionally for one ?device="""
+    return jsonify({'transfers': links.list_transfers(request.args.get('device'))}), 200
+
+@app.route('/transfers/<transfer_id>', methods=['GET'])
+def get_transfer(transfer_id):
+    """Progress of a frame link transfer: bytes acknowledged, state and timings"""
+    transfer = links.get(transfer_id)
+    if transfer is None:
+        return jsonify({'error': 'Transfer not found'}), 404
+    return jsonify({'transfer': transfer}), 200
+
+# ============ VIDEO WALL ROUTES ============
+
+walls = WallRegistry(WALLS_FILE)
+
+@app.errorhandler(WallError)
+def handle_wall_error(e):
+    return jsonify({'error': str(e)}), 400
+
+@app.errorhandler(WallNotFound)
+def handle_wall_not_found(e):
+    return jsonify({'error': str(e)}), 404
+
+def wall_layout(wall):
+    """Canvas size and tiles of a wall, from its devices' current panel profiles"""
+    return plan_wall(wall, {name: devices.get(name) for name in wall_devices(wall)})
+
+def describe_wall(wall):
+    try:
+        canvas, tiles = wall_layout(wall)
+    except DeviceError as e:
+        return dict(wall, error=str(e))
+    return dict(wall, canvas=list(canvas), tiles={name: list(box) for name, (box, _) in tiles.items()})
+
+@app.route('/walls', methods=['GET'])
+def list_walls():
+    """List video walls with their canvas size and where each device's tile sits on it"""
+    return jsonify({'walls': [describe_wall(wall) for wall in walls.list_walls()]}), 200
+
+@app.route('/walls/<name>', methods=['PUT'])
+def save_wall(name):
+    """Create or update a wall from a JSON body: {rows: [[device or null, ...], ...], bezel: px or [x, y]}"""
+    data = request.get_json(silent=True)
+    # Refuse layouts whose devices are unknown or do not line up
+    wall_layout(validate_wall(data))
+    wall = walls.save_wall(name, data)
+    return jsonify({'message': f'Wall {name} saved', 'wall': describe_wall(wall)}), 200
+
+@app.route('/walls/<name>', methods=['DELETE'])
+def delete_wall(name):
+    """Remove a wall (its devices stay registered)"""
+    walls.delete(name)
+    return jsonify({'message': f'Wall {name} deleted'}), 200
+
+@app.route('/walls/<name>/send', methods=['POST'])
+def send_to_wall(name):
+    """Split a saved image (filename) or an upload (file) across a wall's devices and push all tiles at once"""
+    canvas, tiles = wall_layout(walls.get(name))
+    # Refuse before rendering if any panel is known to be down
+    for device_name in tiles:
+        devices.require_reachable(device_name)
+    
+    temp_path = None
+    if 'filename' in request.form:
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(request.form.get('filename')))
+        if not os.path.exists(filepath):
+            return jsonify({'error': 'Image not found'}), 404
+    elif 'file' in request.files and request.files['file'].filename:
+        file = request.files['file']
+        if not allowed_file(file.filename):
+            return jsonify({'error': 'Invalid file type'}), 400
+        # A name of its own per request, so concurrent wall sends never slice each other's image
+        filepath = temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f'.wall.{uuid.uuid4().hex[:12]}.part')
+        file.save(temp_path)
+    else:
+        return jsonify({'error': 'No image source provided'}), 400
+    
+    try:
+        params = image_params(request.form)
+        max_source = (max(PRESCALE_LIMIT[0], 2 * canvas[0]), max(PRESCALE_LIMIT[1], 2 * canvas[1]))
+        start = time.perf_counter()
+        with image_job(filepath, canvas, max_source):
+            frames = render_tiles(filepath, canvas, tiles, max_source,
+                                  base_cache=base_cache if temp_path is None else None, **params)
+        rendered = time.perf_counter()
+        results = push_tiles(frames, lambda device_name, frame: send_frame_to_device(tiles[device_name][1], frame))
+        sent = time.perf_counter()
+    except (JobRejected, DeviceError, DeviceUnreachable):
+        raise
+    except Exception as e:
+        print(f"Error sending to wall {name}: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+    
+    report = {}
+    for device_name, result in results.items():
+        if isinstance(result, Exception):
+            report[device_name] = {'success': False, 'error': str(result)}
+        else:
+            report[device_name] = {'success': True}
+    success = all(entry['success'] for entry in report.values())
+    print(f"Wall {name}: {len(frames)} tiles rendered in {rendered - start:.2f}s, sent in {sent - rendered:.2f}s")
+    return jsonify({
+        'success': success,
+        'devices': report,
+        'canvas': list(canvas),
+        'render_seconds': round(rendered - start, 3),
+        'send_seconds': round(sent - rendered, 3)
+    }), 200 if success else 500
+
+# ============ PULL-MODE FRAMES ============
+
+frame_store = FrameStore(os.path.join(CACHE_DIR, 'devices'))
+notifier = ChangeNotifier(current=frame_store.info)
+frame_store.on_publish = notifier.publish
+
+def next_check_seconds(device):
+    """Seconds a pull-mode device may sleep before its frame can next change"""
+    interval = app.config['PULL_CHECK_INTERVAL']
+    next_change = scheduler.next_change_for_panel(f'pull:{device}')
+    if next_change is not None:
+        interval = min(interval, max(int(next_change - time.time()) + 1, 1))
+    return interval
+
+@app.route('/frame/<device>.bin', methods=['GET'])
+def get_device_frame(device):
+    """Serve a device's current packed frame, or 304 if its ETag still matches"""
+    entry = frame_store.get(device)
+    if entry is None:
+        response = jsonify({'error': 'No frame published for this device'})
+        response.status_code = 404
+    else:
+        response = app.response_class(entry['frame'], mimetype='application/octet-stream')
+        response.set_etag(entry['etag'])
+        response.last_modified = entry['published']
+        # Devices must revalidate on every wake-up; a 304 costs a few hundred bytes
+        response.cache_control.no_cache = True
+        response = response.make_conditional(request)
+    response.headers['X-Next-Check'] = str(next_check_seconds(device))
+    if app.config['NOTIFY_PORT']:
+        response.headers['X-Notify-Port'] = str(app.config['NOTIFY_PORT'])
+    return response
+
+@app.route('/frame/<device>', methods=['POST'])
+def publish_device_frame(device):
+    """Render a saved image or upload and publish it as a pull-mode device's current frame"""
+    if not valid_device_name(device):
+        return jsonify({'error': 'Invalid device name'}), 400
+    
+    binary_data, error = packed_frame_from_request(device_for_panel(device))
+    if error:
+        return error
+    
+    etag = frame_store.publish(device, binary_data)
+    return jsonify({'message': f'Frame published for {device}', 'etag': etag, 'size': len(binary_data)}), 200
+
+# ============ BATCH INGEST ============
+
+batch_ingest = BatchIngest(governor, DISPLAY_WIDTH, DISPLAY_HEIGHT, PRESCALE_LIMIT, CACHE_DIR,
+                           workers=app.config['BATCH_WORKERS'])
+
+def create_upload(name):
+    """Open a new upload file for writing, numbering the name if an upload already has it"""
+    base, ext = os.path.splitext(name)
+    candidate = name
+    counter = 0
+    while True:
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], candidate)
+        try:
+            return filepath, open(filepath, 'xb')
+        except FileExistsError:
+            counter += 1
+            candidate = f'{base}-{counter}{ext}'
+
+def copy_limited(src, dst, budget):
+    """Copy src to dst, counting the bytes actually written against budget['remaining']"""
+    while True:
+        chunk = src.read(64 * 1024)
+        if not chunk:
+            return
+        budget['remaining'] -= len(chunk)
+        if budget['remaining'] < 0:
+            # Zip headers can claim any size, so the limit is enforced on the bytes themselves
+            limit_mb = app.config['BATCH_MAX_CONTENT_LENGTH'] // (1024 * 1024)
+            raise ValueError(f'Batch unpacks to more than {limit_mb} MB')
+        dst.write(chunk)
+
+def save_upload_stream(name, src, saved, renamed, budget):
+    """Save one image of a batch under a name no other upload has"""
+    if len(saved) >= app.config['BATCH_MAX_FILES']:
+        raise ValueError(f"Batch is limited to {app.config['BATCH_MAX_FILES']} files")
+    filepath, dst = create_upload(name)
+    try:
+        with dst:
+            copy_limited(src, dst, budget)
+    except Exception:
+        os.remove(filepath)
+        raise
+    if os.path.basename(filepath) != name:
+        renamed.append({'name': name, 'saved_as': os.path.basename(filepath)})
+    saved.append(filepath)
+
+def save_batch_upload(file, saved, skipped, renamed, budget):
+    """Save one uploaded image, or every image inside an uploaded zip"""
+    if file.filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(file.stream) as archive:
+            for member in archive.infolist():
+                name = secure_filename(os.path.basename(member.filename))
+                if member.is_dir() or not name:
+                    continue
+                if not allowed_file(name):
+                    skipped.append(member.filename)
+                    continue
+                with archive.open(member) as src:
+                    save_upload_stream(name, src, saved, renamed, budget)
+        return
+    
+    if not allowed_file(file.filename):
+        skipped.append(file.filename)
+        return
+    save_upload_stream(secure_filename(file.filename), file.stream, saved, renamed, budget)
+
+@app.route('/batch', methods=['POST'])
+def batch_upload():
+    """Save many images (or zips of images) and convert them in the background without displaying"""
+    # Albums are far larger than the single-image upload limit
+    request.max_content_length = app.config['BATCH_MAX_CONTENT_LENGTH']
+    
+    files = request.files.getlist('files') + request.files.getlist('file')
+    files = [file for file in files if file.filename]
+    if not files:
+        return jsonify({'error': 'No files provided'}), 400
+    
+    params = {
+        'brightness': float(request.form.get('brightness', 1.0)),
+        'contrast': float(request.form.get('contrast', 1.4)),
+        'saturation': float(request.form.get('saturation', 1.5)),
+        'rotate_180': request.form.get('rotate_180', 'false').lower() == 'true',
+    }
+    
+    saved, skipped, renamed = [], [], []
+    # Decompressed bytes the whole batch may write, however small its zips are
+    budget = {'remaining': app.config['BATCH_MAX_CONTENT_LENGTH']}
+    try:
+        for file in files:
+            save_batch_upload(file, saved, skipped, renamed, budget)
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({'error': str(e), 'saved': [os.path.basename(path) for path in saved]}), 400
+    
+    if not saved:
+        return jsonify({'error': 'No valid images in upload', 'skipped': skipped}), 400
+    
+    batch_id = batch_ingest.submit(saved, params)
+    return jsonify({
+        'batch_id': batch_id,
+        'files': [os.path.basename(path) for path in saved],
+        'skipped': skipped,
+        'renamed': renamed,
+        'status_url': f'/batch/{batch_id}'
+    }), 202
+
+@app.route('/batch/<batch_id>', methods=['GET'])
+def batch_status(batch_id):
+    """Report progress of a batch conversion"""
+    status = batch_ingest.status(batch_id)
+    if status is None:
+        return jsonify({'error': 'Batch not found'}), 404
+    return jsonify(status), 200
+
+# ============ PLAYLIST FUNCTIONS ============
+
+def render_playlist_item(item, panel):
+    """Render a playlist item into a packed frame for its panel"""
+    device = device_for_panel(panel) if panel != 'local' else None
+    if item['type'] == 'safety':
+        profile = device or (local_panel_profile() if panel == 'local' else PANEL_PROFILE)
+        return safety_sign_frame(profile)
+    
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(item['filename']))
+    params = {'brightness': float(item.get('brightness', 1.0)),
+              'contrast': float(item.get('contrast', 1.4)),
+              'saturation': float(item.get('saturation', 1.5)),
+              'rotate_180': bool(item.get('rotate_180', False))}
+    
+    if device is not None:
+        return render_packed_frame(device, filepath, params)
+    return render_frame(filepath, panel=panel, **params)
+
+def show_playlist_frame(frame, panel):
+    """Show a rendered playlist frame on the local panel or a remote display"""
+    if panel == 'local':
+        display_frame(frame)
+        return
+    
+    if panel.startswith('pull:'):
+        frame_store.publish(panel[len('pull:'):], frame)
+        return
+    
+    device = device_for_panel(panel)
+    if device is not None:
+        # Over a frame link this returns once the frame is transferred, so the next one
+        # can be prepared while the panel refreshes
+        send_frame_to_device(device, frame)
+        return
+    
+    response = send_frame_to_remote(panel, frame)
+    if response.status_code != 200:
+        raise RuntimeError(f'Remote display error: {response.status_code}')
+
+def playlist_item_version(item):
+    """Value that changes whenever the item's source changes, invalidating its prefetched frame"""
+    if item['type'] == 'safety':
+        data_mtime = os.path.getmtime(SAFETY_DATA_FILE) if os.path.exists(SAFETY_DATA_FILE) else None
+        return (datetime.now().date().isoformat(), data_mtime)
+    
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(item['filename']))
+    return os.path.getmtime(filepath) if os.path.exists(filepath) else None
+
+scheduler = PlaylistScheduler(PLAYLIST_FILE, render_playlist_item, show_playlist_frame,
+                              version=playlist_item_version,
+                              min_dwell=app.config['PLAYLIST_MIN_DWELL'])
+
+# ============ PLAYLIST ROUTES ============
+
+@app.errorhandler(PlaylistError)
+def handle_playlist_error(e):
+    return jsonify({'error': str(e)}), 400
+
+@app.errorhandler(PlaylistNotFound)
+def handle_playlist_not_found(e):
+    return jsonify({'error': str(e)}), 404
+
+@app.route('/playlists', methods=['GET'])
+def list_playlists():
+    """List playlists with their running state and position"""
+    return jsonify({'playlists': scheduler.list_playlists()}), 200
+
+@app.route('/playlists/<name>', methods=['PUT'])
+def save_playlist(name):
+    """Create or replace a playlist from a JSON body: {panel, items: [{type, filename, dwell, ...}]}"""
+    data = request.get_json(silent=True) or {}
+    items = data.get('items')
+    
+    for item in items if isinstance(items, list) else []:
+        if isinstance(item, dict) and item.get('type', 'image') == 'image' and item.get('filename'):
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(item['filename']))
+            if not os.path.exists(filepath):
+                return jsonify({'error': f"Image not found: {item['filename']}"}), 404
+    
+    scheduler.save_playlist(name, data.get('panel', 'local'), items)
+    return jsonify({'message': f'Playlist {name} saved', 'playlist': scheduler.get(name)}), 200
+
+@app.route('/playlists/<name>', methods=['DELETE'])
+def delete_playlist(name):
+    """Delete a playlist"""
+    scheduler.delete(name)
+    return jsonify({'message': f'Playlist {name} deleted'}), 200
+
+@app.route('/playlists/<name>/start', methods=['POST'])
+def start_playlist(name):
+    """Start a playlist on its panel, stopping any other playlist there"""
+    scheduler.start_playlist(name)
+    return jsonify({'message': f'Playlist {name} started'}), 200
+
+@app.route('/playlists/<name>/stop', methods=['POST'])
+def stop_playlist(name):
+    """Stop a running playlist, leaving the current frame on the panel"""
+    scheduler.stop_playlist(name)
+    return jsonify({'message': f'Playlist {name} stopped'}), 200
+
+# ============ URL SOURCES ============
+
+def show_url_source(name, image_path, source):
+    """Render a source's newly fetched image for its panel and show it"""
+    panel = source['panel']
+    device = device_for_panel(panel) if panel != 'local' else None
+    if device is not None:
+        frame = render_packed_frame(device, image_path, source['params'])
+    else:
+        frame = render_frame(image_path, panel=panel, **source['params'])
+    show_playlist_frame(frame, panel)
+    print(f"URL source {name} changed, shown on {panel}")
+
+url_sources = UrlSources(SOURCES_FILE, SOURCES_DIR, show_url_source,
+                         min_interval=app.config['URL_MIN_INTERVAL'],
+                         max_bytes=app.config['MAX_CONTENT_LENGTH'],
+                         timeout=(app.config['REMOTE_CONNECT_TIMEOUT'], app.config['URL_FETCH_TIMEOUT']))
+
+@app.errorhandler(UrlSourceError)
+def handle_url_source_error(e):
+    return jsonify({'error': str(e)}), 400
+
+@app.errorhandler(UrlSourceNotFound)
+def handle_url_source_not_found(e):
+    return jsonify({'error': str(e)}), 404
+
+@app.route('/sources', methods=['GET'])
+def list_url_sources():
+    """List URL sources with the outcome of their last poll"""
+    return jsonify({'sources': url_sources.list_sources()}), 200
+
+@app.route('/sources/<name>', methods=['PUT'])
+def save_url_source(name):
+    """Create or replace a URL source: {url, interval, panel, brightness, contrast, saturation, rotate_180}"""
+    source = url_sources.save_source(name, request.get_json(silent=True))
+    return jsonify({'source': source}), 200
+
+@app.route('/sources/<name>', methods=['DELETE'])
+def delete_url_source(name):
+    url_sources.delete(name)
+    return jsonify({'message': f'Source {name} deleted'}), 200
+
+@app.route('/sources/<name>/poll', methods=['POST'])
+def poll_url_source(name):
+    """Poll a source now instead of waiting for its interval"""
+    result = url_sources.poll(name)
+    status_code = 502 if result['status'] == 'error' else 200
+    return jsonify({'result': result, 'source': url_sources.get(name)}), status_code
+
+@app.route('/sources/<name>/image', methods=['GET'])
+def url_source_image(name):
+    """The last image fetched for a source"""
+    source = url_sources.get(name)
+    image_path = url_sources.image_path(name)
+    # Served as the format PIL found when it was fetched, whatever the upstream server claimed
+    mimetype = SOURCE_IMAGE_FORMATS.get(source.get('format'))
+    if mimetype is None or not os.path.exists(image_path):
+        return jsonify({'error': f'Source {name} has not been fetched yet'}), 404
+    response = send_image(image_path, mimetype)
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+# ============ PROFILING ROUTES ============
+
+@app.route('/profiles', methods=['GET'])
+def list_profiles():
+    """List stored request profiles, most recent first"""
+    if not profiler.active:
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    return jsonify({'profiling': profiler.stats(), 'profiles': profiler.list_profiles()}), 200
+
+@app.route('/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Download a profile: ?format=pstats (cProfile), collapsed (sampled, for flamegraphs) or text"""
+    if not profiler.active:
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    found = profiler.get(profile_id)
+    if found is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    info, outputs = found
+    
+    profile_format = request.args.get('format', info['formats'][0] if len(info['formats']) == 1 else 'pstats')
+    if profile_format not in outputs:
+        return jsonify({'error': f"Profile {profile_id} is available as {', '.join(info['formats'])}"}), 400
+    if profile_format == 'pstats':
+        return send_file(io.BytesIO(outputs['pstats']), mimetype='application/octet-stream',
+                         as_attachment=True, download_name=f'profile-{profile_id}.pstats')
+    return app.response_class(outputs[profile_format], mimetype='text/plain')
+
+@app.route('/profiles/sampling', methods=['PUT'])
+def set_profile_sampling():
+    """Change the fraction of requests sampled in the background: {rate: 0..1}"""
+    if not profiler.enabled:
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    try:
+        rate = float((request.get_json(silent=True) or {}).get('rate'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'rate must be a number'}), 400
+    if not 0 <= rate <= 1:
+        return jsonify({'error': 'rate must be between 0 and 1'}), 400
+    profiler.sample_rate = rate
+    return jsonify({'profiling': profiler.stats()}), 200
+
+def handle_shutdown_signal(signum, frame):
+    """Put the panel to sleep before exiting on SIGTERM / SIGHUP"""
+    print(f"Received signal {signum}, shutting down")
+    panel_power.shutdown()
+    sys.exit(0)
+
+def finish_startup():
+    """Warm up if enabled and mark the app ready for /health"""
+    if app.config['WARMUP']:
+        warm_up()
+    STARTUP_TIMINGS['ready'] = time.perf_counter() - PROCESS_START
+    print(f"Ready to serve after {STARTUP_TIMINGS['ready']:.2f}s")
+
+STARTUP_TIMINGS['imports'] = time.perf_counter() - PROCESS_START
+
+if __name__ != '__main__':
+    # Imported by a WSGI server or a test client, which never reach app.run: warm up in the
+    # background and let /health report ready once that is done
+    threading.Thread(target=finish_startup, name='warm-up', daemon=True).start()
+
 if __name__ == '__main__':
+    finish_startup()
+    # Ctrl-C exits through atexit, which also sleeps the panel
+    signal.signal(signal.SIGTERM, handle_shutdown_signal)
+    signal.signal(signal.SIGHUP, handle_shutdown_signal)
+    scheduler.start()
+    url_sources.start()
+    devices.start()
+    if app.config['NOTIFY_PORT']:
+        notifier.start(port=app.config['NOTIFY_PORT'])
+    
     # Disable reloader to prevent GPIO conflicts
-    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
+    app.run(host='0.0.0.0', port=int(os.environ.get('EINK_PORT', 5000)), debug=True, use_reloader=False)
@@ -0,0 +1,170 @@
+"""
+Bulk ingest of gallery images without displaying them.
+
+A batch is a list of already-saved uploads. Each image is converted in a
+process pool into a cached thumbnail, browser preview and packed frame for
+the panel, so later gallery loads and sends are served from cache. Every
+in-flight conversion holds its estimated footprint in the MemoryGovernor as
+background work, so interactive uploads and previews keep their place in its
+queue, and batch progress can be polled by id.
+"""
+
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from frame_pipeline import convert_to_binary, make_preview, make_thumbnail, process_image
+from memory_governor import estimate_job_bytes, inspect_image, JobRejected
+
+# Finished batches kept around for status polling
+MAX_FINISHED_BATCHES = 20
+
+
+def thumbnail_cache_path(cache_dir, filename):
+    return os.path.join(cache_dir, 'thumbnails', filename + '.jpg')
+
+
+def preview_cache_path(cache_dir, filename, width, height):
+    return os.path.join(cache_dir, 'previews', f'{filename}.{width}x{height}.jpg')
+
+
+def frame_cache_path(cache_dir, filename, width, height, params, orientation=0):
+    """Path of the packed frame for an image at the given panel size, orientation and enhancement"""
+    key = (f"{width}x{height}-b{float(params['brightness'])}-c{float(params['contrast'])}"
+           f"-s{float(params['saturation'])}-r{int(bool(params['rotate_180']))}")
+    if orientation:
+        key += f'-o{orientation}'
+    return os.path.join(cache_dir, 'frames', f'{filename}.{key}.bin')
+
+
+def is_fresh(cache_path, source_path):
+    """True if a cached derivative exists and is newer than its source"""
+    return os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(source_path)
+
+
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # A temp file of its own per call, as request threads may write the same path at once
+    fd, temp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}.', suffix='.tmp',
+                                     dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def convert_one(source_path, thumbnail_path, preview_path, frame_path, width, height, max_source, params):
+    """Process pool worker: write the thumbnail, preview and packed frame for one image"""
+    start = time.perf_counter()
+    write_atomic(preview_path, make_preview(source_path, width, height))
+    # The small preview is a much cheaper source for the thumbnail than the original
+    write_atomic(thumbnail_path, make_thumbnail(preview_path))
+    img = process_image(source_path, width, height, max_source, **params)
+    write_atomic(frame_path, convert_to_binary(img, width, height))
+    return time.perf_counter() - start
+
+
+class BatchIngest:
+    """Converts batches of saved images across a process pool"""
+
+    def __init__(self, governor, width, height, max_source, cache_dir, workers=None):
+        self.governor = governor
+        self.width = width
+        self.height = height
+        self.max_source = max_source
+        self.cache_dir = cache_dir
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def submit(self, paths, params):
+        """Start converting a list of image paths and return the batch id"""
+        batch_id = uuid.uuid4().hex[:12]
+        batch = {
+            'id': batch_id,
+            'total': len(paths),
+            'done': 0,
+            'failed': 0,
+            'errors': [],
+            'files': [os.path.basename(path) for path in paths],
+            'started': time.time(),
+            'finished': None,
+            'elapsed': 0.0,
+            'cpu_seconds': 0.0,
+        }
+        with self._lock:
+            finished = [b for b in self._batches.values() if b['finished']]
+            for old in sorted(finished, key=lambda b: b['started'])[:-MAX_FINISHED_BATCHES]:
+                self._batches.pop(old['id'], None)
+            self._batches[batch_id] = batch
+
+        thread = threading.Thread(target=self._run, args=(batch, paths, params),
+                                  name=f'batch-{batch_id}', daemon=True)
+        thread.start()
+        return batch_id
+
+    def status(self, batch_id):
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return None
+            status = dict(batch, errors=list(batch['errors']))
+        if not status['finished']:
+            status['elapsed'] = time.time() - status['started']
+        return status
+
+    def _record(self, batch, filename, error=None, cpu_seconds=0.0):
+        with self._lock:
+            if error:
+                batch['failed'] += 1
+                batch['errors'].append({'filename': filename, 'error': error})
+            else:
+                batch['done'] += 1
+                batch['cpu_seconds'] += cpu_seconds
+
+    def _convert(self, batch, path, params):
+        """Convert one image of a batch, holding a background share of the memory budget"""
+        filename = os.path.basename(path)
+        try:
+            width, height, mode = inspect_image(path)
+            if width * height > self.governor.max_pixels:
+                raise JobRejected(f'Image is {width}x{height}, limit is {self.governor.max_pixels} pixels')
+            cost = estimate_job_bytes(width, height, mode, (self.width, self.height))
+            with self.governor.admit(cost, background=True):
+                future = self._get_pool().submit(
+                    convert_one, path,
+                    thumbnail_cache_path(self.cache_dir, filename),
+                    preview_cache_path(self.cache_dir, filename, self.width, self.height),
+                    frame_cache_path(self.cache_dir, filename, self.width, self.height, params),
+                    self.width, self.height, self.max_source, params)
+                cpu_seconds = future.result()
+        except Exception as e:
+            self._record(batch, filename, str(e))
+        else:
+            self._record(batch, filename, cpu_seconds=cpu_seconds)
+
+    def _run(self, batch, paths, params):
+        # One thread per worker process, each waiting on its conversion inside its admission
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"batch-{batch['id']}") as threads:
+            for path in paths:
+                threads.submit(self._convert, batch, path, params)
+
+        with self._lock:
+            batch['finished'] = time.time()
+            batch['elapsed'] = batch['finished'] - batch['started']
+        print(f"Batch {batch['id']}: {batch['done']} converted, {batch['failed']} failed "
+              f"in {batch['elapsed']:.1f}s ({batch['cpu_seconds']:.1f}s of conversion work)")
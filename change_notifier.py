@@ -0,0 +1,227 @@
+"""
+Frame change notifications for pull-mode remote displays.
+
+Devices behind NAT cannot be pushed to, so they subscribe here instead and are
+told the moment a new frame is published for them. A notification carries only
+the frame's ETag and size; the device then fetches /frame/<device>.bin from the
+main app (usually getting a 304 if nothing it cares about changed).
+
+Two ways to subscribe, both served from a separate port by one asyncio event
+loop in a single thread, so dozens of idle subscribers cost a socket each
+rather than a Flask worker thread each:
+
+    GET /events/<device>                     Server-sent events, one 'frame'
+                                             event per publish
+    GET /poll/<device>?etag=<etag>&timeout=  Long-poll: 200 with the frame
+                                             info once it differs from etag,
+                                             204 if the timeout passes first
+"""
+
+import asyncio
+import json
+import math
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+from frame_store import valid_device_name
+
+# Longest request head a subscriber may send
+MAX_REQUEST_HEAD = 8192
+
+
+class ChangeNotifier:
+    """Fans frame publishes out to SSE and long-poll subscribers"""
+
+    def __init__(self, current=None, keepalive=25, max_poll=300):
+        # current(device) -> (etag, size) or None, for devices not published since startup
+        self._current = current or (lambda device: None)
+        self.keepalive = keepalive
+        self.max_poll = max_poll
+        self._latest = {}
+        self._changed = {}
+        self._waiting = {}
+        self._subscribers = 0
+        self._lock = threading.Lock()
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    def stats(self):
+        with self._lock:
+            return {'subscribers': self._subscribers, 'devices': len(self._latest)}
+
+    # ---- publishing (any thread) ----
+
+    def publish(self, device, etag, size):
+        """Record a device's new frame and wake everyone waiting on it"""
+        with self._lock:
+            self._latest[device] = (etag, size)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake, device)
+
+    def _wake(self, device):
+        event = self._changed.pop(device, None)
+        if event is not None:
+            event.set()
+
+    # ---- server lifecycle ----
+
+    def start(self, host='0.0.0.0', port=5001):
+        """Serve subscriptions from a background thread"""
+        if self._thread is not None:
+            return
+        ready = threading.Event()
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._serve(host, port, ready)),
+                                        name='change-notifier', daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def stop(self):
+        if self._loop is not None and self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    async def _serve(self, host, port, ready):
+        self._loop = asyncio.get_running_loop()
+        try:
+            self._server = await asyncio.start_server(self._handle, host, port, limit=MAX_REQUEST_HEAD)
+        finally:
+            ready.set()
+        print(f"Change notifications on port {port}")
+        async with self._server:
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    # ---- subscriptions (event loop) ----
+
+    async def _info(self, device):
+        with self._lock:
+            latest = self._latest.get(device)
+        if latest is None:
+            # First subscriber for a device published before startup: read it once off the loop
+            latest = await self._loop.run_in_executor(None, self._current, device)
+            if latest is not None:
+                with self._lock:
+                    latest = self._latest.setdefault(device, latest)
+        return latest
+
+    def _event(self, device):
+        """Event set on the device's next publish"""
+        event = self._changed.get(device)
+        if event is None:
+            event = self._changed[device] = asyncio.Event()
+        return event
+
+    async def _wait_change(self, device, etag, timeout, disconnected):
+        """Wait until the device's ETag differs from etag; return its info, or None on timeout"""
+        deadline = self._loop.time() + timeout
+        self._waiting[device] = self._waiting.get(device, 0) + 1
+        try:
+            while True:
+                event = self._event(device)
+                info = await self._info(device)
+                if info is not None and info[0] != etag:
+                    return info
+                remaining = deadline - self._loop.time()
+                if remaining <= 0 or disconnected.done():
+                    return None
+                changed = asyncio.ensure_future(event.wait())
+                await asyncio.wait({changed, disconnected}, timeout=remaining,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                changed.cancel()
+        finally:
+            # Events only live while someone waits on them
+            self._waiting[device] -= 1
+            if not self._waiting[device]:
+                del self._waiting[device]
+                self._changed.pop(device, None)
+
+    async def _handle(self, reader, writer):
+        with self._lock:
+            self._subscribers += 1
+        try:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+                request_line, *header_lines = head.decode('latin-1').split('\r\n')
+                method, target, _ = request_line.split(' ', 2)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                return
+            headers = {}
+            for line in header_lines:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            url = urlsplit(target)
+            parts = url.path.strip('/').split('/')
+            if method != 'GET' or len(parts) != 2 or parts[0] not in ('events', 'poll'):
+                await self._respond(writer, 404, {'error': 'Not found'})
+                return
+            if not valid_device_name(parts[1]):
+                await self._respond(writer, 400, {'error': 'Invalid device name'})
+                return
+
+            # Anything readable after the request head means the client went away
+            disconnected = asyncio.ensure_future(reader.read(1))
+            try:
+                if parts[0] == 'events':
+                    await self._stream_events(writer, parts[1], headers.get('last-event-id'), disconnected)
+                else:
+                    await self._long_poll(writer, parts[1], parse_qs(url.query), disconnected)
+            finally:
+                disconnected.cancel()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            with self._lock:
+                self._subscribers -= 1
+            writer.close()
+
+    async def _respond(self, writer, status, body=None):
+        reason = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found'}[status]
+        payload = json.dumps(body).encode() if body is not None else b''
+        writer.write(f'HTTP/1.1 {status} {reason}\r\n'
+                     f'Content-Type: application/json\r\n'
+                     f'Content-Length: {len(payload)}\r\n'
+                     f'Cache-Control: no-store\r\n'
+                     f'Connection: close\r\n\r\n'.encode() + payload)
+        await writer.drain()
+
+    async def _long_poll(self, writer, device, query, disconnected):
+        etag = query.get('etag', [''])[0]
+        try:
+            timeout = float(query.get('timeout', [self.max_poll])[0])
+        except ValueError:
+            timeout = math.nan
+        if not math.isfinite(timeout) or timeout < 0:
+            await self._respond(writer, 400, {'error': 'Invalid timeout'})
+            return
+        timeout = min(timeout, self.max_poll)
+        info = await self._wait_change(device, etag, timeout, disconnected)
+        if info is None:
+            await self._respond(writer, 204)
+        else:
+            await self._respond(writer, 200, {'device': device, 'etag': info[0], 'size': info[1]})
+
+    async def _stream_events(self, writer, device, last_event_id, disconnected):
+        writer.write(b'HTTP/1.1 200 OK\r\n'
+                     b'Content-Type: text/event-stream\r\n'
+                     b'Cache-Control: no-store\r\n'
+                     b'Connection: keep-alive\r\n\r\n'
+                     b'retry: 10000\n\n')
+        await writer.drain()
+
+        etag = last_event_id or ''
+        while not disconnected.done():
+            info = await self._wait_change(device, etag, self.keepalive, disconnected)
+            if info is None:
+                # Comment line keeps NAT mappings and proxies from dropping the idle connection
+                writer.write(b': keepalive\n\n')
+            else:
+                etag = info[0]
+                data = json.dumps({'device': device, 'etag': info[0], 'size': info[1]})
+                writer.write(f'id: {etag}\nevent: frame\ndata: {data}\n\n'.encode())
+            await writer.drain()
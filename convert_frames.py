@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Offline converter from a tree of images to packed panel frames.
+
+For panels that load frames from an SD card instead of over the network.
+Every image under SOURCE goes through the apps' own pipeline
+(frame_pipeline.pack_for_panel: crop to fill, enhancement, 6-color dither,
+two pixels per byte) and is written as a .bin frame at the same relative path
+under OUTPUT, and optionally as a zlib stream (.bin.z) that the ESP32's ROM
+inflater can unpack. Conversions run in a process pool across all cores.
+
+An image is skipped when its content hash and the conversion settings match
+the previous run and its frames are still there; hashes are kept in
+OUTPUT/.frames-index.json. One JSON line per image is written to the manifest
+(stdout by default) as soon as it is done.
+
+Usage:
+    python3 convert_frames.py ~/Pictures/album /media/sd/frames --panel epd13in3f \\
+        --orientation 90 --contrast 1.2 --format both --manifest frames.jsonl
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from batch_ingest import write_atomic
+from device_registry import ORIENTATIONS, PANEL_MODELS
+from frame_pipeline import pack_for_panel, source_digest
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'bmp', 'gif'}
+FORMATS = ('raw', 'zlib', 'both')
+INDEX_FILENAME = '.frames-index.json'
+
+# Same decode limits as the display apps, so frames match what they would send
+PRESCALE_LIMITS = {
+    'epd7in3e': (2400, 1440),
+    'epd13in3f': (3200, 2400),
+}
+
+
+def parse_size(text):
+    """Parse '800x480' into (width, height)"""
+    width, _, height = text.lower().partition('x')
+    try:
+        size = (int(width), int(height))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid size '{text}' (expected WIDTHxHEIGHT)")
+    if size[0] <= 0 or size[1] <= 0 or size[0] % 2:
+        raise argparse.ArgumentTypeError('Size must be positive with an even width')
+    return size
+
+
+def find_images(source_dir, skip_dir=None):
+    """Relative paths of the images under source_dir, in a stable order"""
+    found = []
+    for root, dirs, files in os.walk(source_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.')
+                         and os.path.abspath(os.path.join(root, d)) != skip_dir)
+        for filename in sorted(files):
+            if filename.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS and not filename.startswith('.'):
+                found.append(os.path.relpath(os.path.join(root, filename), source_dir))
+    return found
+
+
+def output_names(relpath, image_format):
+    """Frame paths for an image, relative to the output directory"""
+    frame = os.path.splitext(relpath)[0] + '.bin'
+    return {'raw': [frame], 'zlib': [frame + '.z'], 'both': [frame, frame + '.z']}[image_format]
+
+
+def convert_file(source_path, output_dir, outputs, settings, previous, width, height, max_source, orientation,
+                 params):
+    """Process pool worker: hash an image and, unless its frames are current, convert it"""
+    start = time.perf_counter()
+    digest = source_digest(source_path)
+    result = {'source_sha256': digest, 'settings': settings}
+    current = all(os.path.exists(os.path.join(output_dir, name)) for name in outputs)
+    if current and previous == result:
+        return dict(result, status='skipped', seconds=time.perf_counter() - start)
+
+    # The pipeline reports its steps on stdout, which may be carrying the manifest
+    with contextlib.redirect_stdout(sys.stderr):
+        frame = pack_for_panel(source_path, width, height, max_source, orientation, **params)
+    sizes = {}
+    for name in outputs:
+        data = zlib.compress(frame, 9) if name.endswith('.z') else frame
+        write_atomic(os.path.join(output_dir, name), data)
+        sizes[name] = len(data)
+    return dict(result, status='converted', bytes=sizes, seconds=time.perf_counter() - start)
+
+
+def load_index(output_dir):
+    try:
+        with open(os.path.join(output_dir, INDEX_FILENAME), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a directory tree of images into packed panel frames')
+    parser.add_argument('source', help='directory of images, searched recursively')
+    parser.add_argument('output', help='directory for the frames, mirroring the source tree')
+    parser.add_argument('--panel', choices=sorted(PANEL_MODELS), default='epd7in3e', help='panel model')
+    parser.add_argument('--size', type=parse_size, help='native panel resolution, overriding --panel')
+    parser.add_argument('--orientation', type=int, choices=ORIENTATIONS, default=0,
+                        help='degrees the picture is turned counter-clockwise to match the mounting')
+    parser.add_argument('--brightness', type=float, default=1.0)
+    parser.add_argument('--contrast', type=float, default=1.4)
+    parser.add_argument('--saturation', type=float, default=1.5)
+    parser.add_argument('--rotate-180', action='store_true')
+    parser.add_argument('--format', choices=FORMATS, default='raw',
+                        help='raw .bin frames, zlib-compressed .bin.z frames, or both')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--manifest', default='-', help='file for the JSON-lines manifest (default: stdout)')
+    parser.add_argument('--force', action='store_true', help='convert every image, even if up to date')
+    args = parser.parse_args()
+
+    width, height = args.size or PANEL_MODELS[args.panel]
+    limit = PRESCALE_LIMITS.get(args.panel, (0, 0)) if not args.size else (0, 0)
+    max_source = (max(limit[0], 2 * width), max(limit[1], 2 * height))
+    params = {'brightness': args.brightness, 'contrast': args.contrast, 'saturation': args.saturation,
+              'rotate_180': args.rotate_180}
+    settings = (f"{width}x{height}-o{args.orientation}-b{args.brightness}-c{args.contrast}"
+                f"-s{args.saturation}-r{int(args.rotate_180)}")
+
+    source_dir = os.path.abspath(args.source)
+    output_dir = os.path.abspath(args.output)
+    images = find_images(source_dir, skip_dir=output_dir)
+    index = {} if args.force else load_index(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = sys.stdout if args.manifest == '-' else open(args.manifest, 'w')
+
+    def emit(entry):
+        manifest.write(json.dumps(entry) + '\n')
+        manifest.flush()
+
+    print(f"Converting {len(images)} images for a {width}x{height} panel (orientation {args.orientation}) "
+          f"with {args.workers} workers", file=sys.stderr)
+    start = time.perf_counter()
+    counts = {'converted': 0, 'skipped': 0, 'failed': 0}
+    new_index = {relpath: index[relpath] for relpath in images if relpath in index}
+    claimed = {}
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = {}
+            for relpath in images:
+                outputs = output_names(relpath, args.format)
+                # photo.jpg and photo.png would both become photo.bin
+                if outputs[0] in claimed:
+                    counts['failed'] += 1
+                    emit({'source': relpath, 'status': 'failed',
+                          'error': f"{outputs[0]} is already written for {claimed[outputs[0]]}"})
+                    continue
+                claimed[outputs[0]] = relpath
+                future = pool.submit(convert_file, os.path.join(source_dir, relpath), output_dir, outputs,
+                                     settings, index.get(relpath), width, height, max_source,
+                                     args.orientation, params)
+                futures[future] = (relpath, outputs)
+
+            for future in as_completed(futures):
+                relpath, outputs = futures[future]
+                entry = {'source': relpath, 'frames': outputs}
+                try:
+                    result = future.result()
+                except Exception as e:
+                    new_index.pop(relpath, None)
+                    entry.update(status='failed', error=str(e))
+                else:
+                    new_index[relpath] = {'source_sha256': result['source_sha256'], 'settings': settings}
+                    entry.update(result, seconds=round(result['seconds'], 3))
+                counts[entry['status']] += 1
+                emit(entry)
+    finally:
+        # Images that failed keep no entry, so the next run converts them again
+        write_atomic(os.path.join(output_dir, INDEX_FILENAME), json.dumps(new_index, indent=2).encode())
+        if manifest is not sys.stdout:
+            manifest.close()
+
+    print(f"{counts['converted']} converted, {counts['skipped']} up to date, {counts['failed']} failed "
+          f"in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    sys.exit(1 if counts['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""
+Registry of remote e-paper displays.
+
+Each device is recorded once on the server with its address and panel
+profile (model, native resolution, mounting orientation and the frame codecs
+it accepts), so frames are converted for that exact panel instead of the host
+app's own resolution. A background thread probes every device with a short TCP
+connect; sends to a device whose last probe failed are refused immediately
+with DeviceUnreachable instead of waiting out the transfer timeout. A device
+with a link_port is sent frames over a persistent link (see panel_link.py)
+instead of one HTTP POST per frame.
+
+Devices persist in a JSON state file:
+    {'devices': {name: {address, model, width, height, orientation, codecs, link_port}}}
+"""
+
+import copy
+import json
+import os
+import re
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Native resolution of the panels remote displays are built around
+PANEL_MODELS = {
+    'epd7in3e': (800, 480),
+    'epd13in3f': (1600, 1200),
+}
+
+# Degrees the picture is rotated counter-clockwise to match how the panel is mounted
+ORIENTATIONS = (0, 90, 180, 270)
+
+# Frame encodings the app can produce: 4-bit packed Spectra 6 codes, two pixels per byte
+KNOWN_CODECS = ('packed4',)
+
+DEVICE_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class DeviceError(ValueError):
+    """Raised for invalid device definitions"""
+
+
+class DeviceNotFound(DeviceError):
+    """Raised when a device name is unknown"""
+
+
+class DeviceUnreachable(Exception):
+    """Raised when a device failed its last health probe"""
+
+
+def split_address(address, default_port=80):
+    """Split 'host[:port]' into (host, port)"""
+    host, _, port = address.rpartition(':') if ':' in address else (address, '', '')
+    return host, int(port) if port else default_port
+
+
+def validate_device(data, default_model):
+    """Check and normalize a device definition"""
+    if not isinstance(data, dict):
+        raise DeviceError('A device must be an object')
+
+    address = str(data.get('address', '')).strip()
+    if not address or '/' in address:
+        raise DeviceError('A device needs an address (host or host:port)')
+    try:
+        split_address(address)
+    except ValueError:
+        raise DeviceError(f"Invalid address '{address}'")
+
+    model = data.get('model', default_model)
+    if model not in PANEL_MODELS and not ('width' in data and 'height' in data):
+        raise DeviceError(f"Unknown panel model '{model}', give width and height")
+    default_width, default_height = PANEL_MODELS.get(model, (None, None))
+    try:
+        width = int(data.get('width', default_width))
+        height = int(data.get('height', default_height))
+        orientation = int(data.get('orientation', 0))
+    except (TypeError, ValueError):
+        raise DeviceError('Width, height and orientation must be integers')
+    if width <= 0 or height <= 0 or width % 2:
+        raise DeviceError('Resolution must be positive with an even width')
+    if orientation not in ORIENTATIONS:
+        raise DeviceError(f'Orientation must be one of {ORIENTATIONS}')
+
+    codecs = data.get('codecs', ['packed4'])
+    if not isinstance(codecs, list) or not codecs:
+        raise DeviceError('Codecs must be a non-empty list')
+    if not any(codec in KNOWN_CODECS for codec in codecs):
+        raise DeviceError(f'Device must accept one of {KNOWN_CODECS}')
+
+    link_port = data.get('link_port')
+    if link_port is not None:
+        try:
+            link_port = int(link_port)
+        except (TypeError, ValueError):
+            raise DeviceError('Link port must be an integer')
+        if not 0 < link_port < 65536:
+            raise DeviceError('Link port must be between 1 and 65535')
+
+    return {
+        'address': address,
+        'model': model,
+        'width': width,
+        'height': height,
+        'orientation': orientation,
+        'codecs': codecs,
+        'link_port': link_port,
+    }
+
+
+def profile_key(device):
+    """Everything about a device that changes the frame it needs"""
+    codec = next(codec for codec in device['codecs'] if codec in KNOWN_CODECS)
+    return f"{device['width']}x{device['height']}-o{device['orientation']}-{codec}"
+
+
+class DeviceRegistry:
+    """Known remote displays and their last probed reachability"""
+
+    def __init__(self, state_file, default_model, probe_interval=60, probe_timeout=2.0):
+        self.state_file = state_file
+        self.default_model = default_model
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self._devices = {}
+        self._health = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._load()
+
+    # ---- persistence ----
+
+    def _load(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'r') as f:
+                self._devices = json.load(f).get('devices', {})
+        except (OSError, ValueError) as e:
+            print(f"Could not load devices from {self.state_file}: {e}")
+
+    def _save(self):
+        temp_path = self.state_file + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'devices': self._devices}, f, indent=2)
+        os.replace(temp_path, self.state_file)
+
+    # ---- device management ----
+
+    def _with_health(self, name, device):
+        device = copy.deepcopy(device)
+        device['name'] = name
+        device['profile'] = profile_key(device)
+        device['health'] = dict(self._health.get(name, {'reachable': None, 'checked': None}))
+        return device
+
+    def list_devices(self):
+        with self._lock:
+            return [self._with_health(name, device) for name, device in sorted(self._devices.items())]
+
+    def get(self, name):
+        with self._lock:
+            if name not in self._devices:
+                raise DeviceNotFound(f"Unknown device '{name}'")
+            return self._with_health(name, self._devices[name])
+
+    def find_by_address(self, address):
+        """Return the device registered at an address, or None"""
+        with self._lock:
+            for name, device in self._devices.items():
+                if device['address'] == address:
+                    return self._with_health(name, device)
+        return None
+
+    def save_device(self, name, data):
+        """Create or replace a device and probe it in the background"""
+        if not DEVICE_NAME.match(name or ''):
+            raise DeviceError('Device names may only use letters, digits, - and _')
+        device = validate_device(data, self.default_model)
+        with self._lock:
+            if self._devices.get(name, {}).get('address') != device['address']:
+                self._health.pop(name, None)
+            self._devices[name] = device
+            self._save()
+        self._wake.set()
+        return self.get(name)
+
+    def delete(self, name):
+        with self._lock:
+            if self._devices.pop(name, None) is None:
+                raise DeviceNotFound(f"Unknown device '{name}'")
+            self._health.pop(name, None)
+            self._save()
+
+    # ---- health ----
+
+    def probe(self, name):
+        """Check a device now with a TCP connect and record the result"""
+        with self._lock:
+            if name not in self._devices:
+                raise DeviceNotFound(f"Unknown device '{name}'")
+            address = self._devices[name]['address']
+
+        start = time.perf_counter()
+        error = None
+        try:
+            with socket.create_connection(split_address(address), timeout=self.probe_timeout):
+                pass
+        except OSError as e:
+            error = str(e) or e.__class__.__name__
+        latency = round(time.perf_counter() - start, 4) if error is None else None
+        self.record(name, error, latency)
+        return self.get(name)['health']
+
+    def record(self, name, error=None, latency=None):
+        """Record a successful (error None) or failed contact with a device"""
+        now = time.time()
+        with self._lock:
+            # The device may have been deleted while it was being contacted
+            if name not in self._devices:
+                return
+            health = self._health.setdefault(name, {})
+            health['checked'] = now
+            health['reachable'] = error is None
+            health['error'] = error
+            if error is None:
+                health['last_seen'] = now
+            if latency is not None:
+                health['latency'] = latency
+
+    def require_reachable(self, name):
+        """Raise DeviceUnreachable right away if the device is known to be down"""
+        with self._lock:
+            health = self._health.get(name)
+        if health is None or health.get('checked') is None:
+            # Never probed yet: one short connect instead of a long send timeout
+            health = self.probe(name)
+        if health['reachable'] is False:
+            raise DeviceUnreachable(f"Device '{name}' is unreachable ({health.get('error')}), "
+                                    f"last checked {time.time() - health['checked']:.0f}s ago")
+
+    def start(self):
+        """Start probing all devices every probe_interval seconds"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='device-probes', daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=8, thread_name_prefix='device-probe') as pool:
+            while not self._stopping:
+                with self._lock:
+                    names = list(self._devices)
+                for name, result in zip(names, pool.map(self._probe_quietly, names)):
+                    if result is not None:
+                        print(f"Device '{name}' is unreachable: {result}")
+                self._wake.wait(self.probe_interval)
+                self._wake.clear()
+
+    def _probe_quietly(self, name):
+        """Probe for the background loop; returns the error, if the device went down"""
+        try:
+            was_reachable = self._health.get(name, {}).get('reachable')
+            health = self.probe(name)
+        except DeviceNotFound:
+            return None
+        return health['error'] if was_reachable is not False and not health['reachable'] else None
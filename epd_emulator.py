@@ -0,0 +1,215 @@
+"""
+Hardware-free stand-in for the Waveshare Spectra 6 e-paper drivers.
+
+Implements the same EPD interface as waveshare_epd.epd7in3e / epd13in3f
+(init, getbuffer, display, Clear, sleep) so the Flask apps can run, be
+load-tested and profiled without a Pi. Every frame received by display()
+is validated and decoded to <model>-latest.png, and the panel's busy-wait and
+refresh latency are simulated. The PNG is encoded after the panel is released,
+so lock and latency timings only cover what the hardware does; the encode
+time is reported separately in timings['encode']. Timestamped copies are only
+kept if a history is configured, and then only the newest ones.
+
+Timing and output are configured through environment variables:
+    EINK_EMULATOR_OUTPUT_DIR     where decoded frames are written
+    EINK_EMULATOR_HISTORY        timestamped frames kept next to -latest.png (0 = none)
+    EINK_EMULATOR_TIME_SCALE     multiplier for all simulated delays (0 = instant)
+    EINK_EMULATOR_INIT_S         reset + power-on time of init()
+    EINK_EMULATOR_REFRESH_S      panel refresh time after display()/Clear()
+    EINK_EMULATOR_SPI_BPS        simulated SPI throughput in bytes per second
+    EINK_EMULATOR_BUSY_POLL_S    BUSY pin polling interval
+"""
+
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+from PIL import Image, ImageChops
+
+# Panel geometry and typical timings for each emulated model
+MODELS = {
+    'epd7in3e': {'width': 800, 'height': 480, 'init_seconds': 0.4, 'refresh_seconds': 19.0},
+    'epd13in3f': {'width': 1600, 'height': 1200, 'init_seconds': 0.6, 'refresh_seconds': 25.0},
+}
+
+# Nibble codes accepted by the controller and the color each one shows on the panel
+PANEL_COLORS = {
+    0x0: (0, 0, 0),
+    0x1: (255, 255, 255),
+    0x2: (255, 255, 0),
+    0x3: (200, 80, 50),
+    0x5: (100, 120, 180),
+    0x6: (200, 200, 80),
+}
+
+# Same palette Waveshare's getbuffer() quantizes against (index == nibble code)
+DRIVER_PALETTE = (0, 0, 0, 255, 255, 255, 255, 255, 0, 255, 0, 0,
+                  0, 0, 0, 0, 0, 255, 0, 255, 0)
+
+DEFAULT_OUTPUT_DIR = os.path.expanduser('~/eink_display/emulator')
+
+# Bytes whose two nibbles are both valid color codes
+VALID_BYTES = bytes((hi << 4) | lo for hi in PANEL_COLORS for lo in PANEL_COLORS)
+HIGH_NIBBLE = bytes(b >> 4 for b in range(256))
+LOW_NIBBLE = bytes(b & 0x0F for b in range(256))
+
+# Only one frame can be in flight on a physical panel at a time
+_panel_lock = threading.Lock()
+# Frames are written to disk one at a time, after the panel lock is released
+_save_lock = threading.Lock()
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, '') else default
+
+
+def unpack_frame(data, width, height):
+    """Expand a packed 4-bit frame into a palette image of nibble codes"""
+    data = bytes(data)
+    pixels = bytearray(len(data) * 2)
+    pixels[0::2] = data.translate(HIGH_NIBBLE)
+    pixels[1::2] = data.translate(LOW_NIBBLE)
+
+    img = Image.frombytes('P', (width, height), bytes(pixels))
+    palette = [0] * (256 * 3)
+    for code, rgb in PANEL_COLORS.items():
+        palette[code * 3:code * 3 + 3] = rgb
+    img.putpalette(palette)
+    return img
+
+
+class EPD:
+    """Emulated Spectra 6 panel with the Waveshare driver interface"""
+
+    def __init__(self, model='epd7in3e', output_dir=None, time_scale=None,
+                 init_seconds=None, refresh_seconds=None, spi_bytes_per_second=None,
+                 busy_poll_seconds=None, history=None):
+        if model not in MODELS:
+            raise ValueError(f"Unknown panel model '{model}' (expected one of {', '.join(MODELS)})")
+
+        spec = MODELS[model]
+        self.model = model
+        self.width = spec['width']
+        self.height = spec['height']
+        self.buffer_size = self.width * self.height // 2
+
+        self.output_dir = output_dir or os.environ.get('EINK_EMULATOR_OUTPUT_DIR', DEFAULT_OUTPUT_DIR)
+        self.time_scale = time_scale if time_scale is not None else _env_float('EINK_EMULATOR_TIME_SCALE', 1.0)
+        self.init_seconds = init_seconds if init_seconds is not None else _env_float('EINK_EMULATOR_INIT_S', spec['init_seconds'])
+        self.refresh_seconds = refresh_seconds if refresh_seconds is not None else _env_float('EINK_EMULATOR_REFRESH_S', spec['refresh_seconds'])
+        self.spi_bytes_per_second = spi_bytes_per_second if spi_bytes_per_second is not None else _env_float('EINK_EMULATOR_SPI_BPS', 1000000.0)
+        self.busy_poll_seconds = busy_poll_seconds if busy_poll_seconds is not None else _env_float('EINK_EMULATOR_BUSY_POLL_S', 0.01)
+        self.history = history if history is not None else int(_env_float('EINK_EMULATOR_HISTORY', 0))
+
+        self.awake = False
+        self.frames_displayed = 0
+        self.last_frame_path = None
+        self.timings = {}
+
+    def _busy_wait(self, seconds):
+        """Poll the simulated BUSY pin until the controller is idle"""
+        deadline = time.monotonic() + seconds * self.time_scale
+        while time.monotonic() < deadline:
+            time.sleep(min(self.busy_poll_seconds, max(deadline - time.monotonic(), 0)))
+
+    def init(self):
+        start = time.perf_counter()
+        self._busy_wait(self.init_seconds)
+        self.awake = True
+        self.timings['init'] = time.perf_counter() - start
+        return 0
+
+    def getbuffer(self, image):
+        """Quantize a PIL image to the panel palette and pack two pixels per byte"""
+        imwidth, imheight = image.size
+        if imwidth == self.width and imheight == self.height:
+            image_temp = image
+        elif imwidth == self.height and imheight == self.width:
+            image_temp = image.rotate(90, expand=True)
+        else:
+            raise ValueError(f"Invalid image dimensions: {imwidth}x{imheight}, expected {self.width}x{self.height}")
+
+        pal_image = Image.new('P', (1, 1))
+        pal_image.putpalette(DRIVER_PALETTE + (0, 0, 0) * 249)
+        codes = image_temp.convert('RGB').quantize(palette=pal_image).tobytes('raw')
+
+        high = Image.frombytes('L', (self.width // 2, self.height), codes[0::2]).point(lambda v: v << 4)
+        low = Image.frombytes('L', (self.width // 2, self.height), codes[1::2])
+        return list(ImageChops.add(high, low).tobytes())
+
+    def validate(self, image):
+        """Check a packed frame's size and nibble codes, returning it as bytes"""
+        data = bytes(image)
+        if len(data) != self.buffer_size:
+            raise ValueError(f"Invalid buffer size: {len(data)} bytes (expected {self.buffer_size})")
+
+        invalid = data.translate(None, VALID_BYTES)
+        if invalid:
+            offset = next(i for i, b in enumerate(data) if b == invalid[0])
+            raise ValueError(f"Invalid color byte 0x{invalid[0]:02x} at offset {offset}")
+        return data
+
+    def _refresh(self, data):
+        if not self.awake:
+            raise RuntimeError("Panel is asleep, call init() before sending a frame")
+        if not _panel_lock.acquire(blocking=False):
+            raise RuntimeError("Panel is busy with another refresh")
+
+        try:
+            start = time.perf_counter()
+            self._busy_wait(len(data) / self.spi_bytes_per_second)
+            self.timings['transfer'] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            self._busy_wait(self.refresh_seconds)
+            self.timings['refresh'] = time.perf_counter() - start
+            self.frames_displayed += 1
+        finally:
+            _panel_lock.release()
+
+        # Real hardware has no PNG to write, so this stays out of the panel lock and its timings
+        start = time.perf_counter()
+        with _save_lock:
+            self._save_frame(data)
+        self.timings['encode'] = time.perf_counter() - start
+
+    def _save_frame(self, data):
+        os.makedirs(self.output_dir, exist_ok=True)
+        img = unpack_frame(data, self.width, self.height)
+        latest_path = os.path.join(self.output_dir, f'{self.model}-latest.png')
+        temp_path = f'{latest_path}.{threading.get_ident()}.tmp'
+        img.save(temp_path, format='PNG')
+        if self.history > 0:
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+            self.last_frame_path = os.path.join(self.output_dir, f'{self.model}-{stamp}.png')
+            shutil.copyfile(temp_path, self.last_frame_path)
+            self._prune_history()
+        else:
+            self.last_frame_path = latest_path
+        os.replace(temp_path, latest_path)
+        print(f"[emulator] Frame written to {self.last_frame_path}")
+
+    def _prune_history(self):
+        """Delete all but the newest history timestamped frames of this model"""
+        prefix = f'{self.model}-'
+        # Timestamps sort chronologically; -latest.png and temp files do not start with a digit
+        frames = sorted(name for name in os.listdir(self.output_dir) if name.startswith(prefix)
+                        and name.endswith('.png') and name[len(prefix):][:1].isdigit())
+        for name in frames[:-self.history]:
+            try:
+                os.remove(os.path.join(self.output_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def display(self, image):
+        self._refresh(self.validate(image))
+
+    def Clear(self, color=0x11):
+        self._refresh(self.validate(bytes([color]) * self.buffer_size))
+
+    def sleep(self):
+        self._busy_wait(0.1)
+        self.awake = False
@@ -0,0 +1,87 @@
+"""
+Reusable receive buffer for packed frames pushed to /display/binary.
+
+A pushed frame is read from the request stream straight into one
+preallocated bytearray through a memoryview, instead of being read into a new
+bytes object (and copied again by request.data). Each chunk is checked as it
+arrives: a body of the wrong size, an image file posted by mistake, or a byte
+that is not a pair of Spectra 6 color codes is rejected without reading the
+rest. The caller gets a memoryview of the buffer, which the driver can send
+without another copy.
+"""
+
+import threading
+
+# Panel color codes; any other nibble is not a valid pixel
+COLOR_CODES = (0x0, 0x1, 0x2, 0x3, 0x5, 0x6)
+VALID_BYTES = bytes((high << 4) | low for high in COLOR_CODES for low in COLOR_CODES)
+
+# Common mistakes: posting the source image instead of a packed frame
+IMAGE_SIGNATURES = {
+    b'\x89PNG': 'a PNG image',
+    b'\xff\xd8\xff': 'a JPEG image',
+    b'GIF8': 'a GIF image',
+    b'BM': 'a BMP image',
+}
+
+CHUNK_SIZE = 64 * 1024
+
+
+class FrameFormatError(ValueError):
+    """Raised when a pushed frame has the wrong size or content"""
+
+
+class FrameBuffer:
+    """One preallocated frame buffer, filled from a stream while holding its lock"""
+
+    def __init__(self, size, chunk_size=CHUNK_SIZE):
+        self.size = size
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+
+    def _size_error(self, received):
+        return FrameFormatError(f'Invalid data size: {received} bytes (expected {self.size})')
+
+    def receive(self, stream, length=None):
+        """Fill the buffer from a stream and return a memoryview of the frame.
+
+        length is the declared body size, if known, so a wrong size is refused
+        before reading anything. Call with self.lock held; the view is only
+        valid until the next receive.
+        """
+        if length is not None and length != self.size:
+            raise self._size_error(length)
+
+        view = self._view
+        readinto = getattr(stream, 'readinto', None)
+        received = 0
+        while received < self.size:
+            end = min(received + self.chunk_size, self.size)
+            if readinto is not None:
+                count = readinto(view[received:end])
+            else:
+                data = stream.read(end - received)
+                count = len(data)
+                view[received:received + count] = data
+            if not count:
+                raise self._size_error(received)
+
+            if received == 0:
+                for signature, kind in IMAGE_SIGNATURES.items():
+                    if view[:len(signature)] == signature:
+                        raise FrameFormatError(f'Received {kind}, not a packed frame; '
+                                               f'upload images to /upload instead')
+            # Deleting every valid byte leaves only the invalid ones; the chunk copy
+            # is at most chunk_size and gone once checked
+            chunk = view[received:received + count].tobytes()
+            invalid = chunk.translate(None, VALID_BYTES)
+            if invalid:
+                raise FrameFormatError(f'Invalid color byte 0x{invalid[0]:02x} '
+                                       f'at offset {received + chunk.index(invalid[0])}')
+            received += count
+
+        if length is None and stream.read(1):
+            raise FrameFormatError(f'Invalid data size: more than {self.size} bytes (expected {self.size})')
+        return view
@@ -0,0 +1,435 @@
+"""
+Image to e-paper frame pipeline shared by the display apps and batch workers.
+
+Everything here is parameterized by panel size and free of Flask and
+hardware state, so it can run in worker processes as well as in the apps.
+
+A frame is produced in stages:
+    1. base frame   decode, then crop, scale and turn to the panel orientation
+                    in one planned resample (depends only on the source and
+                    the panel geometry)
+    2. finish       rotate 180 and enhance brightness / contrast / saturation
+    3. pack         dither to the 6-color palette and pack two pixels per byte
+Base frames can be kept in a BaseFrameCache, so a change of enhancement
+settings on the same image only pays for stages 2 and 3.
+"""
+
+import functools
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageChops, ImageEnhance, ImageOps, ImageStat
+
+# 6-color palette: display RGB and the 4-bit code the panel expects
+PALETTE = {
+    'black': (0, 0, 0, 0x0),
+    'white': (255, 255, 255, 0x1),
+    'yellow': (255, 255, 0, 0x2),
+    'red': (200, 80, 50, 0x3),
+    'blue': (100, 120, 180, 0x5),
+    'green': (200, 200, 80, 0x6)
+}
+
+THUMBNAIL_SIZE = (150, 90)
+
+# Thumbnails per row of a contact sheet
+SHEET_COLUMNS = 10
+
+# Large reductions first shrink by an integer factor with box averaging, as long as
+# at least this many times the output size remains for the final LANCZOS pass
+RESIZE_REDUCING_GAP = 3.0
+
+# Live slider previews are rendered at 1/PREVIEW_SCALE of the panel resolution
+PREVIEW_SCALE = 4
+
+# Source digests remembered for files with no cached base frame, least recently used dropped first
+MAX_IDLE_DIGESTS = 64
+
+# Split a packed byte back into its two pixel codes
+HIGH_NIBBLE = bytes(b >> 4 for b in range(256))
+LOW_NIBBLE = bytes(b & 0x0F for b in range(256))
+
+# How a frame is turned to match a panel mounted at each orientation
+ORIENTATION_TRANSPOSE = {
+    90: Image.Transpose.ROTATE_90,
+    180: Image.Transpose.ROTATE_180,
+    270: Image.Transpose.ROTATE_270,
+}
+
+
+@functools.lru_cache(maxsize=1)
+def get_palette_image():
+    """Build the quantization palette image once"""
+    palette_data = []
+    for r, g, b, code in PALETTE.values():
+        palette_data.extend((r, g, b))
+    palette_img = Image.new('P', (1, 1))
+    palette_img.putpalette(palette_data + [0] * (256 * 3 - len(palette_data)))
+    return palette_img
+
+
+@functools.lru_cache(maxsize=1)
+def get_palette_lookup():
+    """Map each palette RGB value straight to its panel code"""
+    return {(r, g, b): code for r, g, b, code in PALETTE.values()}
+
+
+@functools.lru_cache(maxsize=1)
+def get_index_codes():
+    """Translation tables from quantized palette index to panel code, shifted high and low"""
+    palette = get_palette_image().getpalette()
+    palette_lookup = get_palette_lookup()
+    codes = []
+    for index in range(256):
+        rgb = tuple(palette[index * 3:index * 3 + 3])
+        codes.append(palette_lookup[rgb] if rgb in palette_lookup else rgb_to_palette_code(*rgb))
+    return bytes(code << 4 for code in codes), bytes(codes)
+
+
+def rgb_to_palette_code(r, g, b):
+    """Find closest color in 6-color palette"""
+    min_distance = float('inf')
+    closest_code = 0x1
+
+    for color_name, (pr, pg, pb, code) in PALETTE.items():
+        distance = (r - pr)**2 + (g - pg)**2 + (b - pb)**2
+        if distance < min_distance:
+            min_distance = distance
+            closest_code = code
+
+    return closest_code
+
+
+def crop_to_fill(img, width, height):
+    """Resize and center-crop an image so it exactly covers width x height"""
+    if img.size == (width, height):
+        return img
+
+    img_ratio = img.width / img.height
+    display_ratio = width / height
+
+    if img_ratio > display_ratio:
+        new_height = height
+        new_width = int(height * img_ratio)
+    else:
+        new_width = width
+        new_height = int(width / img_ratio)
+
+    img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+    left = (new_width - width) // 2
+    top = (new_height - height) // 2
+    return img.crop((left, top, left + width, top + height))
+
+
+def quantize(img):
+    """Dither an RGB image to the 6-color palette"""
+    return img.quantize(palette=get_palette_image(), dither=Image.Dither.FLOYDSTEINBERG)
+
+
+def enhance(img, brightness=1.0, contrast=1.4, saturation=1.5, mean=None):
+    """Apply brightness, contrast and saturation for the E Ink panel.
+
+    mean fixes the gray level contrast is stretched around; by default it is the
+    brightened image's own mean, so a region of a larger frame passes the frame's.
+    """
+    # Increase brightness
+    enhancer = ImageEnhance.Brightness(img)
+    img = enhancer.enhance(brightness)
+
+    # Increase contrast
+    if mean is None:
+        enhancer = ImageEnhance.Contrast(img)
+        img = enhancer.enhance(contrast)
+    else:
+        img = Image.blend(Image.new('RGB', img.size, (mean, mean, mean)), img, contrast)
+
+    # Increase color saturation
+    enhancer = ImageEnhance.Color(img)
+    return enhancer.enhance(saturation)
+
+
+def contrast_mean(img, brightness=1.0):
+    """Gray level enhance() stretches contrast around for img"""
+    img = ImageEnhance.Brightness(img).enhance(brightness)
+    return int(ImageStat.Stat(img.convert('L')).mean[0] + 0.5)
+
+
+def pack_codes(img):
+    """Dither an RGB image to the palette and pack its panel codes, two pixels per byte"""
+    width, height = img.size
+    indices = quantize(img).tobytes()
+    high_codes, low_codes = get_index_codes()
+
+    # Even pixels become the high nibble and odd pixels the low nibble of each byte;
+    # the nibbles never overlap, so adding the two half-width images packs them
+    high = Image.frombytes('L', (width // 2, height), indices[0::2].translate(high_codes))
+    low = Image.frombytes('L', (width // 2, height), indices[1::2].translate(low_codes))
+    return ImageChops.add(high, low).tobytes()
+
+
+def convert_to_binary(img, width, height):
+    """Convert PIL Image to binary format for remote E-Paper display"""
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    # Use dithering with the 6-color palette
+    return pack_codes(crop_to_fill(img, width, height))
+
+
+def plan_geometry(source_width, source_height, width, height):
+    """Work out how to turn a source into a width x height frame with one resample.
+
+    Returns (rotate, box, size): whether the result needs a 90 degree turn to match
+    the panel, the centered crop-to-fill box in source coordinates, and the size to
+    resample that box to before the turn.
+    """
+    # Auto-rotate so the image matches the panel (portrait to landscape on landscape panels)
+    rotate = (source_height > source_width) != (height > width)
+    if rotate:
+        # Plan in the source's own orientation and turn the small result afterwards
+        width, height = height, width
+
+    # Largest box with the frame's aspect ratio, centered in the source
+    if source_width * height > width * source_height:
+        box_width = source_height * width / height
+        left = (source_width - box_width) / 2
+        box = (left, 0, left + box_width, source_height)
+    else:
+        box_height = source_width * height / width
+        top = (source_height - box_height) / 2
+        box = (0, top, source_width, top + box_height)
+    return rotate, box, (width, height)
+
+
+def load_base_frame(image_path, width, height, max_source=None):
+    """Stage 1: decode and normalize an image's geometry to exactly width x height RGB.
+
+    max_source caps the decoded size: JPEGs are decoded at the smallest DCT scale that
+    still covers it (without it, at twice the frame size). The crop and scale then run
+    as a single resample straight to the frame size, and a portrait source is turned
+    with a lossless transpose of the finished frame.
+    """
+    img = Image.open(image_path)
+    rotate = (img.height > img.width) != (height > width)
+    limit = max_source or (width * 2, height * 2)
+    if rotate:
+        limit = (limit[1], limit[0])
+    scale = min(limit[0] / img.width, limit[1] / img.height, 1)
+    if scale < 1:
+        img.draft('RGB', (int(img.width * scale), int(img.height * scale)))
+
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    rotate, box, size = plan_geometry(img.width, img.height, width, height)
+    img = img.resize(size, Image.Resampling.LANCZOS, box=box, reducing_gap=RESIZE_REDUCING_GAP)
+    if rotate:
+        img = img.transpose(Image.Transpose.ROTATE_90)
+        print(f"Rotated image to match the panel orientation")
+    return img
+
+
+def source_digest(image_path):
+    """Content hash of a source file"""
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BaseFrameCache:
+    """Size-bounded LRU of stage 1 base frames, keyed by source content and panel geometry"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._frames = OrderedDict()
+        # path -> (mtime_ns, size, digest), so unchanged files are not re-hashed; kept
+        # for every cached frame's source plus the MAX_IDLE_DIGESTS most recent others
+        self._digests = OrderedDict()
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            return {'max_bytes': self.max_bytes, 'size_bytes': self.size_bytes,
+                    'frames': len(self._frames), 'hits': self.hits, 'misses': self.misses}
+
+    def _digest(self, image_path):
+        stat = os.stat(image_path)
+        with self._lock:
+            known = self._digests.get(image_path)
+            if known and known[:2] == (stat.st_mtime_ns, stat.st_size):
+                self._digests.move_to_end(image_path)
+                return known[2]
+        digest = source_digest(image_path)
+        with self._lock:
+            self._digests[image_path] = (stat.st_mtime_ns, stat.st_size, digest)
+            self._digests.move_to_end(image_path)
+            self._trim_digests()
+        return digest
+
+    def _trim_digests(self):
+        """Forget the oldest digests of files with no cached frame (lock held)"""
+        cached = {key[0] for key in self._frames}
+        idle = [path for path, known in self._digests.items() if known[2] not in cached]
+        for path in idle[:max(len(idle) - MAX_IDLE_DIGESTS, 0)]:
+            del self._digests[path]
+
+    def _key(self, image_path, width, height, max_source):
+        return (self._digest(image_path), width, height, tuple(max_source) if max_source else None)
+
+    def __contains__(self, entry):
+        """True if (image_path, width, height, max_source) has a cached base frame"""
+        key = self._key(*entry)
+        with self._lock:
+            return key in self._frames
+
+    def get(self, image_path, width, height, max_source=None):
+        """Return the base frame, loading and caching it on a miss. Callers must not modify it."""
+        key = self._key(image_path, width, height, max_source)
+        with self._lock:
+            img = self._frames.get(key)
+            if img is not None:
+                self._frames.move_to_end(key)
+                self.hits += 1
+                return img
+            self.misses += 1
+
+        img = load_base_frame(image_path, width, height, max_source)
+        cost = img.width * img.height * len(img.getbands())
+        with self._lock:
+            if key not in self._frames and cost <= self.max_bytes:
+                self._frames[key] = img
+                self.size_bytes += cost
+                while self.size_bytes > self.max_bytes:
+                    _, evicted = self._frames.popitem(last=False)
+                    self.size_bytes -= evicted.width * evicted.height * len(evicted.getbands())
+        return img
+
+
+def base_frame(image_path, width, height, max_source=None, base_cache=None):
+    """Stage 1 through the cache when there is one"""
+    if base_cache is None:
+        return load_base_frame(image_path, width, height, max_source)
+    return base_cache.get(image_path, width, height, max_source)
+
+
+def process_image(image_path, width, height, max_source, brightness=1.0, contrast=1.4,
+                  saturation=1.5, rotate_180=False, base_cache=None):
+    """Process image to fit a width x height display - crop to fill with enhancement"""
+    img = base_frame(image_path, width, height, max_source, base_cache)
+
+    # Rotate 180 degrees if requested
+    if rotate_180:
+        img = img.transpose(Image.Transpose.ROTATE_180)
+        print(f"Rotated image 180 degrees")
+
+    # Enhance image for E Ink display
+    print(f"Enhancing: brightness={brightness}, contrast={contrast}, saturation={saturation}")
+    return enhance(img, brightness, contrast, saturation)
+
+
+def low_res_preview(image_path, width, height, brightness=1.0, contrast=1.4, saturation=1.5,
+                    scale=PREVIEW_SCALE, base_cache=None):
+    """Dithered preview of a width x height canvas at 1/scale resolution, as PNG bytes"""
+    base = base_frame(image_path, max(width // scale, 2), max(height // scale, 2), base_cache=base_cache)
+    img = quantize(enhance(base, brightness, contrast, saturation))
+
+    img_io = io.BytesIO()
+    img.save(img_io, 'PNG')
+    return img_io.getvalue()
+
+
+def pack_for_panel(image_path, width, height, max_source, orientation=0, base_cache=None, **params):
+    """Process and pack an image for a panel of native width x height mounted at orientation degrees"""
+    canvas_width, canvas_height = (height, width) if orientation in (90, 270) else (width, height)
+    img = process_image(image_path, canvas_width, canvas_height, max_source, base_cache=base_cache, **params)
+    if orientation:
+        img = img.transpose(ORIENTATION_TRANSPOSE[orientation])
+    return convert_to_binary(img, width, height)
+
+
+def unpack_frame(frame, width, height):
+    """Expand a packed frame back into a palette image showing the panel colors"""
+    frame = bytes(frame)
+    codes = bytearray(len(frame) * 2)
+    codes[0::2] = frame.translate(HIGH_NIBBLE)
+    codes[1::2] = frame.translate(LOW_NIBBLE)
+
+    img = Image.frombytes('P', (width, height), bytes(codes))
+    palette = [0] * (256 * 3)
+    for r, g, b, code in PALETTE.values():
+        palette[code * 3:code * 3 + 3] = (r, g, b)
+    img.putpalette(palette)
+    return img
+
+
+def frame_to_png(frame, width, height, orientation=0, rotate_180=False):
+    """Render a packed frame as a PNG, turned upright the way a viewer sees the mounted panel"""
+    img = unpack_frame(frame, width, height)
+    if orientation:
+        img = img.transpose(ORIENTATION_TRANSPOSE[(360 - orientation) % 360])
+    if rotate_180:
+        img = img.transpose(Image.Transpose.ROTATE_180)
+
+    img_io = io.BytesIO()
+    img.save(img_io, 'PNG')
+    return img_io.getvalue()
+
+
+def make_preview(image_path, width, height, quality=85):
+    """Render a JPEG of an image at no more than the panel's resolution and return its bytes.
+
+    The long side of the image is fitted to the long side of the panel, so a browser
+    preview shows as much detail as the panel can, in kilobytes instead of the upload's
+    megabytes.
+    """
+    img = Image.open(image_path)
+    if (img.height > img.width) != (height > width):
+        width, height = height, width
+    img.draft('RGB', (width, height))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    img.thumbnail((width, height), Image.Resampling.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP)
+
+    img_io = io.BytesIO()
+    img.save(img_io, 'JPEG', quality=quality, progressive=True)
+    return img_io.getvalue()
+
+
+def make_contact_sheet(thumbnail_paths, cell=THUMBNAIL_SIZE, columns=SHEET_COLUMNS, quality=85):
+    """Render thumbnails into one JPEG grid and return its bytes.
+
+    Thumbnail i fills the cell at column i % columns, row i // columns, cropped
+    to the cell's shape; a None path leaves its cell blank.
+    """
+    rows = max((len(thumbnail_paths) + columns - 1) // columns, 1)
+    sheet = Image.new('RGB', (columns * cell[0], rows * cell[1]), (224, 224, 224))
+    for i, path in enumerate(thumbnail_paths):
+        if path is None:
+            continue
+        with Image.open(path) as img:
+            thumbnail = ImageOps.fit(img.convert('RGB'), cell, Image.Resampling.LANCZOS)
+        sheet.paste(thumbnail, (i % columns * cell[0], i // columns * cell[1]))
+
+    img_io = io.BytesIO()
+    sheet.save(img_io, 'JPEG', quality=quality)
+    return img_io.getvalue()
+
+
+def make_thumbnail(image_path, size=THUMBNAIL_SIZE):
+    """Render a small JPEG thumbnail of an image and return its bytes"""
+    img = Image.open(image_path)
+    img.thumbnail(size, Image.Resampling.LANCZOS)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    img_io = io.BytesIO()
+    img.save(img_io, 'JPEG', quality=85)
+    return img_io.getvalue()
@@ -0,0 +1,94 @@
+"""
+Published frames for pull-mode remote displays.
+
+Each device has at most one current packed frame. Frames are kept in memory
+with a precomputed strong ETag so a waking device can be answered (usually
+with a 304) without touching the disk or the image pipeline, and are written
+through to disk so they survive restarts.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+
+DEVICE_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def valid_device_name(device):
+    return bool(DEVICE_NAME.match(device or ''))
+
+
+def frame_etag(frame):
+    return hashlib.sha256(frame).hexdigest()[:32]
+
+
+class FrameStore:
+    """Current packed frame per device, cached in memory and on disk"""
+
+    def __init__(self, directory, on_publish=None):
+        self.directory = directory
+        # on_publish(device, etag, size) runs after each publish, e.g. to notify subscribers
+        self.on_publish = on_publish
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def _path(self, device):
+        return os.path.join(self.directory, f'{device}.bin')
+
+    def publish(self, device, frame):
+        """Make frame the device's current frame and return its ETag"""
+        if not valid_device_name(device):
+            raise ValueError(f"Invalid device name '{device}'")
+        frame = bytes(frame)
+        entry = {'frame': frame, 'etag': frame_etag(frame), 'published': time.time()}
+
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=f'.{device}.', suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(frame)
+            # Concurrent publishes each write their own temp file; the lock keeps the
+            # file on disk and the cached entry from the same publish
+            with self._lock:
+                os.replace(temp_path, self._path(device))
+                self._frames[device] = entry
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        if self.on_publish is not None:
+            self.on_publish(device, entry['etag'], len(frame))
+        return entry['etag']
+
+    def get(self, device):
+        """Return {'frame', 'etag', 'published'} for a device, or None"""
+        with self._lock:
+            entry = self._frames.get(device)
+        if entry is not None or not valid_device_name(device):
+            return entry
+
+        path = self._path(device)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            frame = f.read()
+        entry = {'frame': frame, 'etag': frame_etag(frame), 'published': os.path.getmtime(path)}
+        with self._lock:
+            return self._frames.setdefault(device, entry)
+
+    def info(self, device):
+        """Return (etag, size) of a device's current frame, or None"""
+        entry = self.get(device)
+        return None if entry is None else (entry['etag'], len(entry['frame']))
+
+    def devices(self):
+        """List devices with a published frame, including ones only on disk"""
+        names = set()
+        if os.path.isdir(self.directory):
+            names.update(name[:-4] for name in os.listdir(self.directory) if name.endswith('.bin'))
+        with self._lock:
+            names.update(self._frames)
+        return sorted(names)
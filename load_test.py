@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Concurrent load test for the e-ink display Flask app.
+
+Drives /upload, /display/<filename>, /images, /thumbnail/<filename> and
+/send_to_remote with a configurable number of workers and a weighted request
+mix, then reports throughput, latency percentiles and error rates per
+endpoint. Remote sends target a bundled stand-in display (remote_standin.py)
+started in-process unless --remote-ip points at a real device.
+
+Run the app with EINK_EPD_DRIVER=emulator to load-test without a panel:
+    python3 load_test.py --url http://localhost:5000 --concurrency 10 --requests 200 \\
+        --mix upload=1,display=2,images=4,thumbnail=4,remote=1 --images 800x480,4000x3000
+"""
+
+import argparse
+import io
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+
+import remote_standin
+
+ENDPOINTS = ('upload', 'display', 'images', 'thumbnail', 'remote')
+DEFAULT_MIX = 'upload=1,display=2,images=4,thumbnail=4,remote=1'
+DEFAULT_IMAGES = '800x480,1920x1080,4000x3000'
+
+
+def parse_mix(text):
+    """Parse 'upload=1,images=4' into a list of (endpoint, weight)"""
+    mix = []
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint '{name}' (expected one of {', '.join(ENDPOINTS)})")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def parse_sizes(text):
+    """Parse '800x480,4000x3000' into a list of (width, height)"""
+    sizes = []
+    for item in text.split(','):
+        width, _, height = item.lower().partition('x')
+        sizes.append((int(width), int(height)))
+    return sizes
+
+
+def make_test_image(width, height, fmt='JPEG'):
+    """Generate a colorful test image so dithering does real work"""
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 64)
+    img = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    buf = io.BytesIO()
+    img.save(buf, fmt, quality=90)
+    return buf.getvalue()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class LoadTest:
+    """Issues weighted random requests against the app and records results"""
+
+    def __init__(self, base_url, mix, images, remote_ip, enhancement, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.mix = mix
+        self.images = images
+        self.remote_ip = remote_ip
+        self.enhancement = enhancement
+        self.timeout = timeout
+        self.filenames = []
+        self.results = defaultdict(list)
+        self.errors = defaultdict(list)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def prepare(self):
+        """Upload one copy of each test image so display/thumbnail have targets"""
+        for name, data in self.images.items():
+            response = self.session().post(f'{self.base_url}/upload', files={'file': (name, data)},
+                                           data=self.enhancement, timeout=self.timeout)
+            if response.status_code != 200:
+                raise RuntimeError(f'Failed to seed {name}: {response.status_code} {response.text[:200]}')
+            self.filenames.append(response.json()['filename'])
+
+    def request(self, endpoint):
+        session = self.session()
+        url = self.base_url
+        if endpoint == 'upload':
+            name = random.choice(list(self.images))
+            return session.post(f'{url}/upload', files={'file': (name, self.images[name])},
+                                data=self.enhancement, timeout=self.timeout)
+        if endpoint == 'display':
+            return session.post(f'{url}/display/{random.choice(self.filenames)}',
+                                data=self.enhancement, timeout=self.timeout)
+        if endpoint == 'images':
+            return session.get(f'{url}/images', timeout=self.timeout)
+        if endpoint == 'thumbnail':
+            return session.get(f'{url}/thumbnail/{random.choice(self.filenames)}', timeout=self.timeout)
+        data = dict(self.enhancement, remote_ip=self.remote_ip, filename=random.choice(self.filenames))
+        return session.post(f'{url}/send_to_remote', data=data, timeout=self.timeout)
+
+    def run_one(self):
+        names = [name for name, _ in self.mix]
+        weights = [weight for _, weight in self.mix]
+        endpoint = random.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            response = self.request(endpoint)
+            error = None if response.status_code < 400 else f'HTTP {response.status_code}'
+        except requests.RequestException as e:
+            error = type(e).__name__
+        elapsed = time.perf_counter() - start
+
+        with self.lock:
+            self.results[endpoint].append(elapsed)
+            if error:
+                self.errors[endpoint].append(error)
+
+    def run(self, concurrency, total_requests, duration):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            if duration:
+                deadline = start + duration
+
+                def worker():
+                    while time.perf_counter() < deadline:
+                        self.run_one()
+
+                for future in [pool.submit(worker) for _ in range(concurrency)]:
+                    future.result()
+            else:
+                for future in [pool.submit(self.run_one) for _ in range(total_requests)]:
+                    future.result()
+        return time.perf_counter() - start
+
+    def report(self, wall_time):
+        print()
+        print(f"{'endpoint':<10} {'count':>6} {'errors':>7} {'err %':>6} {'req/s':>7} "
+              f"{'p50 ms':>8} {'p90 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        all_latencies = []
+        total_errors = 0
+        for endpoint in ENDPOINTS:
+            latencies = self.results.get(endpoint)
+            if not latencies:
+                continue
+            errors = len(self.errors.get(endpoint, ()))
+            all_latencies.extend(latencies)
+            total_errors += errors
+            self._report_row(endpoint, latencies, errors, wall_time)
+        if all_latencies:
+            self._report_row('total', all_latencies, total_errors, wall_time)
+
+        for endpoint, errors in self.errors.items():
+            counts = defaultdict(int)
+            for error in errors:
+                counts[error] += 1
+            summary = ', '.join(f'{error} x{count}' for error, count in sorted(counts.items()))
+            print(f"  {endpoint} errors: {summary}")
+
+    def _report_row(self, name, latencies, errors, wall_time):
+        ms = [value * 1000 for value in latencies]
+        print(f"{name:<10} {len(ms):>6} {errors:>7} {100 * errors / len(ms):>5.1f}% "
+              f"{len(ms) / wall_time:>7.2f} {percentile(ms, 50):>8.1f} {percentile(ms, 90):>8.1f} "
+              f"{percentile(ms, 95):>8.1f} {percentile(ms, 99):>8.1f} {max(ms):>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent load test for the e-ink display app')
+    parser.add_argument('--url', default='http://localhost:5000', help='base URL of the running app')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--requests', type=int, default=100, help='total requests (ignored with --duration)')
+    parser.add_argument('--duration', type=float, default=0, help='run for this many seconds instead')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'weighted endpoint mix (default: {DEFAULT_MIX})')
+    parser.add_argument('--images', type=parse_sizes, default=parse_sizes(DEFAULT_IMAGES),
+                        help=f'test image sizes to upload (default: {DEFAULT_IMAGES})')
+    parser.add_argument('--remote-ip', help='real remote display address; otherwise a stand-in is started')
+    parser.add_argument('--remote-bandwidth', type=float, default=150000,
+                        help='stand-in receive bandwidth in bytes per second (0 = unlimited)')
+    parser.add_argument('--remote-refresh', type=float, default=2.0,
+                        help='stand-in refresh delay in seconds')
+    parser.add_argument('--timeout', type=float, default=180)
+    parser.add_argument('--seed', type=int, help='random seed for a reproducible request sequence')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    standin = None
+    remote_ip = args.remote_ip
+    if not remote_ip and any(name == 'remote' for name, _ in args.mix):
+        standin = remote_standin.start_in_background(bandwidth=args.remote_bandwidth,
+                                                     refresh_delay=args.remote_refresh)
+        remote_ip = f'127.0.0.1:{standin.server_address[1]}'
+        print(f"Stand-in remote display on {remote_ip} "
+              f"({args.remote_bandwidth:.0f} B/s, {args.remote_refresh}s refresh)")
+
+    images = {f'loadtest_{w}x{h}.jpg': make_test_image(w, h) for w, h in args.images}
+    enhancement = {'brightness': '1.0', 'contrast': '1.4', 'saturation': '1.5', 'rotate_180': 'false'}
+    test = LoadTest(args.url, args.mix, images, remote_ip, enhancement, args.timeout)
+
+    print(f"Seeding {len(images)} images...")
+    test.prepare()
+    target = f'{args.duration}s' if args.duration else f'{args.requests} requests'
+    print(f"Running {target} with {args.concurrency} workers...")
+    wall_time = test.run(args.concurrency, args.requests, args.duration)
+    print(f"Completed in {wall_time:.2f}s")
+    test.report(wall_time)
+
+    if standin:
+        stats = standin.stats
+        print(f"\nStand-in display: {stats['frames']} frames received, {stats['rejected']} rejected")
+        standin.shutdown()
+
+
+if __name__ == '__main__':
+    main()
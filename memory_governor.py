@@ -0,0 +1,171 @@
+"""
+Memory budget governor for image processing jobs.
+
+A 16 MB upload can decode to several hundred MB, so each job's peak footprint
+is estimated from the image header (dimensions and mode, no pixel decode)
+before any work starts. Jobs are admitted in arrival order while they fit in
+the configured RAM budget; the rest wait in a bounded queue, and callers get
+QueueFull (HTTP 429) once the queue is full. Images with more pixels than the
+configured limit are rejected with ImageTooLarge before decoding.
+
+Background jobs (bulk ingest) are limited to a share of the budget, take no
+place in the queue and only start while no interactive job is waiting, so an
+album conversion never turns uploads and previews away.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from PIL import Image
+
+# Bytes per pixel PIL uses internally for each mode (everything else is 4)
+MODE_BYTES = {'1': 1, 'L': 1, 'P': 1, 'I;16': 2, 'I;16B': 2, 'I;16L': 2}
+
+# Working copies alive at the peak of process_image: the RGB conversion and
+# the rotated / pre-scaled frame next to the decoded source
+RGB_WORKING_COPIES = 2
+
+
+class JobRejected(Exception):
+    """Base class for jobs refused by the governor"""
+
+
+class QueueFull(JobRejected):
+    """Raised when the budget is exhausted and the wait queue is full"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ImageTooLarge(JobRejected):
+    """Raised for images whose pixel count exceeds the configured limit"""
+
+
+def inspect_image(path):
+    """Read width, height and mode from the image header without decoding pixels"""
+    try:
+        with Image.open(path) as img:
+            return img.width, img.height, img.mode
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+
+
+def estimate_job_bytes(width, height, mode, panel_size):
+    """Estimate the peak memory of processing an image for a panel"""
+    source = width * height * MODE_BYTES.get(mode, 4)
+    working = width * height * 4 * RGB_WORKING_COPIES
+    panel_width, panel_height = panel_size
+    # Oversized resize, crop, three enhancer passes and the quantized frame
+    panel = panel_width * panel_height * 4 * 6
+    return source + working + panel
+
+
+class MemoryGovernor:
+    """Admits image jobs in FIFO order within a fixed memory budget"""
+
+    def __init__(self, budget_bytes, max_queue=4, max_pixels=50000000, retry_after=10, queue_timeout=None,
+                 background_share=0.5):
+        self.budget_bytes = budget_bytes
+        self.background_budget = int(budget_bytes * background_share)
+        self.max_queue = max_queue
+        self.max_pixels = max_pixels
+        self.retry_after = retry_after
+        self.queue_timeout = queue_timeout
+        self.in_use = 0
+        self.background_in_use = 0
+        self.running = 0
+        self.rejected = 0
+        self._waiting = deque()
+        self._cond = threading.Condition()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'budget_bytes': self.budget_bytes,
+                'in_use_bytes': self.in_use,
+                'background_in_use_bytes': self.background_in_use,
+                'running': self.running,
+                'queued': len(self._waiting),
+                'rejected': self.rejected,
+            }
+
+    def _reject(self, message):
+        self.rejected += 1
+        raise QueueFull(message, self.retry_after)
+
+    @contextmanager
+    def admit(self, cost, background=False):
+        """Hold cost bytes of the budget for the duration of the block"""
+        if background:
+            with self._admit_background(cost) as cost:
+                yield
+            return
+
+        # A job bigger than the whole budget may still run, but only on its own
+        cost = min(cost, self.budget_bytes)
+        ticket = object()
+
+        with self._cond:
+            if self._waiting or self.in_use + cost > self.budget_bytes:
+                if len(self._waiting) >= self.max_queue:
+                    self._reject('Too many image jobs in progress, try again later')
+
+                self._waiting.append(ticket)
+                deadline = None if self.queue_timeout is None else time.monotonic() + self.queue_timeout
+                try:
+                    while self._waiting[0] is not ticket or self.in_use + cost > self.budget_bytes:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self._reject('Timed out waiting for memory to process image')
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting.remove(ticket)
+                    self._cond.notify_all()
+
+            self.in_use += cost
+            self.running += 1
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_use -= cost
+                self.running -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def _admit_background(self, cost):
+        """Wait, without a queue ticket, until a background job fits its share and nobody is queued"""
+        cost = min(cost, self.background_budget)
+        with self._cond:
+            while (self._waiting or self.in_use + cost > self.budget_bytes
+                   or self.background_in_use + cost > self.background_budget):
+                self._cond.wait()
+            self.in_use += cost
+            self.background_in_use += cost
+            self.running += 1
+
+        try:
+            yield cost
+        finally:
+            with self._cond:
+                self.in_use -= cost
+                self.background_in_use -= cost
+                self.running -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def image_job(self, path, panel_size):
+        """Check an image's header against the limits and admit its processing job"""
+        width, height, mode = inspect_image(path)
+        if width * height > self.max_pixels:
+            with self._cond:
+                self.rejected += 1
+            raise ImageTooLarge(f'Image is {width}x{height} ({width * height} pixels), '
+                                f'limit is {self.max_pixels} pixels')
+
+        with self.admit(estimate_job_bytes(width, height, mode, panel_size)):
+            yield
@@ -0,0 +1,359 @@
+"""
+Persistent frame links to remote displays.
+
+Instead of one multipart POST per frame that only returns once the panel has
+refreshed, a device with a link port keeps one TCP connection open to the
+app. Every message on it is a header of a 1-byte type and a 4-byte big-endian
+payload length, followed by the payload:
+
+    device -> app  HELLO      window (u32), chunk size (u32)
+    app -> device  BEGIN      frame id (u32), frame size (u32), crc32 (u32)
+    app -> device  DATA       frame id (u32), offset (u32), chunk bytes
+    device -> app  ACK        frame id (u32), bytes received so far (u32)
+    device -> app  RECEIVED   frame id (u32)
+    device -> app  REFRESHED  frame id (u32), refresh time in ms (u32)
+    device -> app  SKIPPED    frame id (u32)
+    device -> app  ERROR      frame id (u32), utf-8 message
+
+The device announces in HELLO how large the chunks may be and how many may be
+unacknowledged at once, which bounds its receive buffer. RECEIVED means the
+whole frame arrived with a matching CRC; REFRESHED follows once the panel has
+shown it, or SKIPPED if a newer frame arrived before the panel got to it.
+The sender moves on to the next frame after RECEIVED, so a transfer
+overlaps with the previous frame's refresh, and callers can follow a transfer's
+progress instead of blocking until the refresh is done. Only the newest frame
+waiting for a device is sent; older queued ones are superseded.
+"""
+
+import collections
+import itertools
+import socket
+import struct
+import threading
+import time
+import uuid
+import zlib
+
+from device_registry import split_address
+
+HEADER = struct.Struct('>BI')
+HELLO, BEGIN, DATA = 0x01, 0x02, 0x03
+ACK, RECEIVED, REFRESHED, ERROR, SKIPPED = 0x81, 0x82, 0x83, 0x84, 0x85
+
+# Largest message either side accepts, so a corrupt header cannot allocate gigabytes
+MAX_PAYLOAD = 1024 * 1024
+# Transfer states, in the order a successful transfer goes through them
+STATES = ('queued', 'sending', 'transferred', 'refreshed')
+FINAL_STATES = ('refreshed', 'failed', 'superseded')
+
+
+class LinkError(Exception):
+    """Raised when a link cannot be set up or is lost during a transfer"""
+
+
+class FrameRejected(Exception):
+    """Raised when a remote display refuses a frame"""
+
+
+def read_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise LinkError('Connection closed')
+        data += chunk
+    return bytes(data)
+
+
+def read_message(sock):
+    """Read one message and return (type, payload)"""
+    kind, length = HEADER.unpack(read_exact(sock, HEADER.size))
+    if length > MAX_PAYLOAD:
+        raise LinkError(f'Message of {length} bytes is too large')
+    return kind, read_exact(sock, length)
+
+
+def send_message(sock, kind, payload=b''):
+    sock.sendall(HEADER.pack(kind, len(payload)) + payload)
+
+
+class Transfer:
+    """One frame on its way to a device"""
+
+    def __init__(self, device, frame, cond):
+        self.id = uuid.uuid4().hex[:12]
+        self.device = device
+        self.frame = frame
+        self.size = len(frame)
+        self.state = 'queued'
+        self.acked = 0
+        self.error = None
+        self.rejected = False
+        self.queued = time.time()
+        self.started = None
+        self.transfer_seconds = None
+        self.refresh_seconds = None
+        self._cond = cond
+
+    def info(self):
+        with self._cond:
+            return {'id': self.id, 'device': self.device, 'bytes': self.size, 'acked': self.acked,
+                    'progress': round(self.acked / self.size, 3) if self.size else 1.0, 'state': self.state,
+                    'queued': self.queued, 'transfer_seconds': self.transfer_seconds,
+                    'refresh_seconds': self.refresh_seconds, 'error': self.error}
+
+    def _reached(self, state):
+        return self.state in FINAL_STATES or STATES.index(self.state) >= STATES.index(state)
+
+    def wait(self, state='transferred', timeout=None):
+        """Block until the transfer reaches state ('transferred' or 'refreshed') and return its info"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._reached(state), timeout):
+                raise LinkError(f'Frame not {state} on {self.device} after {timeout}s')
+            if self.state == 'failed':
+                raise (FrameRejected if self.rejected else LinkError)(self.error)
+        return self.info()
+
+
+class PanelLink:
+    """The connection to one device and the frames queued for it"""
+
+    def __init__(self, name, address, port, connect_timeout, ack_timeout):
+        self.name = name
+        self.endpoint = (split_address(address)[0], port)
+        self.connect_timeout = connect_timeout
+        self.ack_timeout = ack_timeout
+        self._cond = threading.Condition()
+        self._pending = None
+        self._sock = None
+        self._window = self._chunk = 0
+        # Transfers sent on the current connection that have not refreshed yet
+        self._awaiting = {}
+        self._frame_ids = itertools.count(1)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f'link-{name}', daemon=True)
+        self._thread.start()
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    def send(self, frame):
+        """Queue a frame, superseding one still waiting, and return its Transfer"""
+        with self._cond:
+            if self._closed:
+                raise LinkError(f'Link to {self.name} is closed')
+            transfer = Transfer(self.name, frame, self._cond)
+            if self._pending is not None:
+                self._pending.state = 'superseded'
+                self._pending.frame = None
+            self._pending = transfer
+            self._cond.notify_all()
+        return transfer
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            if self._pending is not None:
+                self._fail(self._pending, 'Link closed')
+                self._pending = None
+            self._cond.notify_all()
+        self._disconnect('Link closed')
+
+    # ---- connection ----
+
+    def _connect(self):
+        sock = socket.create_connection(self.endpoint, timeout=self.connect_timeout)
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            kind, payload = read_message(sock)
+            if kind != HELLO:
+                raise LinkError(f'Expected HELLO, got message type {kind:#x}')
+            if len(payload) < 8:
+                raise LinkError('Malformed HELLO')
+            window, chunk = struct.unpack('>II', payload[:8])
+            if window < 1 or not 0 < chunk <= MAX_PAYLOAD - 8:
+                raise LinkError(f'Unusable flow control: window {window}, chunk {chunk}')
+            # The reader blocks until the device speaks; stalls are caught by the ack timeout
+            sock.settimeout(None)
+        except (OSError, LinkError):
+            sock.close()
+            raise
+        with self._cond:
+            self._sock, self._window, self._chunk = sock, window, chunk
+        threading.Thread(target=self._read, args=(sock,), name=f'link-{self.name}-reader', daemon=True).start()
+        print(f"Link to {self.name} at {self.endpoint[0]}:{self.endpoint[1]} open "
+              f"(window {window} x {chunk} bytes)")
+
+    def _disconnect(self, reason):
+        with self._cond:
+            sock, self._sock = self._sock, None
+            for transfer in self._awaiting.values():
+                if transfer.state != 'failed':
+                    self._fail(transfer, f'{reason} before the frame was refreshed')
+            self._awaiting.clear()
+            self._cond.notify_all()
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    def _fail(self, transfer, error, rejected=False):
+        """Mark a transfer failed (call with the condition held)"""
+        transfer.state = 'failed'
+        transfer.error = error
+        transfer.rejected = rejected
+        transfer.frame = None
+
+    def _read(self, sock):
+        """Reader thread: apply the device's acks and events to the transfers they name"""
+        try:
+            while True:
+                kind, payload = read_message(sock)
+                frame_id = struct.unpack('>I', payload[:4])[0]
+                with self._cond:
+                    transfer = self._awaiting.get(frame_id)
+                    if transfer is None:
+                        continue
+                    if kind == ACK:
+                        transfer.acked = max(transfer.acked, struct.unpack('>I', payload[4:8])[0])
+                    elif kind == RECEIVED:
+                        transfer.acked = transfer.size
+                        transfer.state = 'transferred'
+                        transfer.transfer_seconds = round(time.perf_counter() - transfer.started, 4)
+                    elif kind == REFRESHED:
+                        transfer.state = 'refreshed'
+                        transfer.refresh_seconds = struct.unpack('>I', payload[4:8])[0] / 1000
+                        del self._awaiting[frame_id]
+                    elif kind == SKIPPED:
+                        transfer.state = 'superseded'
+                        del self._awaiting[frame_id]
+                    elif kind == ERROR:
+                        self._fail(transfer, payload[4:].decode('utf-8', 'replace') or 'Frame rejected',
+                                   rejected=True)
+                        del self._awaiting[frame_id]
+                    self._cond.notify_all()
+        except (OSError, LinkError, struct.error) as e:
+            with self._cond:
+                current = self._sock is sock
+            if current:
+                print(f"Link to {self.name} lost: {e}")
+                self._disconnect('Connection lost')
+
+    # ---- sending ----
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending is not None or self._closed)
+                if self._closed:
+                    return
+                transfer, self._pending = self._pending, None
+                transfer.state = 'sending'
+            try:
+                self._transmit(transfer)
+            except (OSError, LinkError) as e:
+                with self._cond:
+                    if transfer.state not in FINAL_STATES:
+                        self._fail(transfer, str(e) or e.__class__.__name__)
+                    self._cond.notify_all()
+                self._disconnect(str(e) or 'Send failed')
+
+    def _wait_for(self, transfer, predicate, what):
+        """Wait for the reader to move a transfer on (call with the condition held)"""
+        done = lambda: predicate() or transfer.state == 'failed' or self._sock is None
+        if not self._cond.wait_for(done, self.ack_timeout):
+            raise LinkError(f'No {what} from {self.name} within {self.ack_timeout}s')
+        if transfer.state == 'failed':
+            return False
+        if not predicate():
+            raise LinkError('Connection lost')
+        return True
+
+    def _transmit(self, transfer):
+        if self._sock is None:
+            self._connect()
+        frame = transfer.frame
+        frame_id = next(self._frame_ids) & 0xFFFFFFFF
+        with self._cond:
+            sock, window, chunk = self._sock, self._window, self._chunk
+            transfer.started = time.perf_counter()
+            self._awaiting[frame_id] = transfer
+        send_message(sock, BEGIN, struct.pack('>III', frame_id, len(frame), zlib.crc32(frame)))
+
+        view = memoryview(frame)
+        for offset in range(0, len(frame), chunk):
+            with self._cond:
+                # At most window chunks in flight, so the device's buffer never overflows
+                if not self._wait_for(transfer, lambda: offset + chunk - transfer.acked <= window * chunk, 'ack'):
+                    return
+            send_message(sock, DATA, struct.pack('>II', frame_id, offset) + view[offset:offset + chunk])
+        with self._cond:
+            self._wait_for(transfer, lambda: transfer.state in ('transferred', 'refreshed'), 'receipt')
+            transfer.frame = None
+
+
+class PanelLinks:
+    """One PanelLink per device with a link port, and the recent transfers across them"""
+
+    def __init__(self, connect_timeout=5.0, ack_timeout=10.0, keep=100):
+        self.connect_timeout = connect_timeout
+        self.ack_timeout = ack_timeout
+        self._links = {}
+        self._transfers = collections.OrderedDict()
+        self._keep = keep
+        self._lock = threading.Lock()
+
+    def _link(self, device):
+        endpoint = (split_address(device['address'])[0], device['link_port'])
+        with self._lock:
+            link = self._links.get(device['name'])
+            if link is not None and link.endpoint != endpoint:
+                # The device moved; its old connection is no use
+                link.close()
+                link = None
+            if link is None:
+                link = PanelLink(device['name'], device['address'], device['link_port'],
+                                 self.connect_timeout, self.ack_timeout)
+                self._links[device['name']] = link
+        return link
+
+    def send(self, device, frame):
+        """Queue a frame for a device over its link and return the Transfer"""
+        transfer = self._link(device).send(frame)
+        with self._lock:
+            self._transfers[transfer.id] = transfer
+            while len(self._transfers) > self._keep:
+                self._transfers.popitem(last=False)
+        return transfer
+
+    def get(self, transfer_id):
+        """Info of a recent transfer, or None"""
+        with self._lock:
+            transfer = self._transfers.get(transfer_id)
+        return transfer.info() if transfer else None
+
+    def list_transfers(self, device=None):
+        with self._lock:
+            transfers = list(reversed(self._transfers.values()))
+        return [transfer.info() for transfer in transfers if device is None or transfer.device == device]
+
+    def connected(self, name):
+        with self._lock:
+            link = self._links.get(name)
+        return link is not None and link.connected
+
+    def close(self, name):
+        with self._lock:
+            link = self._links.pop(name, None)
+        if link is not None:
+            link.close()
+
+    def shutdown(self):
+        with self._lock:
+            links, self._links = list(self._links.values()), {}
+        for link in links:
+            link.close()
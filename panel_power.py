@@ -0,0 +1,167 @@
+"""
+Power-state manager for the local e-paper panel.
+
+Every refresh used to run init() -> display() -> sleep(), paying the full
+reset and power-on sequence each time, even within a burst (a slideshow
+step, clear-then-display). The manager owns the one driver instance, keeps the
+controller initialized while refreshes keep coming, and puts it to sleep once
+it has been idle for idle_timeout seconds (0 sleeps after every refresh, the
+old behaviour) and on shutdown. Panel operations are serialized, and each
+state transition is timed so the saved init time shows up in /health; the
+state, timings and native size can be read while a refresh is running.
+"""
+
+import atexit
+import threading
+import time
+
+TRANSITIONS = ('init', 'display', 'clear', 'sleep')
+
+
+class PanelPowerManager:
+    """Serializes access to the local panel and manages its sleep state"""
+
+    def __init__(self, factory, idle_timeout=60.0):
+        self.idle_timeout = idle_timeout
+        self._epd = factory()
+        # The native size never changes, so profile lookups need no lock
+        self.width, self.height = self._epd.width, self._epd.height
+        self._awake = False
+        self._last_used = 0.0
+        self._stopping = False
+        self._watcher = None
+        # _operation serializes driver calls (init, display, clear, sleep) and is held
+        # for a whole refresh; _cond guards the state and timings and is only held briefly.
+        # Take _operation first when both are needed.
+        self._operation = threading.Lock()
+        self._cond = threading.Condition()
+        self._timings = {name: {'count': 0, 'total': 0.0, 'last': None} for name in TRANSITIONS}
+        self.inits_avoided = 0
+
+    @property
+    def epd(self):
+        """The driver instance, for hardware-free attributes such as its native size"""
+        return self._epd
+
+    def stats(self):
+        with self._cond:
+            timings = {}
+            for name, timing in self._timings.items():
+                average = timing['total'] / timing['count'] if timing['count'] else None
+                timings[name] = dict(timing, average=average)
+            init_average = timings['init']['average'] or 0.0
+            return {
+                'awake': self._awake,
+                'idle_timeout': self.idle_timeout,
+                'idle_seconds': time.monotonic() - self._last_used if self._awake else None,
+                'timings': timings,
+                'inits_avoided': self.inits_avoided,
+                'init_seconds_saved': self.inits_avoided * init_average,
+            }
+
+    def _timed(self, name, operation, *args):
+        start = time.perf_counter()
+        result = operation(*args)
+        elapsed = time.perf_counter() - start
+        with self._cond:
+            timing = self._timings[name]
+            timing['count'] += 1
+            timing['total'] += elapsed
+            timing['last'] = elapsed
+        print(f"Panel {name} took {elapsed:.2f}s")
+        return result
+
+    def _wake(self):
+        """Initialize the panel unless it is still awake (call with _operation held)"""
+        with self._cond:
+            if self._awake:
+                self.inits_avoided += 1
+                return
+        self._timed('init', self._epd.init)
+        with self._cond:
+            self._awake = True
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name='panel-power', daemon=True)
+            self._watcher.start()
+            atexit.register(self.shutdown)
+
+    def _sleep(self):
+        """Put the panel to sleep if it is awake (call with _operation held)"""
+        with self._cond:
+            # Whatever happens, assume the controller needs a fresh init next time
+            awake, self._awake = self._awake, False
+        if awake:
+            self._timed('sleep', self._epd.sleep)
+
+    def _after_refresh(self):
+        with self._cond:
+            self._last_used = time.monotonic()
+            self._cond.notify_all()
+        if self.idle_timeout <= 0:
+            self._sleep()
+
+    def _run(self, name, operation):
+        with self._operation:
+            with self._cond:
+                if self._stopping:
+                    raise RuntimeError('Panel is shutting down')
+            self._wake()
+            try:
+                self._timed(name, operation)
+            except Exception:
+                # Leave the panel in a known state after a failed refresh
+                try:
+                    self._sleep()
+                except Exception as e:
+                    print(f"Error putting panel to sleep: {e}")
+                raise
+            self._after_refresh()
+
+    def display(self, frame):
+        """Show a packed frame, initializing the panel only if it was asleep"""
+        self._run('display', lambda: self._epd.display(frame))
+
+    def clear(self):
+        """Clear the panel to white, initializing it only if it was asleep"""
+        self._run('clear', lambda: self._epd.Clear())
+
+    def sleep(self):
+        """Put the panel to sleep now"""
+        with self._operation:
+            self._sleep()
+
+    def shutdown(self):
+        """Sleep the panel and stop the idle watcher; safe to call more than once"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        with self._operation:
+            try:
+                self._sleep()
+            except Exception as e:
+                print(f"Error putting panel to sleep on shutdown: {e}")
+
+    def _idle(self):
+        """True once the panel has been awake and unused for idle_timeout (call with _cond held)"""
+        return self._awake and time.monotonic() - self._last_used >= self.idle_timeout
+
+    def _watch(self):
+        while True:
+            with self._cond:
+                while not self._stopping and not self._idle():
+                    if not self._awake:
+                        self._cond.wait()
+                    else:
+                        self._cond.wait(self._last_used + self.idle_timeout - time.monotonic())
+                if self._stopping:
+                    return
+            with self._operation:
+                # A refresh may have run while we waited for the panel
+                with self._cond:
+                    if self._stopping or not self._idle():
+                        continue
+                print(f"Panel idle for {self.idle_timeout:.0f}s, putting it to sleep")
+                try:
+                    self._sleep()
+                except Exception as e:
+                    print(f"Error putting idle panel to sleep: {e}")
@@ -0,0 +1,333 @@
+"""
+Playlist / slideshow scheduler for e-paper panels.
+
+A playlist is a named list of items (gallery images or the safety sign), each
+with its own dwell time, assigned to one panel ('local', a remote display
+address, or 'pull:<device>' for a device that fetches its own frames).
+Running playlists are advanced by a single in-process scheduler thread. While
+an item is on the panel, the next item is rendered and packed ahead of time so
+a transition only costs the transfer and refresh.
+
+Playlist definitions and their position survive restarts through a JSON
+state file. Rendering and displaying are supplied by the app as callbacks:
+    render(item, panel) -> frame
+    show(frame, panel)
+    version(item) -> hashable value that changes when the item's source changes
+"""
+
+import copy
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ITEM_TYPES = ('image', 'safety')
+# Enhancement options an item may set, with the type each is normalized to
+ITEM_OPTIONS = {'brightness': float, 'contrast': float, 'saturation': float, 'rotate_180': bool}
+
+
+class PlaylistError(ValueError):
+    """Raised for invalid playlist definitions"""
+
+
+class PlaylistNotFound(PlaylistError):
+    """Raised when a playlist name is unknown"""
+
+
+def validate_items(items, min_dwell):
+    """Check and normalize a list of playlist items"""
+    if not isinstance(items, list) or not items:
+        raise PlaylistError('A playlist needs at least one item')
+
+    normalized = []
+    for index, item in enumerate(items, 1):
+        if not isinstance(item, dict):
+            raise PlaylistError(f'Item {index} must be an object')
+        item_type = item.get('type', 'image')
+        if item_type not in ITEM_TYPES:
+            raise PlaylistError(f"Item {index} has unknown type '{item_type}'")
+        if item_type == 'image' and not item.get('filename'):
+            raise PlaylistError(f'Item {index} needs a filename')
+        try:
+            dwell = float(item.get('dwell', 0))
+        except (TypeError, ValueError):
+            raise PlaylistError(f'Item {index} has an invalid dwell time')
+        if dwell < min_dwell:
+            raise PlaylistError(f'Item {index} dwell must be at least {min_dwell} seconds')
+
+        entry = {'type': item_type, 'dwell': dwell}
+        if item_type == 'image':
+            entry['filename'] = item['filename']
+        for option, option_type in ITEM_OPTIONS.items():
+            if option in item:
+                entry[option] = normalize_option(item[option], option_type, index, option)
+        normalized.append(entry)
+    return normalized
+
+
+def normalize_option(value, option_type, index, option):
+    """Coerce an item option to its type, so bad values fail when saving, not mid-playlist"""
+    if option_type is bool:
+        # Form-style 'true' / 'false' strings are common; bool('false') would be True
+        return value if isinstance(value, bool) else str(value).lower() == 'true'
+    try:
+        return option_type(value)
+    except (TypeError, ValueError):
+        raise PlaylistError(f'Item {index} {option} must be a number')
+
+
+class PlaylistScheduler:
+    """Runs playlists on their panels and prefetches each next frame"""
+
+    def __init__(self, state_file, render, show, version=None, min_dwell=30, max_workers=4):
+        self.state_file = state_file
+        self.min_dwell = min_dwell
+        self._render = render
+        self._show = show
+        self._version = version or (lambda item: None)
+        self._cond = threading.Condition()
+        self._playlists = {}
+        self._prefetched = {}
+        self._prefetching = set()
+        self._busy = set()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='playlist')
+        self._thread = None
+        self._stopping = False
+        self._load()
+
+    # ---- persistence ----
+
+    def _load(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'r') as f:
+                self._playlists = json.load(f).get('playlists', {})
+        except (OSError, ValueError) as e:
+            print(f"Could not load playlists from {self.state_file}: {e}")
+            return
+        # Playlists saved before their options were normalized
+        for name, playlist in list(self._playlists.items()):
+            try:
+                playlist['items'] = validate_items(playlist.get('items'), 0)
+            except PlaylistError as e:
+                print(f"Dropping playlist {name} from {self.state_file}: {e}")
+                del self._playlists[name]
+
+    def _save(self):
+        temp_path = self.state_file + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'playlists': self._playlists}, f, indent=2)
+        os.replace(temp_path, self.state_file)
+
+    # ---- playlist management ----
+
+    def list_playlists(self):
+        with self._cond:
+            playlists = copy.deepcopy(self._playlists)
+            for name, playlist in playlists.items():
+                prefetched = self._prefetched.get(name)
+                playlist['prefetched_position'] = prefetched[0] if prefetched else None
+            return playlists
+
+    def get(self, name):
+        with self._cond:
+            if name not in self._playlists:
+                raise PlaylistNotFound(f"Unknown playlist '{name}'")
+            return copy.deepcopy(self._playlists[name])
+
+    def save_playlist(self, name, panel, items):
+        """Create or replace a playlist, keeping its running state"""
+        if not name:
+            raise PlaylistError('A playlist needs a name')
+        if not panel:
+            raise PlaylistError('A playlist needs a panel')
+        items = validate_items(items, self.min_dwell)
+
+        with self._cond:
+            existing = self._playlists.get(name, {})
+            running = existing.get('running', False)
+            if running and existing.get('panel') != panel:
+                self._stop_panel(panel, except_name=name)
+            self._playlists[name] = {
+                'panel': panel,
+                'items': items,
+                'running': running,
+                'position': existing.get('position', 0) % len(items),
+                'next_change': existing.get('next_change', 0),
+                'last_shown': existing.get('last_shown'),
+                'last_error': None,
+            }
+            self._prefetched.pop(name, None)
+            self._save()
+            self._cond.notify_all()
+
+        if running:
+            self._executor.submit(self._prefetch, name)
+
+    def delete(self, name):
+        with self._cond:
+            if self._playlists.pop(name, None) is None:
+                raise PlaylistNotFound(f"Unknown playlist '{name}'")
+            self._prefetched.pop(name, None)
+            self._save()
+            self._cond.notify_all()
+
+    def _stop_panel(self, panel, except_name=None):
+        """Stop other playlists driving the same panel (call with the lock held)"""
+        for other_name, other in self._playlists.items():
+            if other_name != except_name and other['panel'] == panel and other['running']:
+                other['running'] = False
+                self._prefetched.pop(other_name, None)
+
+    def start_playlist(self, name):
+        """Start a playlist now, replacing whatever runs on its panel"""
+        with self._cond:
+            if name not in self._playlists:
+                raise PlaylistNotFound(f"Unknown playlist '{name}'")
+            playlist = self._playlists[name]
+            self._stop_panel(playlist['panel'], except_name=name)
+            playlist['running'] = True
+            playlist['next_change'] = time.time()
+            self._save()
+            self._cond.notify_all()
+
+    def stop_playlist(self, name):
+        with self._cond:
+            if name not in self._playlists:
+                raise PlaylistNotFound(f"Unknown playlist '{name}'")
+            self._playlists[name]['running'] = False
+            self._prefetched.pop(name, None)
+            self._save()
+            self._cond.notify_all()
+
+    def next_change_for_panel(self, panel):
+        """Time the running playlist on a panel changes its frame next, or None"""
+        with self._cond:
+            for playlist in self._playlists.values():
+                if playlist['running'] and playlist['panel'] == panel:
+                    return playlist['next_change']
+        return None
+
+    # ---- scheduling ----
+
+    def start(self):
+        """Start the scheduler thread and prefetch frames for running playlists"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='playlist-scheduler', daemon=True)
+        self._thread.start()
+        with self._cond:
+            running = [name for name, playlist in self._playlists.items() if playlist['running']]
+        for name in running:
+            self._executor.submit(self._prefetch, name)
+
+    def shutdown(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=False)
+
+    def _run(self):
+        with self._cond:
+            while not self._stopping:
+                now = time.time()
+                next_wake = None
+                for name, playlist in self._playlists.items():
+                    if not playlist['running'] or name in self._busy:
+                        continue
+                    if playlist['next_change'] <= now:
+                        self._busy.add(name)
+                        try:
+                            self._executor.submit(self._advance, name)
+                        except RuntimeError:
+                            # Interpreter is shutting down
+                            return
+                    elif next_wake is None or playlist['next_change'] < next_wake:
+                        next_wake = playlist['next_change']
+                self._cond.wait(None if next_wake is None else max(next_wake - now, 0))
+
+    def _item_key(self, item, panel):
+        return (json.dumps(item, sort_keys=True), panel, self._version(item))
+
+    def _current(self, name, position=None):
+        """Return (position, item, panel) for a playlist (call with the lock held)"""
+        playlist = self._playlists[name]
+        if position is None:
+            position = playlist['position']
+        position %= len(playlist['items'])
+        return position, copy.deepcopy(playlist['items'][position]), playlist['panel']
+
+    def _prefetch(self, name, position=None):
+        """Render and pack the frame for a playlist position (default: the next one shown)"""
+        with self._cond:
+            if name not in self._playlists or not self._playlists[name]['running']:
+                return
+            position, item, panel = self._current(name, position)
+            prefetched = self._prefetched.get(name)
+            key = self._item_key(item, panel)
+            if prefetched and prefetched[0] == position and prefetched[1] == key:
+                return
+            if (name, position) in self._prefetching:
+                return
+            self._prefetching.add((name, position))
+
+        try:
+            start = time.perf_counter()
+            frame = self._render(item, panel)
+            print(f"Prefetched playlist '{name}' item {position + 1} in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            print(f"Error prefetching playlist '{name}' item {position + 1}: {e}")
+            return
+        finally:
+            with self._cond:
+                self._prefetching.discard((name, position))
+
+        with self._cond:
+            if name in self._playlists:
+                self._prefetched[name] = (position, key, frame)
+
+    def _take_frame(self, name, position, item, panel):
+        """Use the prefetched frame if it is still current, otherwise render now"""
+        with self._cond:
+            prefetched = self._prefetched.pop(name, None)
+        if prefetched and prefetched[0] == position and prefetched[1] == self._item_key(item, panel):
+            return prefetched[2]
+        print(f"Playlist '{name}' item {position + 1} was not prefetched, rendering now")
+        return self._render(item, panel)
+
+    def _advance(self, name):
+        """Show the current item of a playlist and schedule the next one"""
+        with self._cond:
+            if name not in self._playlists:
+                self._busy.discard(name)
+                return
+            position, item, panel = self._current(name)
+
+        shown_at = time.time()
+        error = None
+        try:
+            frame = self._take_frame(name, position, item, panel)
+            # Render the following item while this one transfers and refreshes
+            self._executor.submit(self._prefetch, name, position + 1)
+            start = time.perf_counter()
+            self._show(frame, panel)
+            print(f"Playlist '{name}' showed item {position + 1} on {panel} "
+                  f"in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            error = str(e)
+            print(f"Error showing playlist '{name}' item {position + 1}: {e}")
+
+        with self._cond:
+            playlist = self._playlists.get(name)
+            if playlist is not None and playlist['running']:
+                playlist['position'] = (position + 1) % len(playlist['items'])
+                playlist['next_change'] = shown_at + item['dwell']
+                playlist['last_shown'] = shown_at
+                playlist['last_error'] = error
+                self._save()
+            self._busy.discard(name)
+            self._cond.notify_all()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for a remote ESP32 e-paper display.
+
+Mimics the firmware's POST /display endpoint (multipart field 'file' holding a
+packed 4-bit frame) so send_to_remote can be exercised without hardware.
+Receive bandwidth and refresh delay are tunable, and like the ESP32 it handles
+one connection at a time unless --threaded is given.
+
+With --link-port it also accepts the persistent frame link of panel_link.py:
+chunks are acknowledged as they arrive, and a frame received while the panel
+is refreshing waits for the refresh to finish, so transfers overlap refreshes.
+
+Usage:
+    python3 remote_standin.py --port 8081 --bandwidth 150000 --refresh 19 --link-port 8082
+"""
+
+import argparse
+import socketserver
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+
+import panel_link
+
+# Frame sizes accepted by default: 800x480 and 1600x1200 at two pixels per byte
+DEFAULT_FRAME_SIZES = (192000, 960000)
+READ_CHUNK = 4096
+# Flow control announced on the frame link: chunks in flight and chunk size
+LINK_WINDOW = 4
+LINK_CHUNK = 4096
+
+
+def extract_multipart_file(body, content_type):
+    """Return the payload of the first part of a multipart/form-data body"""
+    if 'boundary=' not in content_type:
+        return body
+    boundary = content_type.split('boundary=', 1)[1].split(';', 1)[0].strip('"').encode()
+    for part in body.split(b'--' + boundary):
+        if b'\r\n\r\n' not in part:
+            continue
+        headers, payload = part.split(b'\r\n\r\n', 1)
+        if b'name="file"' in headers:
+            return payload[:-2] if payload.endswith(b'\r\n') else payload
+    return None
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Request handler emulating the ESP32 firmware endpoints"""
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _respond(self, status, message):
+        body = message.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self, length):
+        """Read the request body no faster than the configured bandwidth"""
+        chunks = []
+        remaining = length
+        start = time.monotonic()
+        while remaining > 0:
+            chunk = self.rfile.read(min(READ_CHUNK, remaining))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+            if self.server.bandwidth:
+                expected = (length - remaining) / self.server.bandwidth
+                elapsed = time.monotonic() - start
+                if expected > elapsed:
+                    time.sleep(expected - elapsed)
+        return b''.join(chunks)
+
+    def do_GET(self):
+        if self.path == '/status':
+            stats = self.server.stats
+            self._respond(200, f"frames={stats['frames']} rejected={stats['rejected']}")
+        else:
+            self._respond(404, 'Not found')
+
+    def do_POST(self):
+        if self.path != '/display':
+            self._respond(404, 'Not found')
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        body = self._read_body(length)
+        frame = extract_multipart_file(body, self.headers.get('Content-Type', ''))
+
+        if frame is None or len(frame) not in self.server.frame_sizes:
+            with self.server.stats_lock:
+                self.server.stats['rejected'] += 1
+            size = 'no file' if frame is None else f'{len(frame)} bytes'
+            self._respond(400, f'Invalid frame: {size}')
+            return
+
+        with self.server.refresh_lock:
+            time.sleep(self.server.refresh_delay)
+        with self.server.stats_lock:
+            self.server.stats['frames'] += 1
+            self.server.stats['bytes'] += len(frame)
+        self._respond(200, 'OK')
+
+
+class LinkHandler(socketserver.BaseRequestHandler):
+    """One frame link connection: receive chunks, ack them, refresh complete frames"""
+
+    def setup(self):
+        self.write_lock = threading.Lock()
+        # Complete frame waiting for the panel, replaced if a newer one arrives first
+        self.cond = threading.Condition()
+        self.waiting = None
+        self.closed = False
+
+    def send(self, kind, payload):
+        with self.write_lock:
+            panel_link.send_message(self.request, kind, payload)
+
+    def handle(self):
+        server = self.server.display
+        refresher = threading.Thread(target=self.refresh_frames, daemon=True)
+        refresher.start()
+        self.send(panel_link.HELLO, struct.pack('>II', LINK_WINDOW, LINK_CHUNK))
+        frame_id = frame = crc = None
+        start = time.monotonic()
+        try:
+            while True:
+                kind, payload = panel_link.read_message(self.request)
+                if kind == panel_link.BEGIN:
+                    frame_id, size, crc = struct.unpack('>III', payload)
+                    frame, received, start = bytearray(size), 0, time.monotonic()
+                    if size not in server.frame_sizes:
+                        with server.stats_lock:
+                            server.stats['rejected'] += 1
+                        message = f'Invalid frame: {size} bytes'.encode()
+                        self.send(panel_link.ERROR, struct.pack('>I', frame_id) + message)
+                        frame = None
+                elif kind == panel_link.DATA and frame is not None:
+                    chunk_id, offset = struct.unpack('>II', payload[:8])
+                    if chunk_id != frame_id:
+                        continue
+                    data = payload[8:]
+                    frame[offset:offset + len(data)] = data
+                    received += len(data)
+                    if server.bandwidth:
+                        expected = received / server.bandwidth
+                        elapsed = time.monotonic() - start
+                        if expected > elapsed:
+                            time.sleep(expected - elapsed)
+                    self.send(panel_link.ACK, struct.pack('>II', frame_id, received))
+                    if received >= len(frame):
+                        if zlib.crc32(frame) != crc:
+                            self.send(panel_link.ERROR, struct.pack('>I', frame_id) + b'CRC mismatch')
+                        else:
+                            self.send(panel_link.RECEIVED, struct.pack('>I', frame_id))
+                            with self.cond:
+                                if self.waiting is not None:
+                                    self.send(panel_link.SKIPPED, struct.pack('>I', self.waiting[0]))
+                                self.waiting = (frame_id, bytes(frame))
+                                self.cond.notify_all()
+                        frame = None
+        except (OSError, panel_link.LinkError):
+            pass
+        finally:
+            with self.cond:
+                self.closed = True
+                self.cond.notify_all()
+
+    def refresh_frames(self):
+        server = self.server.display
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.waiting is not None or self.closed)
+                if self.closed:
+                    return
+                (frame_id, frame), self.waiting = self.waiting, None
+            start = time.monotonic()
+            with server.refresh_lock:
+                time.sleep(server.refresh_delay)
+            with server.stats_lock:
+                server.stats['frames'] += 1
+                server.stats['bytes'] += len(frame)
+            refresh_ms = int((time.monotonic() - start) * 1000)
+            try:
+                self.send(panel_link.REFRESHED, struct.pack('>II', frame_id, refresh_ms))
+            except OSError:
+                return
+
+
+def start_link_server(display, host='127.0.0.1', port=0):
+    """Serve the frame link for a stand-in display on a daemon thread and return the link server"""
+    link_server = socketserver.ThreadingTCPServer((host, port), LinkHandler)
+    link_server.daemon_threads = True
+    link_server.display = display
+    threading.Thread(target=link_server.serve_forever, daemon=True).start()
+    return link_server
+
+
+def create_server(host='127.0.0.1', port=0, bandwidth=0, refresh_delay=0.0,
+                  frame_sizes=DEFAULT_FRAME_SIZES, threaded=False, quiet=True):
+    """Create a stand-in display server; port 0 picks a free port"""
+    server_class = ThreadingHTTPServer if threaded else HTTPServer
+    server = server_class((host, port), StandinHandler)
+    server.bandwidth = bandwidth
+    server.refresh_delay = refresh_delay
+    server.frame_sizes = tuple(frame_sizes)
+    server.quiet = quiet
+    server.stats = {'frames': 0, 'rejected': 0, 'bytes': 0}
+    server.stats_lock = threading.Lock()
+    server.refresh_lock = threading.Lock()
+    return server
+
+
+def start_in_background(**kwargs):
+    """Start a stand-in server on a daemon thread and return it"""
+    server = create_server(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stand-in for a remote ESP32 e-paper display')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--bandwidth', type=float, default=0,
+                        help='receive bandwidth in bytes per second (0 = unlimited)')
+    parser.add_argument('--refresh', type=float, default=0.0,
+                        help='simulated panel refresh time in seconds')
+    parser.add_argument('--frame-size', type=int, action='append',
+                        help='accepted frame size in bytes (repeatable)')
+    parser.add_argument('--threaded', action='store_true',
+                        help='accept concurrent connections instead of one at a time')
+    parser.add_argument('--link-port', type=int, help='also accept the persistent frame link on this port')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, args.bandwidth, args.refresh,
+                           args.frame_size or DEFAULT_FRAME_SIZES, args.threaded,
+                           quiet=not args.verbose)
+    print(f"Stand-in display listening on {args.host}:{server.server_address[1]}")
+    if args.link_port is not None:
+        link_server = start_link_server(server, args.host, args.link_port)
+        print(f"Frame link listening on {args.host}:{link_server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Frames received: {server.stats['frames']}, rejected: {server.stats['rejected']}")
+
+
+if __name__ == '__main__':
+    main()
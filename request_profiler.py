@@ -0,0 +1,205 @@
+"""
+Opt-in CPU profiling of individual requests.
+
+Wraps the app's WSGI callable. A request is profiled in one of two ways:
+
+    cprofile  every Python call is traced with cProfile; the result can be
+              fetched as a .pstats file (for pstats, snakeviz, ...) or as a
+              text report. Only one request is traced at a time; a second
+              one asking for it is sampled instead.
+    sample    a single background thread records the request thread's stack
+              every few milliseconds; the result is collapsed-stack text
+              ("frame;frame;frame count" per line) for flamegraph.pl or
+              speedscope. Overhead is one stack walk per interval.
+
+A request asks for a profile with an "X-Profile: cprofile" (or "1") or
+"X-Profile: sample" header, honoured only while profiling is enabled, and a
+configurable fraction of all other requests is sampled in the background.
+The id of a profile is returned in the X-Profile-Id response header; the
+last few profiles are kept in memory.
+"""
+
+import collections
+import cProfile
+import io
+import itertools
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+
+# Header values that ask for a cProfile trace
+CPROFILE_VALUES = ('1', 'true', 'yes', 'cprofile')
+
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """One background thread recording the stacks of registered threads"""
+
+    def __init__(self, interval, root_code):
+        self.interval = interval
+        # Frames at and below this code object (the server and the wrapper) are left out
+        self._root_code = root_code
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._counts[thread_id] = collections.Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id):
+        """Stop sampling a thread and return its collapsed stacks with their sample counts"""
+        with self._lock:
+            return self._counts.pop(thread_id)
+
+    def _stack(self, frame):
+        labels = []
+        while frame is not None and frame.f_code is not self._root_code:
+            labels.append(frame_label(frame.f_code))
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._counts:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, counts in self._counts.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        counts[self._stack(frame)] += 1
+                # Do not keep the sampled threads' frames alive until the next sample
+                del frames, frame
+
+
+class RequestProfiler:
+    """Profiles requests on demand or by sampling, and keeps the last results"""
+
+    def __init__(self, enabled=False, sample_rate=0.0, interval=0.005, keep=50):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self._profiles = collections.OrderedDict()
+        self._keep = keep
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # cProfile can only trace one request at a time
+        self._cprofile_lock = threading.Lock()
+        self._sampler = StackSampler(interval, self._call.__code__)
+
+    @property
+    def active(self):
+        return self.enabled or self.sample_rate > 0
+
+    def stats(self):
+        with self._lock:
+            stored = len(self._profiles)
+        return {'enabled': self.enabled, 'sample_rate': self.sample_rate, 'interval': self.interval,
+                'stored': stored}
+
+    # ---- stored profiles ----
+
+    def list_profiles(self):
+        with self._lock:
+            return [dict(info) for info, _ in reversed(self._profiles.values())]
+
+    def get(self, profile_id):
+        """(info, {format: data}) of a stored profile, or None"""
+        with self._lock:
+            entry = self._profiles.get(profile_id)
+        return (dict(entry[0]), entry[1]) if entry else None
+
+    def _store(self, info, outputs):
+        with self._lock:
+            info['id'] = str(next(self._ids))
+            info['formats'] = sorted(outputs)
+            self._profiles[info['id']] = (info, outputs)
+            while len(self._profiles) > self._keep:
+                self._profiles.popitem(last=False)
+        return info['id']
+
+    # ---- WSGI middleware ----
+
+    def _mode(self, environ):
+        if environ.get('PATH_INFO', '').startswith('/profiles'):
+            return None
+        requested = environ.get('HTTP_X_PROFILE', '').strip().lower()
+        if requested and self.enabled:
+            return 'cprofile' if requested in CPROFILE_VALUES else 'sample'
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def wrap(self, wsgi_app):
+        """WSGI app that profiles requests as configured before passing them on"""
+        def middleware(environ, start_response):
+            mode = self._mode(environ)
+            if mode is None:
+                return wsgi_app(environ, start_response)
+            return self._profile(mode, wsgi_app, environ, start_response)
+        return middleware
+
+    def _call(self, wsgi_app, environ, start_response):
+        return wsgi_app(environ, start_response)
+
+    def _profile(self, mode, wsgi_app, environ, start_response):
+        response = {}
+
+        def profiled_start_response(status, headers, exc_info=None):
+            # The id is not known until the app returns, so the headers are held until then
+            response['args'] = (status, list(headers), exc_info)
+            return lambda data: response.setdefault('written', []).append(data)
+
+        if mode == 'cprofile' and not self._cprofile_lock.acquire(blocking=False):
+            mode = 'sample'
+        started = time.time()
+        start = time.perf_counter()
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            try:
+                result = profiler.runcall(self._call, wsgi_app, environ, profiled_start_response)
+            finally:
+                self._cprofile_lock.release()
+            seconds = time.perf_counter() - start
+            profiler.create_stats()
+            # Same bytes as Profile.dump_stats() writes; taken first, as pstats.Stats() empties profiler.stats
+            outputs = {'pstats': marshal.dumps(profiler.stats)}
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(40)
+            outputs['text'] = report.getvalue()
+        else:
+            thread_id = threading.get_ident()
+            self._sampler.start(thread_id)
+            try:
+                result = self._call(wsgi_app, environ, profiled_start_response)
+            finally:
+                counts = self._sampler.stop(thread_id)
+            seconds = time.perf_counter() - start
+            collapsed = ''.join(f'{stack} {count}\n' for stack, count in counts.most_common() if stack)
+            outputs = {'collapsed': collapsed}
+
+        status, headers, exc_info = response['args']
+        info = {'method': environ.get('REQUEST_METHOD'), 'path': environ.get('PATH_INFO'),
+                'status': int(status.split()[0]), 'mode': mode, 'started': started,
+                'seconds': round(seconds, 4)}
+        if mode == 'sample':
+            info['samples'] = sum(counts.values())
+        profile_id = self._store(info, outputs)
+        print(f"Profiled {info['method']} {info['path']} ({mode}, {seconds:.3f}s) as profile {profile_id}")
+
+        write = start_response(status, headers + [('X-Profile-Id', profile_id)], exc_info)
+        for data in response.get('written', []):
+            write(data)
+        return result
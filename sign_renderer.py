@@ -0,0 +1,172 @@
+"""
+Region-based rendering of signs: a fixed background with a few text fields.
+
+A sign such as the safety tracker only ever changes in a handful of small
+areas (a day count, an incident number, a checkmark), yet rendering it as an
+image sends the whole background through resampling, enhancement and a
+full-frame dither every time. A PackedSign instead runs the bare background
+through the pipeline once and keeps the packed panel frame. Each render then
+redraws only the fields that changed since the last one: their rectangles are
+resampled, enhanced, dithered with a margin of background around them (so error
+diffusion has settled before it reaches the field and no seam shows) and the
+result is written back into the packed frame.
+
+Fields are given as {name: (text, font, (x, y), fill)} in background
+coordinates, where (x, y) is where ImageDraw.text() would draw them.
+"""
+
+import math
+import threading
+
+from PIL import Image, ImageDraw
+
+import frame_pipeline
+
+# Panel pixels of background dithered around each changed field but not written back
+FIELD_MARGIN = 16
+
+# Source pixels LANCZOS reads on each side of a sample, at scale 1
+LANCZOS_SUPPORT = 3
+
+
+def field_bbox(field):
+    """Bounding box (left, top, right, bottom) a field covers on the background"""
+    text, font, (x, y), fill = field
+    left, top, right, bottom = font.getbbox(text)
+    return (x + left, y + top, x + right, y + bottom)
+
+
+def draw_fields(img, fields, offset=(0, 0)):
+    """Draw fields onto img, whose top left corner is at offset on the background"""
+    draw = ImageDraw.Draw(img)
+    for text, font, (x, y), fill in fields.values():
+        draw.text((x - offset[0], y - offset[1]), text, font=font, fill=fill)
+    return img
+
+
+def rotate_box(box, size, angle):
+    """Where box lands when an image of size is rotated counter-clockwise by angle degrees"""
+    left, top, right, bottom = box
+    width, height = size
+    if angle == 90:
+        return (top, width - right, bottom, width - left)
+    if angle == 180:
+        return (width - right, height - bottom, width - left, height - top)
+    if angle == 270:
+        return (height - bottom, left, height - top, right)
+    return box
+
+
+def union_box(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def intersects(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class PackedSign:
+    """Packed panel frame of a background, with fields redrawn region by region"""
+
+    def __init__(self, background, width, height, orientation=0, brightness=1.0, contrast=1.4,
+                 saturation=1.5, rotate_180=False, margin=FIELD_MARGIN):
+        if background.mode != 'RGB':
+            background = background.convert('RGB')
+        self.background = background
+        self.width = width
+        self.height = height
+        self.margin = margin
+        self._enhancement = (brightness, contrast, saturation)
+        self._lock = threading.Lock()
+
+        # The same single resample and turns as the image pipeline, folded into one rotation
+        canvas = (height, width) if orientation in (90, 270) else (width, height)
+        rotate, self._box, self._size = frame_pipeline.plan_geometry(background.width, background.height,
+                                                                     *canvas)
+        self._angle = (90 * rotate + 180 * rotate_180 + orientation) % 360
+        self._scale = self._size[0] / (self._box[2] - self._box[0])
+
+        img = self._rotate(self._resample((0, 0) + self._size, background, (0, 0)))
+        self._mean = frame_pipeline.contrast_mean(img, brightness)
+        self._background_frame = frame_pipeline.pack_codes(self._enhance(img))
+        self._frame = bytearray(self._background_frame)
+        self._fields = {}
+        self._bboxes = {}
+
+    def _rotate(self, img):
+        if self._angle:
+            img = img.transpose(frame_pipeline.ORIENTATION_TRANSPOSE[self._angle])
+        return img
+
+    def _enhance(self, img):
+        brightness, contrast, saturation = self._enhancement
+        return frame_pipeline.enhance(img, brightness, contrast, saturation, mean=self._mean)
+
+    def _source_box(self, box):
+        """Background coordinates of a box in the resampled, unrotated frame"""
+        left, top = self._box[0], self._box[1]
+        return tuple(value / self._scale + offset
+                     for value, offset in zip(box, (left, top, left, top)))
+
+    def _resample(self, box, source, origin):
+        """Resample a box of the unrotated frame from source, whose corner is at origin on the background"""
+        left, top, right, bottom = self._source_box(box)
+        return source.resize((box[2] - box[0], box[3] - box[1]), Image.Resampling.LANCZOS,
+                             box=(left - origin[0], top - origin[1], right - origin[0], bottom - origin[1]))
+
+    def _panel_box(self, bbox):
+        """Panel-frame box covering every pixel a background box can affect, with even x bounds"""
+        pad = math.ceil(LANCZOS_SUPPORT * max(self._scale, 1)) + 1
+        left, top = self._box[0], self._box[1]
+        box = (max(math.floor((bbox[0] - left) * self._scale) - pad, 0),
+               max(math.floor((bbox[1] - top) * self._scale) - pad, 0),
+               min(math.ceil((bbox[2] - left) * self._scale) + pad, self._size[0]),
+               min(math.ceil((bbox[3] - top) * self._scale) + pad, self._size[1]))
+        box = rotate_box(box, self._size, self._angle)
+        return (box[0] - box[0] % 2, box[1], min(box[2] + box[2] % 2, self.width), box[3])
+
+    def _redraw(self, core, fields):
+        """Re-render one panel box of the frame from the background and the current fields"""
+        if core[0] >= core[2] or core[1] >= core[3]:
+            # The field lies outside the part of the background the panel shows
+            return
+        margin = self.margin + self.margin % 2
+        work = (max(core[0] - margin, 0), max(core[1] - margin, 0),
+                min(core[2] + margin, self.width), min(core[3] + margin, self.height))
+        rotated_size = (self._size[1], self._size[0]) if self._angle in (90, 270) else self._size
+        box = rotate_box(work, rotated_size, (360 - self._angle) % 360)
+
+        # Draw onto just the part of the background this box resamples from
+        left, top, right, bottom = self._source_box(box)
+        reach = math.ceil(LANCZOS_SUPPORT / min(self._scale, 1)) + 1
+        crop = (max(math.floor(left) - reach, 0), max(math.floor(top) - reach, 0),
+                min(math.ceil(right) + reach, self.background.width),
+                min(math.ceil(bottom) + reach, self.background.height))
+        nearby = {name: field for name, field in fields.items() if intersects(field_bbox(field), crop)}
+        source = draw_fields(self.background.crop(crop), nearby, crop[:2])
+
+        region = frame_pipeline.pack_codes(self._enhance(self._rotate(self._resample(box, source, crop[:2]))))
+
+        # Copy the core rows of the packed region into the frame; the margin is discarded
+        region_row = (work[2] - work[0]) // 2
+        core_row = (core[2] - core[0]) // 2
+        skip = (core[0] - work[0]) // 2
+        for y in range(core[1], core[3]):
+            start = (y - work[1]) * region_row + skip
+            offset = (y * self.width + core[0]) // 2
+            self._frame[offset:offset + core_row] = region[start:start + core_row]
+
+    def render(self, fields):
+        """Return the packed frame showing fields, redrawing only those that changed"""
+        with self._lock:
+            for name in set(self._fields) | set(fields):
+                if self._fields.get(name) == fields.get(name):
+                    continue
+                old = self._bboxes.pop(name, None)
+                if name in fields:
+                    self._bboxes[name] = self._panel_box(field_bbox(fields[name]))
+                # One box covers both where the field was and where it is now
+                core = union_box(old, self._bboxes[name]) if old and name in fields else old or self._bboxes[name]
+                self._redraw(core, fields)
+            self._fields = dict(fields)
+            return bytes(self._frame)
@@ -0,0 +1,284 @@
+"""
+Declarative sign templates.
+
+A sign is a background image with text drawn over it from a dict of data, such
+as the safety tracker's day count. Each sign is described by a JSON template
+instead of a drawing function:
+
+    {
+      "background": "safety_background.png",
+      "params": {"brightness": 1.0, "contrast": 1.4, "saturation": 1.5, "rotate_180": true},
+      "fields": [
+        {"name": "days", "text": "{days_since}", "size": 400, "x": 0, "x_from": "center",
+         "y": 160, "anchor": "center", "fill": "black"},
+        {"name": "check_change", "text": "✓", "size": 80, "x": 940, "y": 575,
+         "fill": "blue", "when": {"reason": "Change"}}
+      ]
+    }
+
+"text" is a str.format() pattern over the data; (x, y) is where the text is
+drawn, with x its left edge, center or right edge depending on "anchor"; x is
+measured from the background's left edge, or from its center or right edge
+if "x_from" is "center" or "right", so a field stays centered on a background
+of any width; a field with "when" is only drawn if every listed data value
+matches; "font" is an optional TrueType path. Backgrounds are looked up in the
+configured background directories.
+
+Templates are compiled once into a SignPlan, with fonts loaded and the
+geometry of fields that do not depend on the data measured up front, and
+recompiled when their file changes. Packed panel frames are rendered through
+sign_renderer.PackedSign, one per template and panel profile, so rendering the
+same template for many data sets (one sign per team) only redraws the fields
+that differ.
+"""
+
+import functools
+import json
+import os
+import string
+import threading
+
+from PIL import Image, ImageColor, ImageFont
+
+from sign_renderer import PackedSign, draw_fields
+
+TEMPLATE_NAME_CHARS = set(string.ascii_letters + string.digits + '_-')
+ANCHORS = ('left', 'center', 'right')
+X_ORIGINS = ('left', 'center', 'right')
+DEFAULT_PARAMS = {'brightness': 1.0, 'contrast': 1.4, 'saturation': 1.5, 'rotate_180': False}
+
+
+class SignError(ValueError):
+    """Raised for invalid templates or sign data"""
+
+
+class SignNotFound(SignError):
+    """Raised when a template name is unknown"""
+
+
+@functools.lru_cache(maxsize=None)
+def load_font(path, size):
+    """Load a TrueType font once per path and size"""
+    try:
+        return ImageFont.truetype(path, size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def placeholders(pattern):
+    """Data keys a str.format() pattern refers to"""
+    try:
+        keys = {name.split('.')[0].split('[')[0] for _, name, _, _ in string.Formatter().parse(pattern)
+                if name is not None}
+    except ValueError as e:
+        raise SignError(f"Invalid text pattern '{pattern}': {e}")
+    if '' in keys or any(key.isdigit() for key in keys):
+        raise SignError(f"Text pattern '{pattern}' must name its data, as in {{days_since}}")
+    return keys
+
+
+class CompiledField:
+    """One text field with its font loaded, and its geometry measured if the text is fixed"""
+
+    def __init__(self, spec, default_font, template_dir):
+        if not isinstance(spec, dict) or not spec.get('name'):
+            raise SignError('Every field needs a name')
+        self.name = spec['name']
+        try:
+            self.pattern = str(spec['text'])
+            size = int(spec['size'])
+            self.x, self.y = int(spec['x']), int(spec['y'])
+        except KeyError as e:
+            raise SignError(f"Field '{self.name}' needs {e}")
+        except (TypeError, ValueError):
+            raise SignError(f"Field '{self.name}' size, x and y must be integers")
+
+        self.anchor = spec.get('anchor', 'left')
+        if self.anchor not in ANCHORS:
+            raise SignError(f"Field '{self.name}' anchor must be one of {ANCHORS}")
+        self.x_from = spec.get('x_from', 'left')
+        if self.x_from not in X_ORIGINS:
+            raise SignError(f"Field '{self.name}' x_from must be one of {X_ORIGINS}")
+        fill = spec.get('fill', 'black')
+        self.fill = tuple(fill) if isinstance(fill, list) else fill
+        if isinstance(self.fill, str):
+            try:
+                ImageColor.getrgb(self.fill)
+            except ValueError:
+                raise SignError(f"Field '{self.name}' has an invalid fill '{fill}'")
+        self.when = spec.get('when', {})
+        if not isinstance(self.when, dict):
+            raise SignError(f"Field '{self.name}' when must be an object")
+
+        font_path = spec.get('font', default_font)
+        self.font = load_font(os.path.join(template_dir, font_path), size)
+        self.keys = placeholders(self.pattern)
+        # Fixed text is measured once, at compile time
+        self.static = self._measure(self.pattern) if not self.keys else None
+
+    def _measure(self, text):
+        left, top, right, bottom = self.font.getbbox(text)
+        return text, right - left
+
+    def _layout(self, text, text_width, background_width):
+        origin = {'left': 0, 'center': background_width // 2, 'right': background_width}[self.x_from]
+        x = origin + self.x - {'left': 0, 'center': text_width // 2, 'right': text_width}[self.anchor]
+        return (text, self.font, (x, self.y), self.fill)
+
+    def render(self, data, background_width):
+        """The field as (text, font, (x, y), fill) for this data, or None if it is not shown"""
+        if any(str(data.get(key)) != str(value) for key, value in self.when.items()):
+            return None
+        if self.static is not None:
+            return self._layout(*self.static, background_width)
+        try:
+            return self._layout(*self._measure(self.pattern.format_map(data)), background_width)
+        except KeyError as e:
+            raise SignError(f"Field '{self.name}' needs data {e}")
+        except (IndexError, AttributeError, ValueError) as e:
+            raise SignError(f"Field '{self.name}' cannot show its data: {e}")
+
+
+class SignPlan:
+    """A compiled template: background, enhancement settings and fields ready to render"""
+
+    def __init__(self, name, definition, default_font, template_dir='', version=None):
+        if not isinstance(definition, dict):
+            raise SignError('A template must be an object')
+        self.name = name
+        # Identifies the template file contents the plan was compiled from
+        self.version = version
+        self.background = definition.get('background')
+        if not self.background:
+            raise SignError(f"Template '{name}' needs a background")
+
+        params = definition.get('params', {})
+        unknown = set(params) - set(DEFAULT_PARAMS)
+        if unknown:
+            raise SignError(f"Unknown params {sorted(unknown)}")
+        try:
+            self.params = {key: type(default)(params.get(key, default)) for key, default in DEFAULT_PARAMS.items()}
+        except (TypeError, ValueError):
+            raise SignError('Params must be numbers, and rotate_180 a boolean')
+
+        fields = definition.get('fields')
+        if not isinstance(fields, list) or not fields:
+            raise SignError(f"Template '{name}' needs at least one field")
+        self.fields = [CompiledField(spec, default_font, template_dir) for spec in fields]
+        names = [field.name for field in self.fields]
+        if len(set(names)) != len(names):
+            raise SignError(f"Template '{name}' has duplicate field names")
+        self.keys = sorted(set().union(*(field.keys | set(field.when) for field in self.fields)))
+
+    def render_fields(self, data, background_width):
+        """Fields shown for this data on a background this wide, as {name: (text, font, (x, y), fill)}"""
+        fields = {}
+        for field in self.fields:
+            rendered = field.render(data, background_width)
+            if rendered is not None:
+                fields[field.name] = rendered
+        return fields
+
+    def describe(self):
+        return {'name': self.name, 'background': self.background, 'params': self.params,
+                'fields': [field.name for field in self.fields], 'data': self.keys}
+
+
+class SignTemplates:
+    """Templates found in a list of directories, compiled on first use and on change"""
+
+    def __init__(self, template_dirs, background_dirs, default_font):
+        # Earlier directories override later ones, so a user template replaces a bundled one
+        self.template_dirs = template_dirs
+        self.background_dirs = background_dirs
+        self.default_font = default_font
+        self._plans = {}
+        self._backgrounds = {}
+        self._signs = {}
+        self._lock = threading.Lock()
+
+    def _template_path(self, name):
+        if not name or not set(name) <= TEMPLATE_NAME_CHARS:
+            raise SignNotFound(f"Unknown sign template '{name}'")
+        for directory in self.template_dirs:
+            path = os.path.join(directory, name + '.json')
+            if os.path.exists(path):
+                return path
+        raise SignNotFound(f"Unknown sign template '{name}'")
+
+    def names(self):
+        names = set()
+        for directory in self.template_dirs:
+            if os.path.isdir(directory):
+                names.update(filename[:-len('.json')] for filename in os.listdir(directory)
+                             if filename.endswith('.json'))
+        return sorted(names)
+
+    def get(self, name):
+        """Compiled plan for a template, recompiled if its file changed"""
+        path = self._template_path(name)
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            plan = self._plans.get(name)
+        if plan is not None and plan.version == (path, mtime):
+            return plan
+
+        try:
+            with open(path, 'r') as f:
+                definition = json.load(f)
+        except ValueError as e:
+            raise SignError(f"Template '{name}' is not valid JSON: {e}")
+        plan = SignPlan(name, definition, self.default_font, os.path.dirname(path), (path, mtime))
+        with self._lock:
+            self._plans[name] = plan
+        return plan
+
+    def background_path(self, plan):
+        for directory in self.background_dirs:
+            path = os.path.join(directory, plan.background)
+            if os.path.exists(path):
+                return path
+        raise FileNotFoundError(f"Background '{plan.background}' for sign '{plan.name}' not found in "
+                                f"{', '.join(self.background_dirs)}")
+
+    def _background(self, path):
+        """(mtime, image) of a background, decoded once per file version; callers must not modify it"""
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            cached = self._backgrounds.get(path)
+        if cached is None or cached[0] != mtime:
+            img = Image.open(path)
+            img = img.convert('RGB') if img.mode != 'RGB' else img
+            img.load()
+            cached = (mtime, img)
+            with self._lock:
+                self._backgrounds[path] = cached
+        return cached
+
+    def prepare(self, name):
+        """Compile a template and decode its background ahead of the first render"""
+        plan = self.get(name)
+        self._background(self.background_path(plan))
+        return plan
+
+    def draw(self, name, data):
+        """Full-resolution RGB image of a sign, as a person sees it"""
+        plan = self.get(name)
+        img = self._background(self.background_path(plan))[1].copy()
+        return draw_fields(img, plan.render_fields(data, img.width))
+
+    def frame(self, name, data, profile):
+        """Packed frame of a sign for a panel profile, redrawing only what changed since the last one"""
+        plan = self.get(name)
+        path = self.background_path(plan)
+        mtime, background = self._background(path)
+        key = (name, profile['width'], profile['height'], profile['orientation'])
+        version = (plan.version, path, mtime)
+        with self._lock:
+            cached = self._signs.get(key)
+        if cached is None or cached[0] != version:
+            sign = PackedSign(background, *key[1:], **plan.params)
+            cached = (version, sign)
+            with self._lock:
+                self._signs[key] = cached
+        return cached[1].render(plan.render_fields(data, background.width))
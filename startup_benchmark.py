@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Measure cold start to first frame for one of the display apps.
+
+Spawns the app as a fresh process, polls /health until it is ready, uploads a
+test image and reports how long each startup phase took, both as seen from
+outside (wall clock since spawn) and as recorded by the app itself.
+
+Run it on the target device (e.g. a Pi Zero) to get representative numbers:
+    python3 startup_benchmark.py app_waveshare.py --runs 5
+    python3 startup_benchmark.py 13in.py --driver emulator --no-warmup
+"""
+
+import argparse
+import io
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+from PIL import Image
+
+
+def make_upload_image():
+    buf = io.BytesIO()
+    Image.linear_gradient('L').resize((1600, 1200)).convert('RGB').save(buf, 'JPEG', quality=90)
+    return buf.getvalue()
+
+
+def wait_until_ready(url, process, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'App exited with status {process.returncode} before becoming ready')
+        try:
+            if requests.get(f'{url}/health', timeout=1).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.02)
+    raise RuntimeError(f'App not ready after {timeout}s')
+
+
+def run_once(app_path, port, env, image, timeout):
+    url = f'http://127.0.0.1:{port}'
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, app_path], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(url, process, timeout)
+        ready = time.perf_counter() - start
+
+        response = requests.post(f'{url}/upload', files={'file': ('startup_benchmark.jpg', image)},
+                                 timeout=timeout)
+        first_frame = time.perf_counter() - start
+        if response.status_code != 200:
+            raise RuntimeError(f'Upload failed: {response.status_code} {response.text[:200]}')
+
+        internal = requests.get(f'{url}/health', timeout=5).json()['startup']
+        return {'ready': ready, 'first_frame': first_frame, 'internal': internal}
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold start to first frame')
+    parser.add_argument('app', nargs='?', default='app_waveshare.py')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--driver', default=os.environ.get('EINK_EPD_DRIVER', 'emulator'),
+                        help='display driver for the spawned app (waveshare or emulator)')
+    parser.add_argument('--no-warmup', action='store_true', help='disable the warm-up phase')
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    env = dict(os.environ, EINK_PORT=str(args.port), EINK_EPD_DRIVER=args.driver,
+               EINK_WARMUP='0' if args.no_warmup else '1')
+    env.setdefault('EINK_EMULATOR_TIME_SCALE', '0')
+    image = make_upload_image()
+
+    results = []
+    for run in range(1, args.runs + 1):
+        result = run_once(args.app, args.port, env, image, args.timeout)
+        internal = result['internal']
+        print(f"run {run}: ready {result['ready']:.2f}s, first frame {result['first_frame']:.2f}s "
+              f"(imports {internal.get('imports', 0):.2f}s, warm-up {internal.get('warmup', 0):.2f}s, "
+              f"in-process first frame {internal.get('first_frame', 0):.2f}s)")
+        results.append(result)
+
+    print()
+    for key in ('ready', 'first_frame'):
+        values = [result[key] for result in results]
+        print(f"{key:<12} median {statistics.median(values):.2f}s  min {min(values):.2f}s  max {max(values):.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""
+Images fetched from URLs on a schedule: dashboards exported as PNG by a local
+service, camera snapshots, weather maps.
+
+A source is a URL, a poll interval, the panel it is shown on ('local', a
+registered device or address, or 'pull:<device>') and enhancement settings.
+A single scheduler thread hands due polls to a small thread pool, and every
+poll goes through one pooled HTTP session. A poll is a conditional GET with
+the ETag and Last-Modified of the last response, so an unchanged resource
+costs a 304. A 200 is streamed to disk while it is hashed; only if the
+content hash differs from the last one does the download replace the source
+image and the app's on_change(name, path, source) callback render it and
+refresh the panel. A server that ignores conditional requests still only
+costs the download. A download that PIL does not recognize as one of the
+gallery's image formats is discarded and recorded as an error, and the format
+PIL detected, never the upstream Content-Type, decides how it is served.
+
+Sources persist with their validators and content hash in a JSON state file:
+    {'sources': {name: {url, interval, panel, params, etag, last_modified, sha256, format, ...}}}
+"""
+
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from PIL import Image
+
+SOURCE_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+SOURCE_PARAMS = {'brightness': 1.0, 'contrast': 1.4, 'saturation': 1.5, 'rotate_180': False}
+CHUNK_SIZE = 64 * 1024
+# Image formats a source may deliver, with the mimetype each is served as
+IMAGE_FORMATS = {'PNG': 'image/png', 'JPEG': 'image/jpeg', 'GIF': 'image/gif', 'BMP': 'image/bmp'}
+
+# Fields that describe the last poll rather than the source itself
+STATE_FIELDS = ('etag', 'last_modified', 'sha256', 'format', 'checked', 'changed', 'status', 'last_error',
+                'next_poll')
+
+
+class UrlSourceError(ValueError):
+    """Raised for invalid source definitions"""
+
+
+class UrlSourceNotFound(UrlSourceError):
+    """Raised when a source name is unknown"""
+
+
+def validate_source(data, min_interval):
+    """Check and normalize a source definition"""
+    if not isinstance(data, dict):
+        raise UrlSourceError('A source must be an object')
+
+    url = str(data.get('url', '')).strip()
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+        raise UrlSourceError('A source needs an http:// or https:// url')
+    try:
+        interval = float(data.get('interval', min_interval))
+    except (TypeError, ValueError):
+        raise UrlSourceError('Interval must be a number of seconds')
+    if interval < min_interval:
+        raise UrlSourceError(f'Interval must be at least {min_interval} seconds')
+    panel = str(data.get('panel', 'local')).strip()
+    if not panel:
+        raise UrlSourceError('A source needs a panel')
+
+    try:
+        params = {key: type(default)(data.get(key, default)) for key, default in SOURCE_PARAMS.items()
+                  if key != 'rotate_180'}
+    except (TypeError, ValueError):
+        raise UrlSourceError('Brightness, contrast and saturation must be numbers')
+    rotate_180 = data.get('rotate_180', False)
+    params['rotate_180'] = rotate_180 if isinstance(rotate_180, bool) else str(rotate_180).lower() == 'true'
+    return {'url': url, 'interval': interval, 'panel': panel, 'params': params}
+
+
+class UrlSources:
+    """Polls URL sources and reports content changes to the app"""
+
+    def __init__(self, state_file, image_dir, on_change, min_interval=30, max_bytes=16 * 1024 * 1024,
+                 timeout=(5, 30), max_workers=4):
+        self.state_file = state_file
+        self.image_dir = image_dir
+        self.min_interval = min_interval
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._on_change = on_change
+        self._sources = {}
+        self._busy = set()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+        self._session = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='url-source')
+        self._max_workers = max_workers
+        self._load()
+
+    # ---- persistence ----
+
+    def _load(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'r') as f:
+                self._sources = json.load(f).get('sources', {})
+        except (OSError, ValueError) as e:
+            print(f"Could not load URL sources from {self.state_file}: {e}")
+
+    def _save(self):
+        temp_path = self.state_file + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'sources': self._sources}, f, indent=2)
+        os.replace(temp_path, self.state_file)
+
+    # ---- source management ----
+
+    def image_path(self, name):
+        """Where the last fetched image of a source is kept"""
+        return os.path.join(self.image_dir, f'{name}.img')
+
+    def list_sources(self):
+        with self._cond:
+            return [dict(copy.deepcopy(source), name=name) for name, source in sorted(self._sources.items())]
+
+    def get(self, name):
+        with self._cond:
+            if name not in self._sources:
+                raise UrlSourceNotFound(f"Unknown source '{name}'")
+            return dict(copy.deepcopy(self._sources[name]), name=name)
+
+    def save_source(self, name, data):
+        """Create or replace a source and poll it right away"""
+        if not SOURCE_NAME.match(name or ''):
+            raise UrlSourceError('Source names may only use letters, digits, - and _')
+        source = validate_source(data, self.min_interval)
+        with self._cond:
+            existing = self._sources.get(name, {})
+            if any(existing.get(key) != source[key] for key in ('url', 'panel', 'params')):
+                # Anything that changes the picture means the panel needs a fresh render
+                existing = {}
+            source.update({key: existing[key] for key in STATE_FIELDS if key in existing})
+            source['next_poll'] = 0
+            self._sources[name] = source
+            self._save()
+            self._cond.notify_all()
+        return self.get(name)
+
+    def delete(self, name):
+        with self._cond:
+            if self._sources.pop(name, None) is None:
+                raise UrlSourceNotFound(f"Unknown source '{name}'")
+            self._save()
+        if os.path.exists(self.image_path(name)):
+            os.remove(self.image_path(name))
+
+    # ---- polling ----
+
+    def _get_session(self):
+        with self._cond:
+            if self._session is None:
+                # Imported lazily to keep process startup fast
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self._max_workers, pool_maxsize=self._max_workers)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def _download(self, response, path):
+        """Stream a response body to path and return its sha256"""
+        length = response.headers.get('Content-Length')
+        if length and int(length) > self.max_bytes:
+            raise UrlSourceError(f'Image is {length} bytes, limit is {self.max_bytes}')
+        digest = hashlib.sha256()
+        size = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise UrlSourceError(f'Image is larger than {self.max_bytes} bytes')
+                digest.update(chunk)
+                f.write(chunk)
+        return digest.hexdigest()
+
+    def _check_image(self, path):
+        """Return the PIL format of a downloaded image, or raise UrlSourceError"""
+        try:
+            with Image.open(path) as img:
+                image_format = img.format
+                img.verify()
+        except Exception as e:
+            raise UrlSourceError(f'Response is not a readable image ({e.__class__.__name__})')
+        if image_format not in IMAGE_FORMATS:
+            raise UrlSourceError(f'Response is a {image_format} image, expected one of {", ".join(IMAGE_FORMATS)}')
+        return image_format
+
+    def poll(self, name):
+        """Fetch a source now, waiting for a scheduled poll of it to finish first; returns the outcome"""
+        with self._cond:
+            while name in self._busy:
+                self._cond.wait()
+            self._busy.add(name)
+        try:
+            return self._poll(name)
+        finally:
+            with self._cond:
+                self._busy.discard(name)
+                self._cond.notify_all()
+
+    def _poll(self, name):
+        """Fetch a source and show it if its content changed (call with the source marked busy)"""
+        source = self.get(name)
+        path = self.image_path(name)
+        headers = {}
+        if os.path.exists(path):
+            if source.get('etag'):
+                headers['If-None-Match'] = source['etag']
+            if source.get('last_modified'):
+                headers['If-Modified-Since'] = source['last_modified']
+
+        temp_path = f'{path}.download'
+        update = {'checked': time.time(), 'last_error': None}
+        try:
+            with self._get_session().get(source['url'], headers=headers, stream=True,
+                                         timeout=self.timeout) as response:
+                if response.status_code == 304:
+                    update['status'] = 'not_modified'
+                else:
+                    response.raise_for_status()
+                    digest = self._download(response, temp_path)
+                    validators = {'etag': response.headers.get('ETag'),
+                                  'last_modified': response.headers.get('Last-Modified')}
+                    if digest == source.get('sha256') and os.path.exists(path):
+                        os.remove(temp_path)
+                        update.update(validators, status='unchanged')
+                    else:
+                        image_format = self._check_image(temp_path)
+                        os.replace(temp_path, path)
+                        try:
+                            self._on_change(name, path, source)
+                        except Exception:
+                            # The new image is on disk but not on the panel: describe the file as it
+                            # now is and forget the validators, so the next poll fetches and renders it again
+                            update.update(etag=None, last_modified=None, sha256=None, format=image_format)
+                            raise
+                        update.update(validators, sha256=digest, changed=update['checked'], status='changed',
+                                      format=image_format)
+        except Exception as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            update.update(status='error', last_error=str(e) or e.__class__.__name__)
+            print(f"URL source {name} failed: {update['last_error']}")
+
+        with self._cond:
+            current = self._sources.get(name)
+            if current is not None and current['url'] == source['url']:
+                changed = any(current.get(key) != value for key, value in update.items() if key != 'checked')
+                current.update(update)
+                current['next_poll'] = update['checked'] + current['interval']
+                if changed:
+                    self._save()
+        return update
+
+    def _poll_quietly(self, name):
+        try:
+            self._poll(name)
+        except UrlSourceNotFound:
+            pass
+        finally:
+            with self._cond:
+                self._busy.discard(name)
+                self._cond.notify_all()
+
+    def start(self):
+        """Start polling every source on its interval"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='url-sources', daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=False)
+
+    def _run(self):
+        with self._cond:
+            while not self._stopping:
+                now = time.time()
+                next_wake = None
+                for name, source in self._sources.items():
+                    if name in self._busy:
+                        continue
+                    due = source.get('next_poll', 0)
+                    if due <= now:
+                        self._busy.add(name)
+                        try:
+                            self._executor.submit(self._poll_quietly, name)
+                        except RuntimeError:
+                            # Interpreter is shutting down
+                            return
+                    elif next_wake is None or due < next_wake:
+                        next_wake = due
+                self._cond.wait(None if next_wake is None else max(next_wake - now, 0))
@@ -0,0 +1,214 @@
+"""
+Video walls: several remote displays mounted as one large canvas.
+
+A wall is a grid of registered devices, given row by row (null for an empty
+slot), and a bezel: the pixels of picture hidden behind the frames between
+two neighbouring panels, horizontally and vertically. Each device keeps its
+own panel profile from the device registry; a panel mounted at 90 or 270
+degrees takes a tile of its rotated size. All tiles in a column must be
+equally wide and all tiles in a row equally tall.
+
+A source image is decoded and resized once to the whole canvas, enhanced
+around one contrast mean so the tiles match, then cut into one tile per
+device, each turned to its panel's orientation and dithered and packed in
+parallel. Tiles are only pushed once all of them are packed, and the sends
+are released together, so the panels start refreshing at the same time.
+
+Walls persist in a JSON state file:
+    {'walls': {name: {'rows': [[device or null, ...], ...], 'bezel': [x, y]}}}
+"""
+
+import copy
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+import frame_pipeline
+
+WALL_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class WallError(ValueError):
+    """Raised for invalid wall definitions"""
+
+
+class WallNotFound(WallError):
+    """Raised when a wall name is unknown"""
+
+
+def wall_devices(wall):
+    """Device names of a wall, row by row"""
+    return [name for row in wall['rows'] for name in row if name is not None]
+
+
+def validate_wall(data):
+    """Check and normalize a wall definition"""
+    if not isinstance(data, dict):
+        raise WallError('A wall must be an object')
+
+    rows = data.get('rows')
+    if not isinstance(rows, list) or not rows or not all(isinstance(row, list) and row for row in rows):
+        raise WallError('A wall needs rows: a list of lists of device names')
+    if len({len(row) for row in rows}) != 1:
+        raise WallError('Every row must have the same number of slots')
+    for row in rows:
+        for name in row:
+            if name is not None and not isinstance(name, str):
+                raise WallError('Slots must be device names or null')
+
+    wall = {'rows': [list(row) for row in rows]}
+    names = wall_devices(wall)
+    if not names:
+        raise WallError('A wall needs at least one device')
+    if len(set(names)) != len(names):
+        raise WallError('A device can only appear once on a wall')
+
+    bezel = data.get('bezel', 0)
+    if not isinstance(bezel, list):
+        bezel = [bezel, bezel]
+    try:
+        bezel = [int(value) for value in bezel]
+    except (TypeError, ValueError):
+        raise WallError('Bezel must be a number of pixels or [x, y]')
+    if len(bezel) != 2 or min(bezel) < 0:
+        raise WallError('Bezel must be a non-negative number of pixels or [x, y]')
+    wall['bezel'] = bezel
+    return wall
+
+
+def tile_size(profile):
+    """Size of the part of the canvas a panel shows, once turned to its mounting"""
+    if profile['orientation'] in (90, 270):
+        return profile['height'], profile['width']
+    return profile['width'], profile['height']
+
+
+def _track_sizes(tracks, what):
+    """One size per column or row, which every device in it must share"""
+    sizes = []
+    for index, track in enumerate(tracks, 1):
+        found = {size for size in track if size is not None}
+        if not found:
+            raise WallError(f'{what} {index} has no devices')
+        if len(found) > 1:
+            raise WallError(f'{what} {index} mixes panel sizes {sorted(found)}')
+        sizes.append(found.pop())
+    return sizes
+
+
+def plan_wall(wall, profiles):
+    """Lay a wall's tiles out on its canvas.
+
+    profiles maps each device name to its panel profile (width, height,
+    orientation). Returns ((canvas width, canvas height), {name: (box, profile)})
+    with each box in canvas coordinates.
+    """
+    grid = [[tile_size(profiles[name]) if name is not None else None for name in row] for row in wall['rows']]
+    widths = _track_sizes([[size and size[0] for size in column] for column in zip(*grid)], 'Column')
+    heights = _track_sizes([[size and size[1] for size in row] for row in grid], 'Row')
+    bezel_x, bezel_y = wall['bezel']
+
+    tiles = {}
+    top = 0
+    for row, height in zip(wall['rows'], heights):
+        left = 0
+        for name, width in zip(row, widths):
+            if name is not None:
+                tiles[name] = ((left, top, left + width, top + height), profiles[name])
+            left += width + bezel_x
+        top += height + bezel_y
+    canvas = (sum(widths) + bezel_x * (len(widths) - 1), sum(heights) + bezel_y * (len(heights) - 1))
+    return canvas, tiles
+
+
+def render_tiles(image_path, canvas, tiles, max_source=None, brightness=1.0, contrast=1.4, saturation=1.5,
+                 rotate_180=False, base_cache=None):
+    """Decode and resize an image once for the whole canvas and return {name: packed frame}"""
+    img = frame_pipeline.base_frame(image_path, canvas[0], canvas[1], max_source, base_cache)
+    if rotate_180:
+        img = img.transpose(Image.Transpose.ROTATE_180)
+    # One mean for the whole picture, so contrast matches across tiles
+    mean = frame_pipeline.contrast_mean(img, brightness)
+
+    def pack(tile):
+        box, profile = tile
+        tile_img = frame_pipeline.enhance(img.crop(box), brightness, contrast, saturation, mean=mean)
+        if profile['orientation']:
+            tile_img = tile_img.transpose(frame_pipeline.ORIENTATION_TRANSPOSE[profile['orientation']])
+        return frame_pipeline.pack_codes(tile_img)
+
+    # Pillow releases the GIL while dithering, so tiles pack on all cores
+    with ThreadPoolExecutor(max_workers=len(tiles), thread_name_prefix='wall-tile') as pool:
+        return dict(zip(tiles, pool.map(pack, tiles.values())))
+
+
+def push_tiles(frames, send):
+    """Call send(name, frame) for every tile at once and return {name: result or exception}"""
+    # No send starts until every sender thread is ready, so the panels refresh together
+    ready = threading.Barrier(len(frames))
+
+    def push(item):
+        name, frame = item
+        ready.wait()
+        try:
+            return send(name, frame)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=len(frames), thread_name_prefix='wall-send') as pool:
+        return dict(zip(frames, pool.map(push, frames.items())))
+
+
+class WallRegistry:
+    """Wall layouts, kept in a JSON state file"""
+
+    def __init__(self, state_file):
+        self.state_file = state_file
+        self._walls = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'r') as f:
+                self._walls = json.load(f).get('walls', {})
+        except (OSError, ValueError) as e:
+            print(f"Could not load walls from {self.state_file}: {e}")
+
+    def _save(self):
+        temp_path = self.state_file + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'walls': self._walls}, f, indent=2)
+        os.replace(temp_path, self.state_file)
+
+    def list_walls(self):
+        with self._lock:
+            return [dict(copy.deepcopy(wall), name=name) for name, wall in sorted(self._walls.items())]
+
+    def get(self, name):
+        with self._lock:
+            if name not in self._walls:
+                raise WallNotFound(f"Unknown wall '{name}'")
+            return dict(copy.deepcopy(self._walls[name]), name=name)
+
+    def save_wall(self, name, data):
+        """Create or replace a wall"""
+        if not WALL_NAME.match(name or ''):
+            raise WallError('Wall names may only use letters, digits, - and _')
+        wall = validate_wall(data)
+        with self._lock:
+            self._walls[name] = wall
+            self._save()
+        return self.get(name)
+
+    def delete(self, name):
+        with self._lock:
+            if self._walls.pop(name, None) is None:
+                raise WallNotFound(f"Unknown wall '{name}'")
+            self._save()